@@ -1,40 +1,22 @@
+import os
+import uuid
 import uvicorn
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from controllers.user_controller import user_routes
-from controllers.game_controller import game_routes
-from controllers.review_controller import review_routes
-from controllers.wishlist_controller import wishlist_routes
-from controllers.library_controller import library_routes
-from db.database import db
-import asyncio
-from services.init_service import load_users, load_games, load_reviews, load_wishlists
+from decouple import config
 
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["*"],
-)
-
-app.include_router(user_routes)
-app.include_router(game_routes)
-app.include_router(review_routes)
-app.include_router(wishlist_routes)
-app.include_router(library_routes)
-
-
-@app.on_event("startup")
-async def load_initial_data():
-    await db.init_database()
-    await asyncio.gather(load_users(), load_games(), load_reviews())
-
-    # Esta última después de que se creen las demás porque requiere tanto de juegos como de users.
-    await load_wishlists()
+HOST = config("HOST", default="127.0.0.1")
+PORT = config("PORT", default=80, cast=int)
+# Número de procesos que atienden peticiones. Por defecto, uno por núcleo.
+WEB_WORKERS = config("WEB_WORKERS", default=os.cpu_count() or 1, cast=int)
+# Segundos que se espera a que terminen las peticiones en curso al apagar el servidor.
+GRACEFUL_SHUTDOWN_SECONDS = config("GRACEFUL_SHUTDOWN_SECONDS", default=30, cast=int)
 
 
 if __name__ == '__main__':
-    uvicorn.run(app, host="127.0.0.1", port=80)
+    # Los workers heredan las variables de entorno, así que todos comparten el ID del despliegue (y eligen un único
+    # líder) y, si hay más de uno, guardan el estado compartido en Mongo en lugar de en la memoria de cada proceso.
+    os.environ.setdefault("DEPLOYMENT_ID", uuid.uuid4().hex)
+    if WEB_WORKERS > 1:
+        os.environ.setdefault("SHARED_STATE_BACKEND", "mongo")
+
+    uvicorn.run("app:app", host=HOST, port=PORT, workers=WEB_WORKERS,
+                timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS)
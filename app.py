@@ -0,0 +1,120 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from controllers.user_controller import user_routes
+from controllers.game_controller import game_routes
+from controllers.review_controller import review_routes
+from controllers.wishlist_controller import wishlist_routes
+from controllers.library_controller import library_routes
+from controllers.purchase_controller import purchase_routes
+from controllers.metrics_controller import metrics_routes
+from controllers.health_controller import health_routes
+from controllers.job_controller import job_routes
+from controllers.event_controller import event_routes
+from middleware.compression_middleware import CompressionMiddleware
+from middleware.metrics_middleware import MetricsMiddleware
+from decouple import config
+import asyncio
+import logging
+from db.invalidation_bus import invalidation_bus
+from services.catalogue_service import CatalogueService
+from services.deployment_service import DeploymentService
+from services.event_service import event_bus
+from services.game_service import GameService
+from services.job_service import JobService
+from services.sales_service import SalesService
+from services.purchase_service import download_queue
+from services.init_service import prepare_database
+from services.revocation_service import revocation_list
+from services.version_service import resource_versions
+from services.container import container, Lazy
+
+# Nivel mínimo de los mensajes que se escriben de los loggers de la aplicación ("vgameshop.*").
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+
+logger = logging.getLogger("vgameshop")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+logger.setLevel(LOG_LEVEL.upper())
+
+app = FastAPI()
+sales_service = Lazy(SalesService)
+deployment_service = Lazy(DeploymentService)
+job_service = Lazy(JobService)
+background_tasks = []
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["*"],
+)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(user_routes)
+app.include_router(game_routes)
+app.include_router(review_routes)
+app.include_router(wishlist_routes)
+app.include_router(library_routes)
+app.include_router(purchase_routes)
+app.include_router(metrics_routes)
+app.include_router(health_routes)
+app.include_router(job_routes)
+app.include_router(event_routes)
+
+
+async def prepare_deployment():
+    """
+    Función que ejecuta el líder antes de que arranquen los demás workers: genera la base de datos y guarda el
+    catálogo en el archivo que cargan los demás.
+    """
+    await prepare_database()
+    await container.get(CatalogueService).prepare()
+
+
+@app.on_event("startup")
+async def load_initial_data():
+    # Solo el líder del despliegue borra y vuelve a generar la base de datos; el resto de workers esperan a que
+    # termine, para no borrar los datos que ya han cargado los demás.
+    await deployment_service.start(prepare_deployment)
+
+    # La consolidación de ventas no se puede ejecutar a la vez en varios workers, así que solo la hace el líder. El
+    # líder puede cambiar, así que la tarea está en todos los workers, y cada vez mira si el suyo es el líder.
+    background_tasks.append(asyncio.create_task(sales_service.run_rollup_periodically()))
+    download_queue.start()
+
+    # Todos los workers ejecutan las tareas en segundo plano; la base de datos reparte cada una a un solo worker.
+    container.get(GameService).register_jobs()
+    job_service.start()
+
+    # Cada worker guarda en memoria la lista de tokens revocados, para no consultarla en cada petición.
+    await revocation_list.sync()
+    background_tasks.append(asyncio.create_task(revocation_list.run_sync_periodically()))
+    # Igual con las versiones de los recursos, para calcular los ETags sin consultas.
+    await resource_versions.sync()
+    background_tasks.append(asyncio.create_task(resource_versions.run_sync_periodically()))
+    # El catálogo en memoria se carga antes de empezar a leer las invalidaciones, que le llegan desde que se cargó.
+    background_tasks.extend(await container.get(CatalogueService).start())
+    # Las invalidaciones de las cachés que hacen los demás workers.
+    background_tasks.append(asyncio.create_task(invalidation_bus.run()))
+    # El feed de eventos lee los change streams de Mongo si están disponibles.
+    background_tasks.extend(await event_bus.start())
+    deployment_service.set_ready(True)
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    deployment_service.set_ready(False)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await job_service.stop()
+    # Antes de apagar, registramos las compras de las descargas pendientes. El líder además consolida las ventas;
+    # las del resto de workers se consolidan en la siguiente pasada.
+    await download_queue.stop()
+    if deployment_service.is_leader:
+        await sales_service.rollup()
+    await deployment_service.stop()
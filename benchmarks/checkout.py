@@ -0,0 +1,148 @@
+import os
+
+# Por defecto se usa la base de datos de los benchmarks, para no borrar la de desarrollo al arrancar la aplicación.
+os.environ.setdefault("MONGO_DATABASE", "vgameshop_benchmark")
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+import httpx
+from benchmarks.datasets import generate_dataset
+from benchmarks.run import percentile
+from repositories.game_repository import GameRepository
+from repositories.library_repository import LibraryRepository
+from repositories.purchase_repository import PurchaseRepository
+from repositories.sales_counter_repository import SalesCounterRepository
+from services.authentication_service import create_access_token
+from services.container import container
+from services.sales_service import SalesService
+
+# Cada cuántos segundos se lanza el siguiente grupo de compras, para repartir la tasa pedida a lo largo del tiempo.
+TICK_SECONDS = 0.01
+
+
+async def sell_numbers(game_ids: list) -> dict:
+    games = await GameRepository.collection.find({"id": {"$in": game_ids}}, {"_id": 0, "id": 1, "sell_number": 1}) \
+        .to_list(length=None)
+    return {game["id"]: game["sell_number"] for game in games}
+
+
+async def load_test(args) -> list:
+    """
+    Función que lanza compras a la tasa indicada durante el tiempo indicado, sin esperar a que terminen las
+    anteriores (carga abierta), y repite una parte de ellas con la misma clave de idempotencia, como haría un cliente
+    que reintenta. Después consolida las ventas y comprueba que cada compra se ha contado exactamente una vez.
+    :param args: Argumentos de la línea de comandos.
+    :return: Lista con la descripción de cada fallo encontrado.
+    """
+    from app import app
+    await app.router.startup()
+    failures = []
+    try:
+        print(f"Generating dataset: {args.users} users, {args.games} games")
+        data = await generate_dataset(args.users, args.games, 0, 0, args.seed)
+        users, game_ids = data["users"], data["game_ids"]
+        tokens = {user.id: create_access_token(user) for user in users}
+        total = int(args.rate * args.duration)
+        if total > len(users) * len(game_ids):
+            raise ValueError(f"{total} checkouts need more than {len(users)} users x {len(game_ids)} games.")
+        rng = random.Random(args.seed)
+        pairs = [(users[index // len(game_ids)].id, game_ids[index % len(game_ids)])
+                 for index in rng.sample(range(len(users) * len(game_ids)), total)]
+        sold_before = await sell_numbers(game_ids)
+
+        latencies = []
+        status_codes = Counter()
+        purchase_ids = {}
+
+        async def checkout(client: httpx.AsyncClient, user_id, game_id, key: str):
+            start = time.perf_counter()
+            response = await client.post(f"/purchases/{user_id}", params={"game_id_str": str(game_id)},
+                                         headers={"Authorization": f"Bearer {tokens[user_id]}",
+                                                  "Idempotency-Key": key})
+            latencies.append(time.perf_counter() - start)
+            status_codes[response.status_code] += 1
+            if response.status_code == 200:
+                purchase_id = response.json()["id"]
+                if purchase_ids.setdefault((user_id, game_id), purchase_id) != purchase_id:
+                    failures.append(f"retries of the purchase of {game_id} by {user_id} returned different purchases")
+
+        print(f"Sending {args.rate} checkouts per second for {args.duration} seconds "
+              f"({args.retry_fraction:.0%} of them retried)")
+        tasks = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                     timeout=120) as client:
+            start = time.perf_counter()
+            sent = 0
+            while sent < total:
+                # Se lanzan las compras que tocan hasta ahora, aunque las anteriores no hayan terminado.
+                due = min(total, int((time.perf_counter() - start) * args.rate) + 1)
+                for user_id, game_id in pairs[sent:due]:
+                    key = str(uuid.uuid4())
+                    tasks.append(asyncio.create_task(checkout(client, user_id, game_id, key)))
+                    if rng.random() < args.retry_fraction:
+                        tasks.append(asyncio.create_task(checkout(client, user_id, game_id, key)))
+                sent = due
+                await asyncio.sleep(TICK_SECONDS)
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+
+        achieved = len(purchase_ids) / elapsed
+        latencies.sort()
+        print(f"Checkouts: {len(purchase_ids)} in {elapsed:.2f} s ({achieved:.0f}/s), responses {dict(status_codes)}")
+        print(f"Latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} "
+              f"ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+        if achieved < args.rate * (1 - args.tolerance):
+            failures.append(f"only {achieved:.0f} checkouts per second were completed, of {args.rate} requested")
+        if len(purchase_ids) != total:
+            failures.append(f"{total - len(purchase_ids)} checkouts failed")
+
+        await container.get(SalesService).rollup()
+        user_ids = [user.id for user in users]
+        purchases = await PurchaseRepository.collection.count_documents({"user_id": {"$in": user_ids}})
+        uncounted = await PurchaseRepository.collection.count_documents({"user_id": {"$in": user_ids},
+                                                                         "counted": False})
+        pending_counters = await SalesCounterRepository.collection.count_documents({"count": {"$ne": 0}})
+        sold_after = await sell_numbers(game_ids)
+        sold = sum(sold_after[game_id] - sold_before[game_id] for game_id in game_ids)
+        in_libraries = sum(len(library["game_ids"]) for library in await LibraryRepository.collection.find(
+            {"id": {"$in": user_ids}}, {"_id": 0, "game_ids": 1}).to_list(length=None))
+        print(f"Ledger: {purchases} purchases, {uncounted} uncounted; {pending_counters} pending counters; "
+              f"{sold} sales added to the games; {in_libraries} games added to libraries")
+        for name, count in (("purchases in the ledger", purchases), ("sales added to the games", sold),
+                            ("games added to libraries", in_libraries)):
+            if count != len(purchase_ids):
+                failures.append(f"{count} {name} instead of {len(purchase_ids)}")
+        if uncounted or pending_counters:
+            failures.append(f"{uncounted} purchases and {pending_counters} counters were left without rolling up")
+    finally:
+        await app.router.shutdown()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkout load test: throughput and exactly-once sale counting.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1707)
+    parser.add_argument("--rate", type=int, default=1000, help="Checkouts per second.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load.")
+    parser.add_argument("--retry-fraction", type=float, default=0.1, help="Checkouts sent twice with the same key.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed shortfall of the checkout rate.")
+    args = parser.parse_args()
+
+    failures = asyncio.run(load_test(args))
+    if failures:
+        print("Checkout load test failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("Every checkout was recorded and counted exactly once.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Código que se ejecuta en un proceso nuevo: importa la aplicación y comprueba qué se ha construido al importarla.
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+from db.database import db
+from services.container import container
+print(json.dumps({"import_ms": elapsed * 1000, "mongo_client_created": db.is_connected(),
+                  "singletons": sorted(cls.__name__ for cls in container.instances)}))
+"""
+
+
+def parse_import_times(stderr: str) -> list:
+    """
+    Función que lee la salida de python -X importtime.
+    :param stderr: Salida de error del proceso.
+    :return: Lista de tuplas (tiempo propio en µs, tiempo acumulado en µs, módulo).
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, module = line[len("import time:"):].split("|")
+        modules.append((int(self_time), int(cumulative), module.rstrip()))
+    return modules
+
+
+def run_once() -> tuple:
+    """
+    Función que importa la aplicación en un proceso nuevo.
+    :return: Tupla con el resultado del script de importación y los tiempos de cada módulo.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT], cwd=ROOT_DIRECTORY,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        print(process.stderr[-4000:])
+        raise RuntimeError("Importing the application failed.")
+    return json.loads(process.stdout.strip().splitlines()[-1]), parse_import_times(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how long it takes to import the application.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Maximum median import time.")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to show.")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    import_times = [result["import_ms"] for result, _ in results]
+    result, modules = results[-1]
+
+    print("Slowest modules (last run, cumulative):")
+    application_packages = ("app", "controllers", "services", "repositories", "dto", "model", "db", "middleware")
+    for self_time, cumulative, module in sorted(modules, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {module}")
+    print("Slowest application modules (last run, self time):")
+    own_modules = [item for item in modules if item[2].strip().split(".")[0] in application_packages]
+    for self_time, cumulative, module in sorted(own_modules, reverse=True)[:args.top]:
+        print(f"  {self_time / 1000:>8.1f} ms  {module}")
+
+    median = statistics.median(import_times)
+    print(f"Import time: median {median:.1f} ms, min {min(import_times):.1f} ms, max {max(import_times):.1f} ms "
+          f"({args.runs} runs, budget {args.budget_ms} ms)")
+    print(f"Singletons built at import: {', '.join(result['singletons']) or 'none'}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"the median import time ({median:.1f} ms) is over the budget ({args.budget_ms} ms)")
+    if result["mongo_client_created"]:
+        failures.append("the MongoDB client is created at import time")
+    if result["singletons"]:
+        failures.append(f"importing the application builds {len(result['singletons'])} services and repositories")
+    if failures:
+        print(f"Cold start check failed: {'; '.join(failures)}.")
+        sys.exit(1)
+    print("Cold start check passed.")
+
+
+if __name__ == "__main__":
+    main()
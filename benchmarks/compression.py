@@ -0,0 +1,90 @@
+import os
+
+# Por defecto, el benchmark usa su propia base de datos, para no borrar la de desarrollo al arrancar la aplicación.
+os.environ.setdefault("MONGO_DATABASE", "vgameshop_benchmark")
+
+import argparse
+import asyncio
+import time
+import httpx
+from benchmarks.datasets import generate_dataset
+from middleware.compression_middleware import CompressionMiddleware, available_encodings
+from services.authentication_service import create_access_token
+
+
+async def measure(client: httpx.AsyncClient, path: str, params: dict, headers: dict, encoding: str, requests: int,
+                  precompressed: bool) -> dict:
+    """
+    Función que lanza varias veces la misma petición con una codificación y mide lo que ocupa y lo que cuesta.
+    :param client: Cliente HTTP.
+    :param path: Ruta.
+    :param params: Parámetros de la petición.
+    :param headers: Cabeceras de la petición.
+    :param encoding: Codificación que se pide en Accept-Encoding.
+    :param requests: Número de peticiones.
+    :param precompressed: Si se deja usar las respuestas ya comprimidas. Si no, se vacía la caché antes de cada una.
+    :return: Diccionario con los bytes enviados y los milisegundos de CPU por petición.
+    """
+    downloaded = 0
+    cpu = 0.0
+    for _ in range(requests):
+        if not precompressed:
+            CompressionMiddleware.compressed_cache.clear()
+        start = time.process_time()
+        response = await client.get(path, params=params, headers={**headers, "Accept-Encoding": encoding})
+        cpu += time.process_time() - start
+        response.raise_for_status()
+        downloaded += response.num_bytes_downloaded
+    return {"bytes": downloaded / requests, "cpu_ms": cpu * 1000 / requests}
+
+
+async def benchmark(args):
+    """
+    Función que genera los datos, arranca la aplicación y mide cada ruta del catálogo con cada codificación.
+    :param args: Argumentos de la línea de comandos.
+    """
+    from app import app
+    await app.router.startup()
+    try:
+        data = await generate_dataset(args.users, args.games, args.reviews_per_game, 0, args.seed)
+        user = data["users"][0]
+        headers = {"Authorization": f"Bearer {create_access_token(user)}"}
+        game_id = str(data["game_ids"][0])
+        paths = [("/games", {"visible": "true"}),
+                 ("/reviews", {"game_id": game_id, "page": 0, "size": 50}),
+                 ("/genres", {})]
+        encodings = ["identity"] + available_encodings()
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                     timeout=60) as client:
+            for path, params in paths:
+                print(f"{path}:")
+                baseline = await measure(client, path, params, headers, "identity", args.requests, False)
+                for encoding in encodings:
+                    for precompressed in (False, True):
+                        if encoding == "identity" and precompressed:
+                            continue
+                        result = await measure(client, path, params, headers, encoding, args.requests,
+                                               precompressed)
+                        saved = 1 - result["bytes"] / baseline["bytes"] if baseline["bytes"] else 0
+                        mode = "precompressed" if precompressed else "per request"
+                        print(f"  {encoding:>8} {mode:>13}: {result['bytes']:>10.0f} B ({saved:>6.1%} saved), "
+                              f"{result['cpu_ms']:>7.3f} ms CPU "
+                              f"({result['cpu_ms'] - baseline['cpu_ms']:+.3f} ms vs identity)")
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the bandwidth saved and the CPU cost of compression.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--games", type=int, default=500)
+    parser.add_argument("--reviews-per-game", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1707)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per route and encoding.")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
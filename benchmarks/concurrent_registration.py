@@ -0,0 +1,91 @@
+import os
+
+# Se desactiva el límite de registros, porque aquí todas las peticiones vienen de la misma IP a la vez.
+os.environ.setdefault("MONGO_DATABASE", "vgameshop_benchmark")
+os.environ.setdefault("REGISTER_IP_BUCKET_SIZE", "1000000")
+os.environ.setdefault("LOGIN_USERNAME_BUCKET_SIZE", "1000000")
+
+import argparse
+import asyncio
+import datetime
+import sys
+from collections import Counter
+import httpx
+from bson import ObjectId
+from model.user import User, Role
+from repositories.game_repository import GameRepository
+from repositories.user_repository import UserRepository
+from services.authentication_service import create_access_token
+
+
+async def check_concurrent_creation(parallel: int) -> list:
+    """
+    Función que lanza a la vez muchas peticiones que crean el mismo usuario (mismo username o mismo email) y el
+    mismo juego, y comprueba que solo una de cada grupo lo consigue y que el resto recibe un 409.
+    :param parallel: Número de peticiones simultáneas de cada grupo.
+    :return: Lista con la descripción de cada fallo encontrado.
+    """
+    from app import app
+    await app.router.startup()
+    admin = User(id=ObjectId(), name="Admin", surname="Benchmark", username="concurrency_admin",
+                 email="concurrency_admin@benchmark.com", password="", birthdate=datetime.datetime(1990, 1, 1),
+                 role=Role.ADMIN)
+    headers = {"Authorization": f"Bearer {create_access_token(admin)}"}
+
+    def registration(username: str, email: str) -> dict:
+        return {"name": "Concurrency", "surname": "Benchmark", "username": username, "email": email,
+                "password": "benchmark", "repeatPassword": "benchmark", "birthdate": "1990-01-01T00:00:00"}
+
+    game = {"name": "Concurrency Game", "developer": "Concurrency Developer", "publisher": "Concurrency Publisher",
+            "genres": ["RPG"], "languages": ["English"], "description": "Created by the concurrency check.",
+            "release_date": "2020-01-01", "price": 9.99}
+
+    failures = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                     timeout=120) as client:
+            groups = {
+                "same username": [client.post("/register", json=registration("concurrent", f"user{i}@benchmark.com"))
+                                  for i in range(parallel)],
+                "same email": [client.post("/register", json=registration(f"concurrent{i}", "same@benchmark.com"))
+                               for i in range(parallel)],
+                "same game": [client.post("/games/", json=game, headers=headers) for _ in range(parallel)]
+            }
+            for name, requests in groups.items():
+                responses = await asyncio.gather(*requests)
+                status_codes = Counter(response.status_code for response in responses)
+                print(f"{name}: {dict(status_codes)}")
+                if status_codes[200] != 1 or status_codes[409] != parallel - 1:
+                    failures.append(f"{name}: expected one 200 and {parallel - 1} 409, got {dict(status_codes)}")
+
+        counts = {
+            "users with the username": await UserRepository.collection.count_documents({"username": "concurrent"}),
+            "users with the email": await UserRepository.collection.count_documents({"email": "same@benchmark.com"}),
+            "games with the name and developer": await GameRepository.collection.count_documents(
+                {"name": game["name"], "developer": game["developer"]})
+        }
+        for name, count in counts.items():
+            print(f"{name}: {count}")
+            if count != 1:
+                failures.append(f"{count} {name} were stored instead of 1")
+    finally:
+        await app.router.shutdown()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that parallel registrations never create duplicates.")
+    parser.add_argument("--parallel", type=int, default=50, help="Simultaneous requests per group.")
+    args = parser.parse_args()
+
+    failures = asyncio.run(check_concurrent_creation(args.parallel))
+    if failures:
+        print("Duplicates check failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("No duplicates were created.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import os
+import random
+from bson import ObjectId
+from db.database import MONGO_URL
+from model.game import Game, Genre, Language
+from model.library import Library
+from model.review import Review
+from model.user import User
+from model.wishlist import Wishlist
+from repositories.file_repository import get_resources_directory
+from repositories.game_repository import GameRepository
+from repositories.library_repository import LibraryRepository
+from repositories.review_repository import ReviewRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
+from repositories.user_repository import UserRepository
+from repositories.wishlist_repository import WishlistRepository
+from services.cipher_service import encode
+from services.container import container
+from services.metrics_service import current_request_stats
+from services.sales_service import SalesService
+
+# Contraseña de todos los usuarios generados. Se cifra una sola vez, porque BCrypt es lento a propósito.
+BENCHMARK_PASSWORD = "benchmark"
+# Archivo descargable que comparten todos los juegos generados.
+BENCHMARK_FILE = "benchmark-download.bin"
+INSERT_CHUNK_SIZE = 1000
+# Operaciones de las colecciones de mongomock que con un mongod serían una consulta.
+MONGOMOCK_COMMANDS = ("aggregate", "bulk_write", "count_documents", "create_index", "delete_many", "delete_one",
+                      "distinct", "estimated_document_count", "find", "find_one", "find_one_and_delete",
+                      "find_one_and_replace", "find_one_and_update", "insert_many", "insert_one", "replace_one",
+                      "update_many", "update_one")
+
+
+def count_mongomock_round_trips():
+    """
+    Función que, si los benchmarks usan mongomock, hace que cada operación de una colección cuente como una consulta
+    de la petición en curso. mongomock no avisa a los listeners de comandos, y sin esto las consultas por petición
+    saldrían siempre a 0. Con un mongod de verdad no hace nada, porque ya las cuenta el listener.
+    """
+    if not MONGO_URL.startswith("mongomock://"):
+        return
+    from mongomock_motor import AsyncMongoMockCollection
+    if getattr(AsyncMongoMockCollection, "counts_round_trips", False):
+        return
+
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            stats = current_request_stats.get()
+            if stats is not None:
+                stats.add_round_trip()
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in MONGOMOCK_COMMANDS:
+        setattr(AsyncMongoMockCollection, name, counted(getattr(AsyncMongoMockCollection, name)))
+    AsyncMongoMockCollection.counts_round_trips = True
+
+
+async def insert_in_chunks(collection, documents: list):
+    """
+    Función para insertar muchos documentos en bloques, para no mandar a Mongo un único mensaje enorme.
+    :param collection: Colección donde insertar los documentos.
+    :param documents: Lista de documentos a insertar.
+    """
+    for start in range(0, len(documents), INSERT_CHUNK_SIZE):
+        await collection.insert_many(documents[start:start + INSERT_CHUNK_SIZE], ordered=False)
+
+
+def create_download_file(size_bytes: int) -> str:
+    """
+    Función que crea el archivo descargable de los juegos generados, del tamaño indicado.
+    :param size_bytes: Tamaño del archivo en bytes.
+    :return: Ruta absoluta del archivo creado.
+    """
+    directory = os.path.join(get_resources_directory(), "game_downloadables")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, BENCHMARK_FILE)
+    with open(path, "wb") as file:
+        file.write(os.urandom(size_bytes))
+    return path
+
+
+async def generate_dataset(users: int, games: int, reviews_per_game: int, wishlist_density: float,
+                           seed: int = 1707) -> dict:
+    """
+    Función que genera un conjunto de datos sintético y lo inserta en la base de datos configurada.
+    Con la misma semilla y los mismos tamaños siempre se generan los mismos datos.
+    :param users: Número de usuarios.
+    :param games: Número de juegos.
+    :param reviews_per_game: Número de reviews de cada juego (como mucho, una por usuario).
+    :param wishlist_density: Proporción (de 0 a 1) de juegos que cada usuario tiene en su lista de deseados.
+    :param seed: Semilla de los números aleatorios.
+    :return: Diccionario con los usuarios ("users") y los IDs de los juegos ("game_ids") generados.
+    """
+    rng = random.Random(seed)
+    password = encode(BENCHMARK_PASSWORD)
+    genres = list(Genre)
+    languages = list(Language)
+
+    user_models = [
+        User(id=ObjectId(), name=f"Bench {i}", surname="Benchmark", username=f"bench{i}",
+             email=f"bench{i}@benchmark.com", password=password,
+             birthdate=datetime.datetime(1990, 1, 1) + datetime.timedelta(days=rng.randrange(10_000)))
+        for i in range(users)
+    ]
+    game_models = [
+        Game(id=ObjectId(), name=f"Benchmark Game {i}", developer=f"Developer {i % 97}",
+             publisher=f"Publisher {i % 31}", genres=rng.sample(genres, rng.randint(1, 3)),
+             languages=rng.sample(languages, rng.randint(1, 4)),
+             description=f"Synthetic game number {i} generated for the benchmarks.",
+             price=round(rng.uniform(1, 70), 2), sell_number=rng.randrange(1_000_000),
+             release_date=datetime.datetime(2000, 1, 1) + datetime.timedelta(days=rng.randrange(9_000)),
+             file=BENCHMARK_FILE)
+        for i in range(games)
+    ]
+    game_ids = [game.id for game in game_models]
+
+    # Cada review la escribe un usuario distinto, que además tiene el juego en su librería.
+    owned = {user.id: set() for user in user_models}
+    review_models = []
+    for game in game_models:
+        for user in rng.sample(user_models, min(reviews_per_game, users)):
+            owned[user.id].add(game.id)
+            review_models.append(
+                Review(id=ObjectId(), game_id=game.id, user_id=user.id, rating=round(rng.uniform(0, 5), 1),
+                       description="Synthetic review generated for the benchmarks.",
+                       publish_date=(datetime.datetime(2020, 1, 1)
+                                     + datetime.timedelta(minutes=rng.randrange(2_000_000))))
+            )
+
+    wishlist_size = int(games * wishlist_density)
+    libraries = [Library(id=user.id, game_ids=list(owned[user.id])).dict() for user in user_models]
+    wishlists = [Wishlist(id=user.id, game_ids=[game_id for game_id in rng.sample(game_ids, wishlist_size)
+                                                if game_id not in owned[user.id]]).dict()
+                 for user in user_models]
+
+    await asyncio.gather(
+        insert_in_chunks(UserRepository.collection, [user.dict() for user in user_models]),
+        insert_in_chunks(GameRepository.collection, [game.dict() for game in game_models]),
+        insert_in_chunks(ReviewRepository.collection, [review.dict() for review in review_models]),
+        insert_in_chunks(LibraryRepository.collection, libraries),
+        insert_in_chunks(WishlistRepository.collection, wishlists)
+    )
+
+    review_summary_repository = container.get(ReviewSummaryRepository)
+    for start in range(0, len(game_ids), 50):
+        await asyncio.gather(*[review_summary_repository.rebuild_summary(game_id)
+                               for game_id in game_ids[start:start + 50]])
+    await container.get(SalesService).rollup()
+
+    return {"users": user_models, "game_ids": game_ids}
@@ -0,0 +1,131 @@
+import os
+
+# Estas variables se tienen que definir antes de importar la aplicación, porque se leen al importar sus módulos.
+os.environ.setdefault("MONGO_DATABASE", "vgameshop_benchmark")
+os.environ.setdefault("METRICS_HEADERS", "true")
+
+import argparse
+import asyncio
+import sys
+import httpx
+from benchmarks.datasets import BENCHMARK_PASSWORD, count_mongomock_round_trips, generate_dataset
+from services.authentication_service import create_access_token
+
+# Número máximo de consultas a Mongo de cada endpoint, sin cachés (la primera petición) y con ellas (la segunda).
+# No depende del número de elementos: las listas (reviews de un juego, librerías, listas de deseados) leen todos sus
+# elementos con una consulta, así que una consulta por elemento supera el presupuesto.
+ROUND_TRIP_BUDGETS = {
+    "POST /login": 2,
+    "GET /me": 1,
+    "GET /users/{id}": 1,
+    "GET /users/batch": 1,
+    "GET /games": 2,
+    "GET /games/{id}": 2,
+    "GET /games/batch": 2,
+    "GET /games/top": 1,
+    "GET /reviews": 2,
+    "GET /reviews/game/{id}": 3,
+    "GET /reviews/game/{id}/summary": 1,
+    "GET /libraries/{id}": 4,
+    "GET /libraries/flags/{id}": 2,
+    "GET /wishlists/{id}": 4,
+    "GET /purchases/{id}": 1,
+    "POST /purchases/{id}": 5
+}
+
+
+def endpoint_requests(data: dict, index: int) -> dict:
+    """
+    Función que prepara una petición a cada endpoint con presupuesto, con un usuario y un juego distintos en cada
+    llamada, para que la primera petición de cada endpoint no encuentre nada en las cachés.
+    :param data: Datos generados, con los usuarios, sus tokens y los IDs de los juegos.
+    :param index: Número de la llamada.
+    :return: Diccionario con el método, la URL y los argumentos de la petición de cada endpoint.
+    """
+    user = data["users"][index % len(data["users"])]
+    user_id = str(user.id)
+    game_ids = [str(game_id) for game_id in data["game_ids"]]
+    game_id = game_ids[index % len(game_ids)]
+    headers = {"Authorization": f"Bearer {data['tokens'][user.id]}"}
+    return {
+        "POST /login": ("POST", "/login", {"json": {"username": user.username, "password": BENCHMARK_PASSWORD}}),
+        "GET /me": ("GET", "/me", {"headers": headers}),
+        "GET /users/{id}": ("GET", f"/users/{user_id}", {"headers": headers}),
+        "GET /users/batch": ("GET", "/users/batch",
+                             {"params": {"ids": ",".join(str(other.id) for other in data["users"][:10])},
+                              "headers": headers}),
+        "GET /games": ("GET", "/games", {"params": {"visible": "true"}, "headers": headers}),
+        "GET /games/{id}": ("GET", f"/games/{game_id}", {"headers": headers}),
+        "GET /games/batch": ("GET", "/games/batch", {"params": {"ids": ",".join(game_ids[:10])}, "headers": headers}),
+        "GET /games/top": ("GET", "/games/top", {"params": {"size": 10}, "headers": headers}),
+        "GET /reviews": ("GET", "/reviews", {"params": {"game_id": game_id, "page": 0, "size": 10},
+                                             "headers": headers}),
+        "GET /reviews/game/{id}": ("GET", f"/reviews/game/{game_id}", {"headers": headers}),
+        "GET /reviews/game/{id}/summary": ("GET", f"/reviews/game/{game_id}/summary", {"headers": headers}),
+        "GET /libraries/{id}": ("GET", f"/libraries/{user_id}", {"headers": headers}),
+        "GET /libraries/flags/{id}": ("GET", f"/libraries/flags/{user_id}",
+                                      {"params": [("game_ids", game_id) for game_id in game_ids[:10]],
+                                       "headers": headers}),
+        "GET /wishlists/{id}": ("GET", f"/wishlists/{user_id}", {"headers": headers}),
+        "GET /purchases/{id}": ("GET", f"/purchases/{user_id}", {"headers": headers}),
+        "POST /purchases/{id}": ("POST", f"/purchases/{user_id}",
+                                 {"params": {"game_id_str": game_ids[-1 - index % len(game_ids)]},
+                                  "headers": headers})
+    }
+
+
+async def check_round_trips(args) -> list:
+    """
+    Función que llama dos veces a cada endpoint con presupuesto y comprueba que ninguna de las dos llamadas hace más
+    consultas a Mongo que su presupuesto. Las consultas se leen de la cabecera X-DB-Round-Trips.
+    :param args: Argumentos de la línea de comandos.
+    :return: Lista con la descripción de cada fallo encontrado.
+    """
+    count_mongomock_round_trips()
+    from app import app
+    await app.router.startup()
+    failures = []
+    try:
+        data = await generate_dataset(args.users, args.games, args.reviews_per_game, args.wishlist_density,
+                                      args.seed)
+        data["tokens"] = {user.id: create_access_token(user) for user in data["users"]}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                     timeout=120) as client:
+            calls = [endpoint_requests(data, index) for index in range(2)]
+            print(f"{'endpoint':32}{'cold':>6}{'warm':>6}{'budget':>8}")
+            for endpoint, budget in ROUND_TRIP_BUDGETS.items():
+                round_trips = []
+                for requests in calls:
+                    method, url, kwargs = requests[endpoint]
+                    response = await client.request(method, url, **kwargs)
+                    if response.status_code >= 400:
+                        failures.append(f"{endpoint}: status {response.status_code}")
+                    round_trips.append(int(response.headers.get("x-db-round-trips", 0)))
+                print(f"{endpoint:32}{round_trips[0]:>6}{round_trips[1]:>6}{budget:>8}")
+                if max(round_trips) > budget:
+                    failures.append(f"{endpoint}: {max(round_trips)} MongoDB round trips, budget {budget}")
+    finally:
+        await app.router.shutdown()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the MongoDB round trips of each endpoint against a budget.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--games", type=int, default=30)
+    parser.add_argument("--reviews-per-game", type=int, default=5)
+    parser.add_argument("--wishlist-density", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1707)
+    args = parser.parse_args()
+
+    failures = asyncio.run(check_round_trips(args))
+    if failures:
+        print("Round-trip budget check failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("Every endpoint is within its round-trip budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+
+# Estas variables se tienen que definir antes de importar la aplicación, porque se leen al importar sus módulos.
+# Por defecto, el benchmark usa su propia base de datos, para no borrar la de desarrollo al arrancar la aplicación.
+os.environ.setdefault("MONGO_DATABASE", "vgameshop_benchmark")
+os.environ.setdefault("METRICS_HEADERS", "true")
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+import httpx
+from benchmarks.datasets import (BENCHMARK_PASSWORD, count_mongomock_round_trips, create_download_file,
+                                 generate_dataset)
+from services.authentication_service import create_access_token
+
+# Peso de cada escenario en la mezcla de peticiones. Imita un uso normal de la tienda: sobre todo navegar por el
+# catálogo y las reviews, algunas descargas y pocas compras e inicios de sesión (BCrypt es lento a propósito).
+SCENARIO_WEIGHTS = {
+    "login": 2,
+    "games": 15,
+    "game": 20,
+    "top": 10,
+    "reviews": 15,
+    "summary": 15,
+    "wishlist": 10,
+    "download": 8,
+    "checkout": 5
+}
+
+
+class Recorder:
+    """
+    Guarda las latencias, errores, round-trips a Mongo y tiempos hasta el primer byte de cada escenario.
+    """
+
+    def __init__(self):
+        self.latencies = {name: [] for name in SCENARIO_WEIGHTS}
+        self.errors = {name: 0 for name in SCENARIO_WEIGHTS}
+        self.round_trips = {name: [] for name in SCENARIO_WEIGHTS}
+        self.first_bytes = []
+
+    def record(self, scenario: str, latency: float, response: httpx.Response):
+        self.latencies[scenario].append(latency)
+        if response.status_code >= 400:
+            self.errors[scenario] += 1
+        round_trips = response.headers.get("x-db-round-trips")
+        if round_trips is not None:
+            self.round_trips[scenario].append(int(round_trips))
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Función que calcula un percentil por el método del rango más cercano.
+    :param values: Lista de valores ya ordenada.
+    :param fraction: Percentil, de 0 a 1.
+    :return: El valor del percentil, o 0 si la lista está vacía.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, rng: random.Random, data: dict,
+                       recorder: Recorder):
+    """
+    Función que lanza una petición del escenario indicado y guarda su resultado.
+    :param client: Cliente HTTP.
+    :param scenario: Nombre del escenario.
+    :param rng: Generador de números aleatorios del trabajador.
+    :param data: Datos generados, con los usuarios, sus tokens y los IDs de los juegos.
+    :param recorder: Donde guardar el resultado.
+    """
+    user = rng.choice(data["users"])
+    user_id = str(user.id)
+    game_id = str(rng.choice(data["game_ids"]))
+    headers = {"Authorization": f"Bearer {data['tokens'][user.id]}"}
+
+    start = time.perf_counter()
+    if scenario == "login":
+        response = await client.post("/login", json={"username": user.username, "password": BENCHMARK_PASSWORD})
+    elif scenario == "games":
+        response = await client.get("/games", params={"visible": "true"}, headers=headers)
+    elif scenario == "game":
+        response = await client.get(f"/games/{game_id}", headers=headers)
+    elif scenario == "top":
+        response = await client.get("/games/top", params={"size": 10}, headers=headers)
+    elif scenario == "reviews":
+        response = await client.get("/reviews", params={"game_id": game_id, "page": 0, "size": 10}, headers=headers)
+    elif scenario == "summary":
+        response = await client.get(f"/reviews/game/{game_id}/summary", headers=headers)
+    elif scenario == "wishlist":
+        response = await client.get(f"/wishlists/{user_id}", headers=headers)
+    elif scenario == "download":
+        # La descarga se lee en streaming para medir también el tiempo hasta el primer byte.
+        async with client.stream("GET", f"/games/download/{game_id}", params={"user_id": user_id},
+                                 headers=headers) as response:
+            first_byte = None
+            async for _ in response.aiter_raw():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+            if first_byte is not None and response.status_code < 400:
+                recorder.first_bytes.append(first_byte)
+    else:
+        # Cada compra lleva una clave de idempotencia nueva, como la mandaría un cliente real.
+        response = await client.post(f"/purchases/{user_id}", params={"game_id_str": game_id},
+                                     headers={**headers, "Idempotency-Key": str(uuid.uuid4())})
+    recorder.record(scenario, time.perf_counter() - start, response)
+
+
+async def worker(client: httpx.AsyncClient, seed: int, deadline: float, data: dict, recorder: Recorder):
+    """
+    Función que lanza peticiones de la mezcla de escenarios, una detrás de otra, hasta que se acabe el tiempo.
+    :param client: Cliente HTTP.
+    :param seed: Semilla del trabajador, para que la secuencia de peticiones sea reproducible.
+    :param deadline: Instante (de time.perf_counter) en el que parar.
+    :param data: Datos generados.
+    :param recorder: Donde guardar los resultados.
+    """
+    rng = random.Random(seed)
+    scenarios = list(SCENARIO_WEIGHTS)
+    weights = list(SCENARIO_WEIGHTS.values())
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(scenarios, weights)[0]
+        try:
+            await run_scenario(client, scenario, rng, data, recorder)
+        except httpx.HTTPError as e:
+            print(f"Request failed ({scenario}): {e!r}")
+            recorder.errors[scenario] += 1
+
+
+def build_report(recorder: Recorder, duration: float) -> dict:
+    """
+    Función que resume los resultados de la ejecución.
+    :param recorder: Resultados guardados.
+    :param duration: Duración real de la ejecución, en segundos.
+    :return: Diccionario con el resumen de cada escenario y del total.
+    """
+    report = {"duration_seconds": round(duration, 3), "scenarios": {}}
+    all_latencies = []
+    for scenario, latencies in recorder.latencies.items():
+        if not latencies:
+            continue
+        latencies.sort()
+        all_latencies += latencies
+        round_trips = recorder.round_trips[scenario]
+        report["scenarios"][scenario] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[scenario],
+            "throughput": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "db_round_trips": round(sum(round_trips) / len(round_trips), 2) if round_trips else None
+        }
+    all_latencies.sort()
+    first_bytes = sorted(recorder.first_bytes)
+    report["total"] = {
+        "requests": len(all_latencies),
+        "errors": sum(recorder.errors.values()),
+        "throughput": round(len(all_latencies) / duration, 2),
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "download_ttfb_p50_ms": round(percentile(first_bytes, 0.50) * 1000, 2),
+        "download_ttfb_p95_ms": round(percentile(first_bytes, 0.95) * 1000, 2)
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(f"{'scenario':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'db trips':>9}")
+    rows = list(report["scenarios"].items()) + [("total", report["total"])]
+    for scenario, row in rows:
+        round_trips = row.get("db_round_trips")
+        print(f"{scenario:<10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>9} {row['p50_ms']:>9} "
+              f"{row['p95_ms']:>9} {row['p99_ms']:>9} {'-' if round_trips is None else round_trips:>9}")
+    print(f"Download time to first byte: p50 {report['total']['download_ttfb_p50_ms']} ms, "
+          f"p95 {report['total']['download_ttfb_p95_ms']} ms")
+
+
+def compare_reports(baseline: dict, report: dict, tolerance: float) -> list:
+    """
+    Función que compara una ejecución con la de referencia. Se considera una regresión que el p95 de un escenario
+    suba, que su throughput baje o que haga más consultas a Mongo por petición que en la referencia.
+    :param baseline: Resumen de la ejecución de referencia.
+    :param report: Resumen de la ejecución actual.
+    :param tolerance: Margen permitido en latencia y throughput (0.2 = un 20 %).
+    :return: Lista con la descripción de cada regresión encontrada.
+    """
+    regressions = []
+    for scenario, old in baseline["scenarios"].items():
+        new = report["scenarios"].get(scenario)
+        if new is None:
+            continue
+        if new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {old['p95_ms']} ms -> {new['p95_ms']} ms")
+        if new["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {old['throughput']} -> {new['throughput']} req/s")
+        # El número de consultas no depende de la máquina, así que no tiene margen (salvo el redondeo de la media).
+        if old["db_round_trips"] is not None and new["db_round_trips"] is not None \
+                and new["db_round_trips"] > old["db_round_trips"] + 0.05:
+            regressions.append(f"{scenario}: MongoDB round trips {old['db_round_trips']} -> "
+                               f"{new['db_round_trips']} per request")
+    return regressions
+
+
+async def benchmark(args) -> dict:
+    """
+    Función que genera los datos, arranca la aplicación (salvo que se use --url) y lanza la carga.
+    :param args: Argumentos de la línea de comandos.
+    :return: Resumen de la ejecución.
+    """
+    app = None
+    if args.url:
+        # La aplicación ya está arrancada (y ya ha cargado sus datos iniciales), así que solo añadimos los nuestros.
+        transport = None
+        base_url = args.url
+    else:
+        count_mongomock_round_trips()
+        from app import app
+        await app.router.startup()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://benchmark"
+
+    download_file = create_download_file(args.download_size)
+    try:
+        print(f"Generating dataset: {args.users} users, {args.games} games, {args.reviews_per_game} reviews per "
+              f"game, wishlist density {args.wishlist_density}, seed {args.seed}")
+        data = await generate_dataset(args.users, args.games, args.reviews_per_game, args.wishlist_density,
+                                      args.seed)
+        data["tokens"] = {user.id: create_access_token(user) for user in data["users"]}
+
+        print(f"Running {args.concurrency} concurrent clients for {args.duration} seconds")
+        recorder = Recorder()
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=30) as client:
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*[worker(client, args.seed + i, deadline, data, recorder)
+                                   for i in range(args.concurrency)])
+            duration = time.perf_counter() - start
+        return build_report(recorder, duration)
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+        os.remove(download_file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test and benchmark for the VGameShop API.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--games", type=int, default=500)
+    parser.add_argument("--reviews-per-game", type=int, default=20)
+    parser.add_argument("--wishlist-density", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1707)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients.")
+    parser.add_argument("--download-size", type=int, default=4 * 1024 * 1024, help="Game file size in bytes.")
+    parser.add_argument("--url", help="Benchmark an already running server instead of running the app in-process.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as the new baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare the results with a baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed latency/throughput change.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = asyncio.run(benchmark(args))
+    report["parameters"] = {key: value for key, value in vars(args).items()
+                            if key not in ("save_baseline", "compare", "tolerance")}
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Warning: the baseline was recorded with different parameters.")
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(url: str, timeout: float):
+    """
+    Función que espera a que el servidor responda que está listo en /ready.
+    Como cada petición puede ir a un worker distinto, se espera a varias respuestas seguidas.
+    :param url: URL del servidor.
+    :param timeout: Segundos que esperar como mucho.
+    """
+    deadline = time.monotonic() + timeout
+    ready_in_a_row = 0
+    while time.monotonic() < deadline:
+        try:
+            ready_in_a_row = ready_in_a_row + 1 if httpx.get(f"{url}/ready", timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            ready_in_a_row = 0
+        if ready_in_a_row >= 10:
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"The server at {url} was not ready after {timeout} seconds.")
+
+
+def measure(workers: int, args, load_arguments: list) -> float:
+    """
+    Función que arranca el servidor con el número de workers indicado, le lanza la carga de benchmarks.run
+    y lo apaga.
+    :param workers: Número de workers.
+    :param args: Argumentos de la línea de comandos.
+    :param load_arguments: Argumentos que se pasan tal cual a benchmarks.run.
+    :return: Peticiones por segundo.
+    """
+    url = f"http://{args.host}:{args.port}"
+    environment = {**os.environ, "WEB_WORKERS": str(workers), "HOST": args.host, "PORT": str(args.port),
+                   "MONGO_DATABASE": os.environ.get("MONGO_DATABASE", "vgameshop_benchmark"),
+                   "METRICS_HEADERS": "true"}
+    server = subprocess.Popen([sys.executable, "__main__.py"], cwd=ROOT_DIRECTORY, env=environment)
+    try:
+        wait_until_ready(url, args.startup_timeout)
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, "report.json")
+            subprocess.run([sys.executable, "-m", "benchmarks.run", "--url", url, "--save-baseline", report_path,
+                            *load_arguments], cwd=ROOT_DIRECTORY, env=environment, check=True)
+            with open(report_path) as file:
+                return json.load(file)["total"]["throughput"]
+    finally:
+        # SIGTERM apaga el servidor de forma ordenada: termina las peticiones en curso y vacía las colas.
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks that throughput grows linearly with the number of workers. Any argument not listed "
+                    "here is passed to benchmarks.run.")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--min-efficiency", type=float, default=0.7,
+                        help="Minimum throughput with N workers, relative to N times the throughput with one.")
+    args, load_arguments = parser.parse_known_args()
+
+    worker_counts = sorted({1, *[2 ** i for i in range(1, args.max_workers.bit_length())], args.max_workers})
+    results = {}
+    for workers in worker_counts:
+        print(f"Measuring with {workers} worker(s)")
+        results[workers] = measure(workers, args, load_arguments)
+
+    failed = False
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'efficiency':>11}")
+    for workers, throughput in results.items():
+        speedup = throughput / results[1] if results[1] else 0
+        efficiency = speedup / workers
+        failed = failed or efficiency < args.min_efficiency
+        print(f"{workers:>8} {throughput:>10} {speedup:>8.2f} {efficiency:>11.2f}")
+    if failed:
+        print(f"Throughput does not scale linearly (efficiency below {args.min_efficiency}).")
+        sys.exit(1)
+    print("Throughput scales linearly with the number of workers.")
+
+
+if __name__ == "__main__":
+    main()
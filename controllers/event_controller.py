@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from bson import ObjectId
+from typing import Optional
+from services.authentication_service import check_role
+from services.event_service import event_bus, EVENT_TOPICS
+
+event_routes = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+@event_routes.get("/events")
+async def get_events(
+        topics: Optional[str] = Query(None),
+        game_id: Optional[str] = Query(None),
+        token: str = Depends(oauth2_scheme)
+):
+    """
+    Endpoint con un feed de Server-Sent Events de los cambios del catálogo y de las reviews, para que los clientes
+    no tengan que volver a pedir /games o /reviews/game/{game_id} cada cierto tiempo.
+    Los eventos son game_created y game_updated (tema "games") y reviews_changed (tema "reviews"), además de
+    resync, que indica que se han perdido eventos y hay que volver a pedir los datos.
+    :param topics: Temas a los que suscribirse, separados por comas. Si no está, todos.
+    :param game_id: ID del juego cuyos eventos queremos recibir. Si no está, los de todos los juegos.
+    :param token: Token del usuario.
+    :return: El feed de eventos, 400 si algún tema no existe o 503 si hay demasiados clientes conectados.
+    """
+    check_role(["ADMIN", "USER"], token)
+    selected_topics = set(EVENT_TOPICS)
+    if topics:
+        selected_topics = {topic.strip() for topic in topics.split(",") if topic.strip()}
+        unknown_topics = selected_topics - set(EVENT_TOPICS)
+        if unknown_topics:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Unknown topics: {', '.join(sorted(unknown_topics))}.")
+    subscriber = event_bus.subscribe(selected_topics, str(ObjectId(game_id)) if game_id else None)
+    if subscriber is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many clients are connected to the event feed.")
+    return StreamingResponse(event_bus.stream(subscriber), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,22 +1,29 @@
-from fastapi import APIRouter, Query, UploadFile, File, HTTPException, status, Depends
+from fastapi import APIRouter, Query, UploadFile, File, Depends, Request, Response, status
 from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordBearer
 from services.authentication_service import check_role
 from services.game_service import GameService, get_showcase_image
-from dto.game_dto import GameDtoCreate, GameDtoUpdate
+from dto.fields import parse_fields
+from dto.game_dto import GameDtoCreate, GameDtoUpdate, GAME_DTO_FIELDS
 from model.game import Language, Genre, transform_genres, transform_languages
 from bson import ObjectId
 from typing import Optional, List
-from services.library_service import LibraryService
+from services.purchase_service import PurchaseService
+from services.sales_service import SalesService
+from services.version_service import not_modified
+from services.container import Lazy
 
 game_routes = APIRouter()
-game_service = GameService()
-library_service = LibraryService()
+game_service = Lazy(GameService)
+purchase_service = Lazy(PurchaseService)
+sales_service = Lazy(SalesService)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 @game_routes.get("/games")
 async def get_all_games(
+        request: Request,
+        response: Response,
         genre: Optional[str] = Query(None),
         language: Optional[str] = Query(None),
         name: Optional[str] = Query(None),
@@ -24,10 +31,14 @@ async def get_all_games(
         developer: Optional[str] = Query(None),
         rating: Optional[float] = Query(None),
         visible: Optional[bool] = Query(None),
+        fields: Optional[str] = Query(None),
         token: str = Depends(oauth2_scheme)
 ):
     """
     Endpoint para obtener todos los juegos, o todos aquellos que cumplan con todos los filtros, si están.
+    Devuelve un ETag, y un 304 sin consultar la base de datos si el cliente ya tiene la versión actual.
+    :param request: Petición, para leer la cabecera If-None-Match.
+    :param response: Respuesta, para añadirle el ETag.
     :param genre: Género por el que filtrar.
     :param language: Lenguaje por el que filtrar.
     :param name: Nombre por el que filtrar.
@@ -35,47 +46,100 @@ async def get_all_games(
     :param developer: Desarrollador por el que filtrar.
     :param rating: Calificación mínima por la que filtrar.
     :param visible: Estado por el que filtrar.
+    :param fields: Campos de cada juego a devolver, separados por comas. Si no está, se devuelven todos.
     :param token: Token del usuario.
     :return: Lista de todos los juegos, o de todos aquellos que cumplen todos los filtros.
     """
     check_role(["ADMIN", "USER"], token)
-    games = await game_service.get_all_games()
+    requested_fields = parse_fields(fields, GAME_DTO_FIELDS) or GAME_DTO_FIELDS
+    cached = not_modified(request, response, "games")
+    if cached:
+        return cached
+
+    # Además de los campos pedidos, hay que leer los que usan los filtros.
+    filter_fields = {"visible": visible is not None, "genres": bool(genre), "languages": bool(language),
+                     "name": bool(name and name.strip()), "publisher": bool(publisher and publisher.strip()),
+                     "developer": bool(developer and developer.strip()), "rating": rating is not None}
+    games = await game_service.get_all_games([field for field in GAME_DTO_FIELDS
+                                              if field in requested_fields or filter_fields.get(field)])
 
     print(visible)
     if visible is not None:
-        games = [game for game in games if visible == game.visible]
+        games = [game for game in games if visible == game["visible"]]
 
     if genre:
-        games = [game for game in games if transform_genres([genre])[0] in game.genres]
+        games = [game for game in games if transform_genres([genre])[0] in game["genres"]]
 
     if language:
-        games = [game for game in games if transform_languages([language])[0] in game.languages]
+        games = [game for game in games if transform_languages([language])[0] in game["languages"]]
 
     if name is not None and name.strip():
-        games = [game for game in games if name.strip().lower() in game.name.strip().lower()]
+        games = [game for game in games if name.strip().lower() in game["name"].strip().lower()]
 
     if publisher is not None and publisher.strip():
-        games = [game for game in games if publisher.strip().lower() in game.publisher.strip().lower()]
+        games = [game for game in games if publisher.strip().lower() in game["publisher"].strip().lower()]
 
     if developer is not None and developer.strip():
-        games = [game for game in games if developer.strip().lower() in game.developer.strip().lower()]
+        games = [game for game in games if developer.strip().lower() in game["developer"].strip().lower()]
 
     if rating is not None:
-        games = [game for game in games if game.rating >= rating]
+        games = [game for game in games if game["rating"] >= rating]
 
     print(len(games))
-    return games
+    return [{field: game[field] for field in requested_fields} for game in games]
+
+
+@game_routes.get("/games/top")
+async def get_top_sellers(
+        genre: Optional[str] = Query(None),
+        size: int = Query(10),
+        token: str = Depends(oauth2_scheme)
+):
+    """
+    Endpoint para obtener los juegos más vendidos, en general o de un género.
+    El ranking se recalcula periódicamente, así que puede ir unos segundos por detrás de las ventas.
+    :param genre: Género por el que filtrar.
+    :param size: Número de juegos a devolver.
+    :param token: Token del usuario.
+    :return: Lista de los juegos más vendidos, de más a menos ventas.
+    """
+    check_role(["ADMIN", "USER"], token)
+    return await sales_service.get_top_sellers(genre, size)
+
+
+@game_routes.get("/games/batch")
+async def get_games_by_ids(ids: List[str] = Query(...), token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para obtener varios juegos por su ID con una sola petición.
+    Tiene que estar antes de /games/{game_id_str}, o "batch" se tomaría por un ID.
+    :param ids: IDs de los juegos, separados por comas o repitiendo el parámetro.
+    :param token: Token del usuario.
+    :return: Lista con una entrada por cada ID, en el mismo orden, con el juego o con null si no existe.
+    """
+    check_role(["ADMIN", "USER"], token)
+    return await game_service.get_games_by_ids([game_id for value in ids for game_id in value.split(",") if game_id])
 
 
 @game_routes.get("/games/{game_id_str}")
-async def get_game_by_id(game_id_str: str, token: str = Depends(oauth2_scheme)):
+async def get_game_by_id(game_id_str: str, request: Request, response: Response, fields: Optional[str] = Query(None),
+                         token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener un juego por su ID.
+    Devuelve un ETag, y un 304 sin consultar la base de datos si el cliente ya tiene la versión actual.
     :param game_id_str: ID del juego a buscar.
+    :param request: Petición, para leer la cabecera If-None-Match.
+    :param response: Respuesta, para añadirle el ETag.
+    :param fields: Campos del juego a devolver, separados por comas. Si no está, se devuelven todos.
     :param token: Token del usuario.
     :return: El juego encontrado, o una Response de error.
     """
     check_role(["ADMIN", "USER"], token)
+    requested_fields = parse_fields(fields, GAME_DTO_FIELDS)
+    cached = not_modified(request, response, f"game:{ObjectId(game_id_str)}")
+    if cached:
+        return cached
+    if requested_fields is not None:
+        return await game_service.get_game_fields_by_id(ObjectId(game_id_str), requested_fields)
     return await game_service.get_game_by_id(ObjectId(game_id_str))
 
 
@@ -89,11 +153,7 @@ async def post_game(game: GameDtoCreate, token: str = Depends(oauth2_scheme)):
     """
     check_role(["ADMIN"], token)
     game.validate_fields()
-    if await game_service.get_game_by_name_and_dev(game.name, game.developer):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="Already exists a game with the same name and developer.")
-    else:
-        return await game_service.create_game(game)
+    return await game_service.create_game(game)
 
 
 @game_routes.put("/games/{game_id_str}")
@@ -123,18 +183,19 @@ async def put_game_main_img(game_id_str: str, file: UploadFile = File(...), toke
     return await game_service.upload_main_image(ObjectId(game_id_str), file)
 
 
-@game_routes.put("/games/upload_showcase_imgs/{game_id_str}")
+@game_routes.put("/games/upload_showcase_imgs/{game_id_str}", status_code=status.HTTP_202_ACCEPTED)
 async def put_game_showcases(game_id_str: str, files: List[UploadFile] = File(...),
                              token: str = Depends(oauth2_scheme)):
     """
-    Endpoint para subir una lista de imágenes de muestra para un juego.
+    Endpoint para subir una lista de imágenes de muestra para un juego. Las imágenes se asocian al juego
+    en segundo plano; el estado de la tarea se puede consultar en /jobs/{job_id}.
     :param game_id_str: ID del juego al cual le queremos agregar imágenes de muestra.
     :param files: Lista de imágenes de muestra.
     :param token: Token del usuario.
-    :return: El juego actualizado, o una Response de error.
+    :return: La tarea que asocia las imágenes al juego, o una Response de error.
     """
     check_role(["ADMIN"], token)
-    return await game_service.upload_showcase_images(ObjectId(game_id_str), set(files))
+    return await game_service.upload_showcase_images(ObjectId(game_id_str), files)
 
 
 @game_routes.delete("/games/clear_showcase_imgs/{game_id_str}")
@@ -175,15 +236,16 @@ async def get_game_main_img_by_id(game_id_str: str, token: str = Depends(oauth2_
 
 
 @game_routes.get("/games/showcase_image/{name}")
-async def get_showcase_img_by_name(name: str, token: str = Depends(oauth2_scheme)):
+async def get_showcase_img_by_name(name: str, thumbnail: bool = Query(False), token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener la imágen de muestra de un juego por el nombre de la imágen.
     :param name: Nombre de la imágen a buscar.
+    :param thumbnail: Si queremos la copia reducida de la imágen, cuando ya se haya creado.
     :param token: Token del usuario.
     :return: La imágen de muestra, o una por defecto, o una Response de error.
     """
     check_role(["ADMIN", "USER"], token)
-    return FileResponse(get_showcase_image(name))
+    return FileResponse(get_showcase_image(name, thumbnail))
 
 
 @game_routes.get("/games/download/{game_id_str}")
@@ -199,9 +261,11 @@ async def download_game_by_id(game_id_str: str, user_id: str, token: str = Depen
     fileResponse = FileResponse(await game_service.get_download(ObjectId(game_id_str)),
                                 content_disposition_type="attachment")
 
-    # Si lo descargamos correctamente, lo agregamos a la libreria
+    # Si lo descargamos correctamente, registramos la compra, que lo agrega a la libreria.
+    # La compra es idempotente, así que descargar otra vez el mismo juego no cuenta una venta nueva.
+    # Se registra en segundo plano, para que la descarga no tenga que esperar a la base de datos.
     if fileResponse.status_code >= 200 & fileResponse.status_code < 300:
-        await library_service.add_to_library(ObjectId(user_id), ObjectId(game_id_str))
+        purchase_service.record_download(ObjectId(user_id), ObjectId(game_id_str))
 
     return fileResponse
 
@@ -220,22 +284,28 @@ async def upload_game_by_id(game_id_str: str, file: UploadFile = File(...), toke
 
 
 @game_routes.get("/genres")
-def get_genres(token: str = Depends(oauth2_scheme)):
+def get_genres(request: Request, response: Response, token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener todos los géneros de videojuegos soportados.
+    Solo cambian al desplegar una versión nueva, así que su ETag es el mismo durante todo el despliegue.
+    :param request: Petición, para leer la cabecera If-None-Match.
+    :param response: Respuesta, para añadirle el ETag.
     :param token: Token del usuario.
     :return: Lista con todos los géneros disponibles.
     """
     check_role(["ADMIN", "USER"], token)
-    return list(Genre)
+    return not_modified(request, response, "genres") or list(Genre)
 
 
 @game_routes.get("/languages")
-def get_languages(token: str = Depends(oauth2_scheme)):
+def get_languages(request: Request, response: Response, token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener todos los lenguajes de videojuegos soportados.
+    Solo cambian al desplegar una versión nueva, así que su ETag es el mismo durante todo el despliegue.
+    :param request: Petición, para leer la cabecera If-None-Match.
+    :param response: Respuesta, para añadirle el ETag.
     :param token: Token del usuario.
     :return: Lista con todos los lenguajes disponibles.
     """
     check_role(["ADMIN", "USER"], token)
-    return list(Language)
+    return not_modified(request, response, "languages") or list(Language)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.deployment_service import DeploymentService, DEPLOYMENT_ID
+from services.container import Lazy
+
+health_routes = APIRouter()
+deployment_service = Lazy(DeploymentService)
+
+
+@health_routes.get("/ready")
+async def get_readiness():
+    """
+    Endpoint para saber si el worker puede recibir peticiones: ha terminado de arrancar, no se está apagando y llega
+    a la base de datos. No requiere autenticación, para que lo puedan consultar los balanceadores.
+    :return: 200 si el worker está listo, o 503 si no lo está.
+    """
+    body = {"deployment_id": DEPLOYMENT_ID, "worker": deployment_service.worker, "leader": deployment_service.is_leader}
+    if await deployment_service.check_ready():
+        return {"status": "ready", **body}
+    return JSONResponse(status_code=503, content={"status": "unavailable", **body})
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+from fastapi.security import OAuth2PasswordBearer
+from services.authentication_service import check_role
+from services.job_service import JobService
+from bson import ObjectId
+from services.container import Lazy
+
+job_routes = APIRouter()
+job_service = Lazy(JobService)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+@job_routes.get("/jobs/{job_id_str}")
+async def get_job_by_id(job_id_str: str, token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para consultar el estado de una tarea en segundo plano, como la que procesa las imágenes de muestra.
+    :param job_id_str: ID de la tarea.
+    :param token: Token del usuario.
+    :return: La tarea, o una Response de error.
+    """
+    check_role(["ADMIN"], token)
+    return await job_service.get_job_by_id(ObjectId(job_id_str))
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.security import OAuth2PasswordBearer
 from services.authentication_service import check_role, check_role_and_myself
 from services.library_service import LibraryService
 from bson import ObjectId
+from typing import List
+from services.container import Lazy
 
 
 library_routes = APIRouter()
-library_service = LibraryService()
+library_service = Lazy(LibraryService)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -35,6 +37,20 @@ async def get_library_by_id(library_id_str: str, token: str = Depends(oauth2_sch
     return await library_service.get_library_by_id(ObjectId(library_id_str))
 
 
+@library_routes.get("/libraries/flags/{user_id_str}")
+async def get_game_flags(user_id_str: str, game_ids: List[str] = Query(...), token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para saber, para una lista de juegos (por ejemplo, una página de la tienda), cuáles tiene el usuario
+    en su librería y cuáles en su lista de deseados.
+    :param user_id_str: ID del usuario.
+    :param game_ids: IDs de los juegos, repitiendo el parámetro (?game_ids=...&game_ids=...).
+    :param token: Token del usuario.
+    :return: Lista con las marcas de cada juego, en el mismo orden, o una Response de error.
+    """
+    check_role_and_myself(["ADMIN", "USER"], token, user_id_str)
+    return await library_service.get_game_flags(ObjectId(user_id_str), [ObjectId(game_id) for game_id in game_ids])
+
+
 @library_routes.put("/libraries/add_game/{library_id_str}")
 async def add_to_library(library_id_str: str, game_id_str: str, token: str = Depends(oauth2_scheme)):
     """
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.security import OAuth2PasswordBearer
+from typing import Optional
+from services.authentication_service import check_role
+from services.metrics_service import metrics
+from services.rate_limit_service import rate_limiter
+
+metrics_routes = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+@metrics_routes.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Endpoint con las métricas del servidor en formato de texto de Prometheus: latencia y consultas a Mongo por ruta,
+    y duración de las consultas a Mongo. No requiere autenticación, para que lo pueda leer Prometheus.
+    :return: Las métricas en texto plano.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@metrics_routes.get("/rate_limits")
+def get_rate_limits(
+        limit: Optional[str] = Query(None),
+        size: int = Query(100),
+        token: str = Depends(oauth2_scheme)
+):
+    """
+    Endpoint para ver las IPs y usernames a los que más peticiones ha rechazado el limitador de este worker.
+    :param limit: Nombre del límite por el que filtrar (login_ip, login_username, register_ip o register_username).
+    :param size: Número máximo de claves a devolver.
+    :param token: Token del usuario.
+    :return: Lista con las peticiones permitidas y rechazadas de cada clave.
+    """
+    check_role(["ADMIN"], token)
+    return rate_limiter.get_counters(limit, max(size, 1))
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, Header
+from fastapi.security import OAuth2PasswordBearer
+from services.authentication_service import check_role_and_myself
+from services.purchase_service import PurchaseService
+from bson import ObjectId
+from typing import Optional
+from services.container import Lazy
+
+purchase_routes = APIRouter()
+purchase_service = Lazy(PurchaseService)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+@purchase_routes.get("/purchases/{user_id_str}")
+async def get_purchases_from_user(user_id_str: str, token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para obtener todas las compras de un usuario.
+    :param user_id_str: ID del usuario cuyas compras queremos buscar.
+    :param token: Token del usuario.
+    :return: Lista con las compras del usuario, o una Response de error.
+    """
+    check_role_and_myself(["ADMIN", "USER"], token, user_id_str)
+    return await purchase_service.get_purchases_from_user(ObjectId(user_id_str))
+
+
+@purchase_routes.post("/purchases/{user_id_str}")
+async def post_purchase(user_id_str: str, game_id_str: str,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                        token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para comprar un juego. Lo añade a la librería del usuario y lo quita de su lista de deseados.
+    Se puede reintentar con la misma cabecera Idempotency-Key sin que la compra se duplique.
+    :param user_id_str: ID del usuario que compra el juego.
+    :param game_id_str: ID del juego a comprar.
+    :param idempotency_key: Clave de idempotencia de la compra.
+    :param token: Token del usuario.
+    :return: La compra realizada (o la original, si ya existía), o una Response de error.
+    """
+    check_role_and_myself(["ADMIN", "USER"], token, user_id_str)
+    return await purchase_service.checkout(ObjectId(user_id_str), ObjectId(game_id_str), idempotency_key)
@@ -1,34 +1,42 @@
-from fastapi import APIRouter, Query, HTTPException, status, Depends
+from fastapi import APIRouter, Query, HTTPException, status, Depends, Request, Response
 from fastapi.security import OAuth2PasswordBearer
 from services.authentication_service import check_role, decode_access_token, check_role_and_myself
 from services.library_service import LibraryService
-from services.review_service import ReviewService
+from services.review_service import ReviewService, REVIEWS_PAGE_SIZE, REVIEWS_MAX_PAGE_SIZE
+from services.version_service import not_modified
 from dto.review_dto import ReviewDtoCreate, ReviewDtoUpdate
 from bson import ObjectId
 from typing import Optional
-import datetime
+from services.container import Lazy
 
 review_routes = APIRouter()
-review_service = ReviewService()
-library_service = LibraryService()
+review_service = Lazy(ReviewService)
+library_service = Lazy(LibraryService)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 @review_routes.get("/reviews")
 async def get_all_reviews(
+        response: Response,
         user_id: Optional[str] = Query(None),
         game_id: Optional[str] = Query(None),
         rating: Optional[float] = Query(None),
         publish_date: Optional[str] = Query(None),
+        page: int = Query(0, ge=0),
+        size: int = Query(REVIEWS_PAGE_SIZE, ge=1, le=REVIEWS_MAX_PAGE_SIZE),
         token: str = Depends(oauth2_scheme)
 ):
     """
     Endpoint para obtener todas las reviews, o si alguno de los filtros está presente,
     solo devolver aquellas reviews que cumplan con todos los filtros.
+    El número total de reviews que cumplen los filtros se devuelve en la cabecera X-Total-Count.
+    :param response: Respuesta, para añadirle la cabecera con el total.
     :param user_id: ID del usuario.
     :param game_id: ID del juego.
     :param rating: Rating mínimo.
     :param publish_date: Fecha de publicación mínima.
+    :param page: Número de página, empezando en 0.
+    :param size: Tamaño de la página, REVIEWS_PAGE_SIZE si no está y como mucho REVIEWS_MAX_PAGE_SIZE.
     :param token: Token del usuario.
     :return: Lista con todas las reviews que cumplan las condiciones establecidas.
     """
@@ -36,25 +44,11 @@ async def get_all_reviews(
     payload = decode_access_token(token)
     # De esta forma, la review del usuario que está solicitando este endpoint siempre será la primera
     # en mostrarse (si existe), y después estarán el resto de reviews ordenadas por fecha de publicación.
-    reviews = sorted(await review_service.get_all_reviews(), key=lambda r: r.user.id == payload["id"])
-
-    if user_id:  # and ObjectId(user_id):
-        # poniendo esta línea comentada arriba se asegura que solo entre si es un guid válido,
-        # pero podría llevar a casos inesperados como que si solo está el param user_id y es inválido,
-        # devuelva todas las reviews existentes.
-        reviews = [review for review in reviews if user_id == review.user.id]
-
-    if game_id:
-        reviews = [review for review in reviews if game_id == review.game.id]
-
-    if rating is not None:
-        reviews = [review for review in reviews if review.rating >= rating]
-
-    if publish_date:
-        publish_d = datetime.datetime.fromisoformat(publish_date)
-        reviews = [review for review in reviews if review.publish_date >= publish_d]
-
-    return reviews
+    # Tanto la ordenación como los filtros se hacen en la base de datos.
+    reviews_page = await review_service.get_all_reviews(ObjectId(payload["id"]), user_id, game_id, rating,
+                                                        publish_date, page, size)
+    response.headers["X-Total-Count"] = str(reviews_page.total)
+    return reviews_page.reviews
 
 
 @review_routes.get("/reviews/{review_id_str}")
@@ -84,15 +78,37 @@ async def get_reviews_from_user(user_id_str: str, token: str = Depends(oauth2_sc
 
 
 @review_routes.get("/reviews/game/{game_id_str}")
-async def get_reviews_from_game(game_id_str: str, token: str = Depends(oauth2_scheme)):
+async def get_reviews_from_game(game_id_str: str, request: Request, response: Response,
+                                token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener todas las reviews de un juego.
+    Devuelve un ETag, y un 304 sin consultar la base de datos si el cliente ya tiene la versión actual. Las reviews
+    muestran datos del juego y de sus usuarios, así que el ETag también cambia cuando cambian ellos.
     :param game_id_str: ID del juego cuyas reviews queremos buscar.
+    :param request: Petición, para leer la cabecera If-None-Match.
+    :param response: Respuesta, para añadirle el ETag.
     :param token: Token del usuario.
     :return: Todas las reviews del juego, o una Response de error.
     """
     check_role(["ADMIN", "USER"], token)
-    return await review_service.get_all_reviews_from_game(ObjectId(game_id_str))
+    game_id = ObjectId(game_id_str)
+    cached = not_modified(request, response, f"reviews:game:{game_id}", f"game:{game_id}", "users")
+    if cached:
+        return cached
+    return await review_service.get_all_reviews_from_game(game_id)
+
+
+@review_routes.get("/reviews/game/{game_id_str}/summary")
+async def get_review_summary_from_game(game_id_str: str, token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para obtener el resumen de las reviews de un juego: número de reviews, rating medio,
+    histograma de 0 a 5 estrellas y las reviews más recientes.
+    :param game_id_str: ID del juego cuyo resumen queremos obtener.
+    :param token: Token del usuario.
+    :return: El resumen de las reviews del juego, o una Response de error.
+    """
+    check_role(["ADMIN", "USER"], token)
+    return await review_service.get_review_summary_from_game(ObjectId(game_id_str))
 
 
 @review_routes.post("/reviews/")
@@ -4,12 +4,17 @@ from fastapi.security import OAuth2PasswordBearer
 from starlette import status
 from services.authentication_service import decode_access_token, check_role, check_role_and_myself
 from services.user_service import UserService
-from dto.user_dto import UserDtoCreate, UserDtoUpdate, UserDtoLogin
+from services.rate_limit_service import limit_login, limit_register
+from services.refresh_token_service import RefreshTokenService
+from dto.fields import parse_fields
+from dto.user_dto import UserDtoCreate, UserDtoUpdate, UserDtoLogin, UserDtoRefresh, USER_DTO_FIELDS
 from bson import ObjectId
-from typing import Optional
+from typing import Optional, List
+from services.container import Lazy
 
 user_routes = APIRouter()
-user_service = UserService()
+user_service = Lazy(UserService)
+refresh_token_service = Lazy(RefreshTokenService)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -24,30 +29,52 @@ def hello_world():
 
 
 @user_routes.get("/users")
-async def get_all_users(active: Optional[bool] = Query(None), token: str = Depends(oauth2_scheme)):
+async def get_all_users(active: Optional[bool] = Query(None), fields: Optional[str] = Query(None),
+                        token: str = Depends(oauth2_scheme)):
     """
     Endpoint para obtener todos los usuarios. Opcionalmente, admite filtrar por su actividad.
     :param active: Booleano para filtrar por la actividad de los usuarios.
+    :param fields: Campos de cada usuario a devolver, separados por comas. Si no está, se devuelven todos.
     :param token: Token del usuario.
     :return: Lista con todos los usuarios, o todos los que cumplan con el filtro.
     """
     check_role(["ADMIN"], token)
 
+    requested_fields = parse_fields(fields, USER_DTO_FIELDS)
+    if requested_fields is not None:
+        return await user_service.get_all_users_fields(requested_fields, active)
     if active is None:
         return await user_service.get_all_users()
     else:
         return await user_service.get_all_users_active(active)
 
 
+@user_routes.get("/users/batch")
+async def get_users_by_ids(ids: List[str] = Query(...), token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para obtener varios usuarios por su ID con una sola petición.
+    Tiene que estar antes de /users/{user_id_str}, o "batch" se tomaría por un ID.
+    :param ids: IDs de los usuarios, separados por comas o repitiendo el parámetro.
+    :param token: Token del usuario.
+    :return: Lista con una entrada por cada ID, en el mismo orden, con el usuario o con null si no existe.
+    """
+    check_role(["ADMIN", "USER"], token)
+    return await user_service.get_users_by_ids([user_id for value in ids for user_id in value.split(",") if user_id])
+
+
 @user_routes.get("/users/{user_id_str}")
-async def get_user_by_id(user_id_str: str, token: str = Depends(oauth2_scheme)):
+async def get_user_by_id(user_id_str: str, fields: Optional[str] = Query(None), token: str = Depends(oauth2_scheme)):
     """
     Endpoint para buscar un usuario por su ID.
     :param user_id_str: ID del usuario a buscar.
+    :param fields: Campos del usuario a devolver, separados por comas. Si no está, se devuelven todos.
     :param token: Token del usuario.
     :return: El usuario encontrado, o una Response de error.
     """
     check_role(["ADMIN", "USER"], token)
+    requested_fields = parse_fields(fields, USER_DTO_FIELDS)
+    if requested_fields is not None:
+        return await user_service.get_user_fields_by_id(ObjectId(user_id_str), requested_fields)
     return await user_service.get_user_by_id(ObjectId(user_id_str))
 
 
@@ -63,10 +90,10 @@ async def get_user_pfp_by_id(user_id_str: str, token: str = Depends(oauth2_schem
     return FileResponse(await user_service.get_user_pfp_by_id(ObjectId(user_id_str)))
 
 
-@user_routes.post("/register")
+@user_routes.post("/register", dependencies=[Depends(limit_register)])
 async def post_user(user: UserDtoCreate):
     """
-    Endpoint para registrar un nuevo usuario.
+    Endpoint para registrar un nuevo usuario. Está limitado por IP y por username.
     :param user: DTO con los datos necesarios para la creación del usuario.
     :return: El usuario creado y un token, o una Response de error.
     """
@@ -74,16 +101,39 @@ async def post_user(user: UserDtoCreate):
     return await user_service.create_user(user)
 
 
-@user_routes.post("/login")
+@user_routes.post("/login", dependencies=[Depends(limit_login)])
 async def login(user: UserDtoLogin):
     """
-    Endpoint de logado de usuarios.
+    Endpoint de logado de usuarios. Está limitado por IP y por username, y cuando se supera el límite
+    devuelve 429 sin llegar a comprobar la contraseña.
     :param user: DTO con las credenciales necesarias para el logado.
     :return: El usuario logado y un token, o una Response de error.
     """
     return await user_service.login(user)
 
 
+@user_routes.post("/refresh")
+async def refresh(refresh_token: UserDtoRefresh):
+    """
+    Endpoint para renovar el token de acceso. El refresh token usado deja de valer y se devuelve otro nuevo.
+    :param refresh_token: DTO con el refresh token.
+    :return: El usuario, un token de acceso y un refresh token nuevos, o una Response de error.
+    """
+    return await refresh_token_service.refresh(refresh_token.refresh_token)
+
+
+@user_routes.post("/logout")
+async def logout(refresh_token: UserDtoRefresh, token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint para cerrar la sesión. Revoca el refresh token (y los que se hayan obtenido rotándolo)
+    y el token de acceso.
+    :param refresh_token: DTO con el refresh token de la sesión.
+    :param token: Token del usuario.
+    :return: None.
+    """
+    await refresh_token_service.logout(refresh_token.refresh_token, decode_access_token(token))
+
+
 @user_routes.get("/me")
 async def read_users_me(token: str = Depends(oauth2_scheme)):
     """
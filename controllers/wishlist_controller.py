@@ -3,9 +3,10 @@ from fastapi.security import OAuth2PasswordBearer
 from services.authentication_service import check_role, check_role_and_myself
 from services.wishlist_service import WishlistService
 from bson import ObjectId
+from services.container import Lazy
 
 wishlist_routes = APIRouter()
-wishlist_service = WishlistService()
+wishlist_service = Lazy(WishlistService)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -45,9 +46,7 @@ async def wishlist_exists_by_id(user_id: str, game_id: str, token: str = Depends
     404 si la lista de deseados no existe, o un error de autenticación o autorización.
     """
     check_role_and_myself(["ADMIN", "USER"], token, user_id)
-    wishlist = await wishlist_service.get_wishlist_by_id(ObjectId(user_id))
-    game_exists = any(game.id.__str__() == game_id for game in wishlist.games)
-    return {"exists": game_exists}
+    return {"exists": await wishlist_service.is_in_wishlist(ObjectId(user_id), ObjectId(game_id))}
 
 
 @wishlist_routes.put("/wishlists/add_game/{wishlist_id_str}")
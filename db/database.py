@@ -1,17 +1,78 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from decouple import config
+from typing import Callable, Optional
+from services.metrics_service import mongo_command_listener
+
+# URL de Mongo. Con "mongomock://" se usa una base de datos en memoria (necesita el paquete mongomock-motor),
+# pensada para pruebas y benchmarks sin un mongod local.
+MONGO_URL = config("MONGO_URL", default="mongodb://localhost:27017")
+MONGO_DATABASE = config("MONGO_DATABASE", default="vgameshop_db")
+# Base de datos con el estado compartido entre los workers (elección de líder, contadores, etc.). Va aparte porque
+# la base de datos principal se borra y se vuelve a generar en cada despliegue.
+MONGO_META_DATABASE = config("MONGO_META_DATABASE", default=f"{MONGO_DATABASE}_meta")
+# Las transacciones solo están disponibles si Mongo se ejecuta como replica set o cluster.
+MONGO_TRANSACTIONS = config("MONGO_TRANSACTIONS", default=False, cast=bool)
+
+
+def create_client():
+    """
+    Función que crea el cliente de Mongo según la URL configurada.
+    :return: El cliente de Motor, o uno de mongomock-motor si la URL empieza por "mongomock://".
+    """
+    if MONGO_URL.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    return AsyncIOMotorClient(MONGO_URL, event_listeners=[mongo_command_listener])
+
+
+class LazyCollection:
+    """
+    Atributo de clase de los repositorios con su colección de Mongo. La colección (y el cliente de Mongo,
+    si todavía no existe) se crea la primera vez que se usa, no al importar el repositorio.
+    """
+
+    def __init__(self, get_database: Callable[[], AsyncIOMotorDatabase], name: str):
+        self.get_database = get_database
+        self.name = name
+        self.collection: Optional[AsyncIOMotorCollection] = None
+
+    def __get__(self, instance, owner) -> AsyncIOMotorCollection:
+        if self.collection is None:
+            self.collection = self.get_database()[self.name]
+        return self.collection
 
 
 class Database:
-    client: AsyncIOMotorClient = AsyncIOMotorClient("mongodb://localhost:27017")
-    database_name = "vgameshop_db"
-    database = client.get_database(database_name)
+    database_name = MONGO_DATABASE
+    meta_database_name = MONGO_META_DATABASE
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        # El cliente abre conexiones e hilos de monitorización al crearse, así que se crea al usarlo por primera vez.
+        if self._client is None:
+            self._client = create_client()
+        return self._client
+
+    def is_connected(self) -> bool:
+        return self._client is not None
+
+    def get_database(self) -> AsyncIOMotorDatabase:
+        return self.client.get_database(self.database_name)
+
+    def get_meta_database(self) -> AsyncIOMotorDatabase:
+        return self.client.get_database(self.meta_database_name)
+
+    def collection(self, name: str) -> LazyCollection:
+        return LazyCollection(self.get_database, name)
 
-    def get_database(self):
-        return self.database
+    def meta_collection(self, name: str) -> LazyCollection:
+        return LazyCollection(self.get_meta_database, name)
 
     async def init_database(self):
         await self.client.drop_database(self.database_name)
-        self.database = self.client.get_database(self.database_name)
 
 
 db = Database()
@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+import logging
+import time
+import uuid
+from typing import Dict, Hashable, Optional
+from bson import ObjectId
+from decouple import config
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from db.database import db, MONGO_URL
+from db.lru_cache import LRUCache
+from services.metrics_service import metrics, LATENCY_BUCKETS
+
+logger = logging.getLogger("vgameshop.invalidations")
+
+# Con "mongo", las invalidaciones de las cachés se mandan a todos los workers a través de una colección limitada
+# (capped) de Mongo; con "memory" solo se aplican en el worker que las hace, que es lo que hace falta con uno solo.
+INVALIDATION_BACKEND = config("INVALIDATION_BACKEND", default=config("SHARED_STATE_BACKEND", default="memory"))
+# Tamaño de la colección de invalidaciones. Las más antiguas se sobrescriben; si un worker se queda tan atrás que
+# pierde alguna, vacía todas sus cachés.
+INVALIDATION_LOG_BYTES = config("INVALIDATION_LOG_BYTES", default=16 * 1024 * 1024, cast=int)
+# Segundos que el servidor espera invalidaciones nuevas antes de responder a cada worker. Es el retraso máximo con el
+# que un worker ve una invalidación (si no se ha caído la conexión).
+INVALIDATION_AWAIT_SECONDS = config("INVALIDATION_AWAIT_SECONDS", default=1, cast=float)
+# Al volver a leer después de un corte, se empieza este número de segundos antes de la última invalidación leída,
+# porque los IDs que generan workers distintos no están perfectamente ordenados. Repetir una invalidación no importa.
+INVALIDATION_RESUME_OVERLAP_SECONDS = config("INVALIDATION_RESUME_OVERLAP_SECONDS", default=5, cast=float)
+INVALIDATION_RETRY_SECONDS = 1
+
+
+class InvalidationBus:
+    """
+    Reparte las invalidaciones de las cachés en memoria entre todos los workers. Cada invalidación se aplica enseguida
+    en el worker que la hace y se guarda en una colección limitada de Mongo, que los demás workers leen con un cursor
+    tailable: Mongo les manda cada invalidación nueva en cuanto se escribe.
+    """
+    collection = db.meta_collection("invalidation_routes")
+
+    def __init__(self):
+        self.caches: Dict[str, LRUCache] = {}
+        self.worker = uuid.uuid4().hex
+        # Hasta dónde se han leído las invalidaciones de los demás workers. Sirve de resume token si se corta la lectura.
+        self.resume_at: Optional[datetime.datetime] = None
+
+    def register(self, cache: LRUCache) -> LRUCache:
+        """
+        Función para que las invalidaciones de una caché lleguen a todos los workers. Además de un LRUCache, puede ser
+        cualquier objeto con name, invalidate(key) y clear().
+        :param cache: Caché.
+        :return: La misma caché.
+        """
+        self.caches[cache.name] = cache
+        return cache
+
+    def replay_since(self, at: datetime.datetime):
+        """
+        Función para que, al arrancar, el bus aplique también las invalidaciones hechas desde un momento anterior,
+        por ejemplo, desde que se guardó un dato que se ha cargado de un archivo. Se llama antes de run().
+        :param at: Momento desde el que aplicar las invalidaciones.
+        """
+        self.resume_at = at if self.resume_at is None else min(self.resume_at, at)
+
+    def is_shared(self) -> bool:
+        return INVALIDATION_BACKEND == "mongo" and not MONGO_URL.startswith("mongomock://")
+
+    async def invalidate(self, cache: LRUCache, key: Hashable):
+        """
+        Función para borrar una clave de una caché en todos los workers. En este worker se borra enseguida,
+        y en los demás en cuanto lean la invalidación.
+        :param cache: Caché.
+        :param key: Clave a borrar. Se guarda en Mongo, así que tiene que ser un tipo que se pueda guardar en BSON.
+        """
+        cache.invalidate(key)
+        await self.publish(cache, key)
+
+    async def publish(self, cache: LRUCache, key: Optional[Hashable]):
+        """
+        Función para mandar una invalidación solo a los demás workers, cuando este ya la ha aplicado.
+        :param cache: Caché.
+        :param key: Clave a borrar, o None para vaciar la caché entera.
+        """
+        if self.is_shared():
+            await self.collection.insert_one({"cache": cache.name, "key": key, "worker": self.worker,
+                                              "at": time.time()})
+
+    async def ensure_collection(self):
+        """
+        Función para crear la colección limitada de invalidaciones, si todavía no existe. Se crea con un primer
+        documento vacío: así el cursor no se cierra por estar vacía, y si ese documento desaparece es porque la
+        colección ya ha empezado a sobrescribir invalidaciones.
+        """
+        try:
+            await self.collection.database.create_collection(self.collection.name, capped=True,
+                                                             size=INVALIDATION_LOG_BYTES)
+        except CollectionInvalid:
+            return
+        await self.collection.insert_one({"cache": None, "key": None, "worker": self.worker, "at": time.time()})
+
+    def apply(self, document: dict):
+        self.resume_at = max(self.resume_at, document["_id"].generation_time)
+        if document["worker"] == self.worker or document["cache"] is None:
+            return
+        cache = self.caches.get(document["cache"])
+        if cache is not None and document["key"] is None:
+            cache.clear()
+        elif cache is not None:
+            cache.invalidate(document["key"])
+        metrics.inc("cache_invalidations_received_total", "Cache invalidations received from other workers.",
+                    cache=document["cache"])
+        metrics.observe("cache_invalidation_lag_seconds", "Delay until a worker applies another worker's invalidation.",
+                        LATENCY_BUCKETS, max(time.time() - document["at"], 0))
+
+    async def check_gap(self):
+        """
+        Función que comprueba si se han sobrescrito invalidaciones que este worker todavía no había leído.
+        Si es así, no se sabe qué claves han cambiado, así que se vacían todas las cachés.
+        """
+        oldest = await self.collection.find_one({}, sort=[("$natural", 1)])
+        if oldest is not None and oldest["_id"].generation_time > self.resume_at:
+            for cache in self.caches.values():
+                cache.clear()
+            metrics.inc("cache_invalidation_gaps_total", "Times a worker missed invalidations and cleared its caches.")
+
+    async def run(self):
+        """
+        Función que lee las invalidaciones de los demás workers y las aplica, hasta que se cancele.
+        Si la lectura se corta, se retoma donde se quedó.
+        """
+        if not self.is_shared():
+            return
+        await self.ensure_collection()
+        # Al arrancar, las cachés están vacías, así que solo interesan las invalidaciones a partir de ahora
+        # (o desde antes, si algún dato se ha cargado de un archivo).
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.resume_at = now if self.resume_at is None else min(self.resume_at, now)
+        while True:
+            try:
+                await self.check_gap()
+                start = self.resume_at - datetime.timedelta(seconds=INVALIDATION_RESUME_OVERLAP_SECONDS)
+                first_id = ObjectId.from_datetime(start)
+                # Un cursor tailable que no encuentra nada al abrirse se cierra, así que se empieza como tarde en la
+                # última invalidación guardada, aunque sea antigua, y se ignoran las anteriores al punto de partida.
+                newest = await self.collection.find_one({}, sort=[("$natural", -1)])
+                if newest is not None:
+                    first_id = min(first_id, newest["_id"])
+                cursor = self.collection.find({"_id": {"$gte": first_id}}, cursor_type=CursorType.TAILABLE_AWAIT,
+                                              max_await_time_ms=int(INVALIDATION_AWAIT_SECONDS * 1000))
+                while cursor.alive:
+                    async for document in cursor:
+                        if document["_id"].generation_time >= start:
+                            self.apply(document)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Exception while reading cache invalidations")
+            # El cursor se cierra si la colección está vacía o se ha perdido la conexión.
+            await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from services.metrics_service import metrics
+
+
+class LRUCache:
+    """
+    Caché en memoria con un tamaño máximo: cuando se llena, se olvida la entrada usada hace más tiempo.
+    Las entradas además caducan a los ttl segundos, porque los otros workers no se enteran de las invalidaciones.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Número de invalidaciones hechas. Sirve para no guardar un valor leído de la base de datos antes de una
+        # invalidación, que ya estaría desactualizado.
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            metrics.inc("cache_requests_total", "Requests to the in-memory caches.", cache=self.name, result="miss")
+            return None
+        self.entries.move_to_end(key)
+        metrics.inc("cache_requests_total", "Requests to the in-memory caches.", cache=self.name, result="hit")
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, invalidations: Optional[int] = None):
+        """
+        Función para guardar un valor en la caché.
+        :param key: Clave.
+        :param value: Valor.
+        :param invalidations: Valor de self.invalidations antes de leer el valor. Si desde entonces ha habido alguna
+        invalidación, el valor no se guarda.
+        """
+        if invalidations is not None and invalidations != self.invalidations:
+            return
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self.invalidations += 1
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.invalidations += 1
+        self.entries.clear()
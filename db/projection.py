@@ -0,0 +1,13 @@
+from typing import Iterable
+
+
+def projection(fields: Iterable[str]) -> dict:
+    """
+    Función para construir la proyección de Mongo que lee solo los campos indicados (y siempre el ID).
+    :param fields: Campos del documento a leer.
+    :return: Diccionario con la proyección.
+    """
+    result = {"_id": 0, "id": 1}
+    for field in fields:
+        result[field] = 1
+    return result
@@ -0,0 +1,22 @@
+from fastapi import HTTPException, status
+from typing import List, Optional
+
+
+def parse_fields(fields: Optional[str], allowed_fields: List[str]) -> Optional[List[str]]:
+    """
+    Función para leer el parámetro fields de una petición, con los campos del DTO que quiere el cliente.
+    :param fields: Nombres de los campos separados por comas, o None si el cliente quiere todos.
+    :param allowed_fields: Campos del DTO.
+    :return: Lista con los campos pedidos, en el orden del DTO, None si se quieren todos,
+    o 400 si alguno no existe.
+    """
+    if fields is None or not fields.strip():
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(allowed_fields)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown fields: {', '.join(sorted(unknown))}. "
+                                   f"Allowed fields: {', '.join(allowed_fields)}.")
+    return [field for field in allowed_fields if field in requested]
+
@@ -2,8 +2,9 @@ from bson import ObjectId
 from pydantic import BaseModel, SkipValidation
 from fastapi import HTTPException, status
 import datetime
-from typing import Set, Optional
+from typing import List, Set, Optional
 from model.game import Genre, Language, Game, transform_genres, transform_languages
+from model.review_summary import summary_rating
 from repositories.review_repository import ReviewRepository
 
 
@@ -25,11 +26,24 @@ class GameDto(BaseModel):
     @classmethod
     async def from_game(cls, game: Game, review_repository: ReviewRepository):
         reviews = await review_repository.get_reviews_from_game(game.id)
-        rating = 0
+        rating = summary_rating(len(reviews), sum(review.rating for review in reviews))
+        return GameDto.from_game_and_rating(game, rating)
 
-        if reviews:
-            rating = round(sum(review.rating for review in reviews) / len(reviews), 2)
+    @classmethod
+    def fields_from_document(cls, document: dict, rating: float, fields: List[str]) -> dict:
+        """
+        Función para construir solo los campos pedidos del DTO a partir de un documento de Mongo leído con una
+        proyección, sin crear el juego entero.
+        :param document: Documento del juego, con al menos el ID y los campos pedidos.
+        :param rating: Rating medio del juego.
+        :param fields: Campos del DTO que se quieren.
+        :return: Diccionario con los campos pedidos, listo para devolverlo como JSON.
+        """
+        values = {**document, "id": str(document["id"]), "rating": rating}
+        return {field: values.get(field) for field in fields}
 
+    @classmethod
+    def from_game_and_rating(cls, game: Game, rating: float):
         return GameDto(
             id=str(game.id),
             name=game.name,
@@ -50,6 +64,10 @@ class GameDto(BaseModel):
         arbitrary_types_allowed = True
 
 
+# Campos que se pueden pedir con el parámetro fields. El rating no está en los juegos: se calcula con sus reviews.
+GAME_DTO_FIELDS = list(GameDto.model_fields)
+
+
 class GameDtoShort(BaseModel):
     id: str
     name: str
@@ -62,11 +80,11 @@ class GameDtoShort(BaseModel):
     @classmethod
     async def from_game(cls, game: Game, review_repository: ReviewRepository):
         reviews = await review_repository.get_reviews_from_game(game.id)
-        rating = 0
-
-        if reviews:
-            rating = round(sum(review.rating for review in reviews) / len(reviews), 2)
+        rating = summary_rating(len(reviews), sum(review.rating for review in reviews))
+        return GameDtoShort.from_game_and_rating(game, rating)
 
+    @classmethod
+    def from_game_and_rating(cls, game: Game, rating: float):
         return GameDtoShort(
             id=str(game.id),
             name=game.name,
@@ -78,6 +96,36 @@ class GameDtoShort(BaseModel):
         )
 
 
+class GameDtoBatchEntry(BaseModel):
+    # ID tal y como se pidió, y el juego, o None si no existe.
+    id: str
+    game: Optional[GameDto]
+
+
+class GameDtoTopSeller(BaseModel):
+    id: str
+    name: str
+    developer: str
+    publisher: str
+    rating: float
+    description: str
+    price: float
+    sell_number: int
+
+    @classmethod
+    def from_ranking_entry(cls, entry: dict):
+        return GameDtoTopSeller(
+            id=str(entry["id"]),
+            name=entry["name"],
+            developer=entry["developer"],
+            publisher=entry["publisher"],
+            rating=entry["rating"],
+            description=entry["description"],
+            price=entry["price"],
+            sell_number=entry["sell_number"]
+        )
+
+
 class GameDtoCreate(BaseModel):
     name: str
     developer: str
@@ -217,3 +265,8 @@ class GameDtoUpdate(BaseModel):
             game_showcase_images=game.game_showcase_images,
             visible=game.visible
         )
+
+    def to_game_data(self, game: Game) -> dict:
+        # Solo se guardan los campos editables: el número de ventas lo suma la consolidación de ventas mientras tanto.
+        return self.to_game(game).dict(include={"name", "developer", "publisher", "genres", "languages",
+                                                "description", "price"})
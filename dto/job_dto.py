@@ -0,0 +1,31 @@
+from typing import Optional
+from pydantic import BaseModel, SkipValidation
+import datetime
+from model.job import Job, JobStatus
+
+
+class JobDto(BaseModel):
+    id: str
+    type: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    error: Optional[str]
+    created_at: SkipValidation[datetime]
+    finished_at: Optional[SkipValidation[datetime]]
+
+    @classmethod
+    def from_job(cls, job: Job):
+        return JobDto(
+            id=str(job.id),
+            type=job.type,
+            status=job.status,
+            attempts=job.attempts,
+            max_attempts=job.max_attempts,
+            error=job.error,
+            created_at=job.created_at,
+            finished_at=job.finished_at
+        )
+
+    class Config:
+        arbitrary_types_allowed = True
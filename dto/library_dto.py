@@ -1,3 +1,4 @@
+import asyncio
 from pydantic import BaseModel
 from model.library import Library
 from dto.game_dto import GameDtoShort
@@ -12,16 +13,18 @@ class LibraryDto(BaseModel):
 
     @classmethod
     async def from_library(cls, library: Library, user_service: UserService, game_service: GameService):
-        games: [GameDtoShort] = []
-        for game_id in library.game_ids:
-            game_to_add = await game_service.get_game_by_id_short(game_id)
-            if game_to_add is not None:
-                games.append(game_to_add)
-
+        user, games = await asyncio.gather(user_service.get_user_by_id_short(library.id),
+                                           game_service.get_games_by_ids_short(library.game_ids))
         return LibraryDto(
-            user=await user_service.get_user_by_id_short(library.id),
+            user=user,
             games=games
         )
 
     class Config:
         arbitrary_types_allowed = True
+
+
+class LibraryGameFlagsDto(BaseModel):
+    game_id: str
+    owned: bool
+    wishlisted: bool
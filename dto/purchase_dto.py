@@ -0,0 +1,24 @@
+from pydantic import BaseModel, SkipValidation
+import datetime
+from model.purchase import Purchase
+
+
+class PurchaseDto(BaseModel):
+    id: str
+    user_id: str
+    game_id: str
+    price: float
+    purchase_date: SkipValidation[datetime]
+
+    @classmethod
+    def from_purchase(cls, purchase: Purchase):
+        return PurchaseDto(
+            id=str(purchase.id),
+            user_id=str(purchase.user_id),
+            game_id=str(purchase.game_id),
+            price=purchase.price,
+            purchase_date=purchase.purchase_date
+        )
+
+    class Config:
+        arbitrary_types_allowed = True
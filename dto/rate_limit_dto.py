@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class RateLimitCounterDto(BaseModel):
+    limit: str
+    key: str
+    allowed: int
+    rejected: int
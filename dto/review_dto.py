@@ -8,7 +8,7 @@ from model.review import Review
 from repositories.game_repository import GameRepository
 from repositories.review_repository import ReviewRepository
 from repositories.user_repository import UserRepository
-from typing import Optional
+from typing import Optional, List
 
 
 class ReviewDto(BaseModel):
@@ -23,7 +23,7 @@ class ReviewDto(BaseModel):
     async def from_review(cls, review: Review, user_repository: UserRepository, game_repository: GameRepository,
                           review_repository: ReviewRepository):
         game_model = await game_repository.get_game_by_id(review.game_id)
-        user_model = await user_repository.get_user_by_id(review.user_id)
+        user_model = await user_repository.get_user_summary_by_id(review.user_id)
         return ReviewDto(
             id=str(review.id),
             game=await GameDtoShort.from_game(game_model, review_repository),
@@ -33,10 +33,59 @@ class ReviewDto(BaseModel):
             description=review.description
         )
 
+    @classmethod
+    def from_review_game_and_user(cls, review: Review, game: GameDtoShort, user: UserDtoShort):
+        return ReviewDto(
+            id=str(review.id),
+            game=game,
+            user=user,
+            publish_date=review.publish_date,
+            rating=review.rating,
+            description=review.description
+        )
+
+    @classmethod
+    def from_aggregate(cls, document: dict):
+        """
+        Función para construir el DTO a partir de un documento de review que ya trae su usuario y su juego
+        resueltos por el pipeline de agregación del repositorio.
+        :param document: Documento de la review con los campos "user" y "game".
+        :return: El DTO de la review.
+        """
+        game = document["game"]
+        user = document["user"]
+        return ReviewDto(
+            id=str(document["id"]),
+            game=GameDtoShort(
+                id=str(game["id"]),
+                name=game["name"],
+                developer=game["developer"],
+                publisher=game["publisher"],
+                rating=game["rating"],
+                description=game["description"],
+                price=game["price"]
+            ),
+            user=UserDtoShort(
+                id=str(user["id"]),
+                name=user["name"],
+                surname=user["surname"],
+                username=user["username"],
+                email=user["email"]
+            ),
+            publish_date=document["publish_date"],
+            rating=document["rating"],
+            description=document["description"]
+        )
+
     class Config:
         arbitrary_types_allowed = True
 
 
+class ReviewDtoPage(BaseModel):
+    total: int
+    reviews: List[ReviewDto]
+
+
 class ReviewDtoCreate(BaseModel):
     game_id: str
     user_id: str
@@ -100,6 +149,7 @@ class ReviewDtoUpdate(BaseModel):
             id=review.id,
             game_id=review.game_id,
             user_id=review.user_id,
+            publish_date=review.publish_date,
             rating=self.rating,
             description=self.description
         )
@@ -0,0 +1,50 @@
+from bson import ObjectId
+from pydantic import BaseModel, SkipValidation
+import datetime
+from typing import List, Optional
+from model.review_summary import ReviewSummary, ReviewSummaryEntry, summary_rating
+
+
+class ReviewSummaryEntryDto(BaseModel):
+    id: str
+    user_id: str
+    username: str
+    publish_date: SkipValidation[datetime]
+    rating: float
+    description: str
+
+    @classmethod
+    def from_entry(cls, entry: ReviewSummaryEntry):
+        return ReviewSummaryEntryDto(
+            id=str(entry.id),
+            user_id=str(entry.user_id),
+            username=entry.username,
+            publish_date=entry.publish_date,
+            rating=entry.rating,
+            description=entry.description
+        )
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class ReviewSummaryDto(BaseModel):
+    game_id: str
+    count: int
+    rating: float
+    histogram: List[int]
+    recent_reviews: List[ReviewSummaryEntryDto]
+
+    @classmethod
+    def from_summary(cls, game_id: ObjectId, summary: Optional[ReviewSummary]):
+        # Si el juego todavía no tiene reviews, no existe su resumen, y devolvemos uno vacío.
+        if summary is None:
+            summary = ReviewSummary(id=game_id)
+
+        return ReviewSummaryDto(
+            game_id=str(game_id),
+            count=summary.count,
+            rating=summary_rating(summary.count, summary.rating_sum),
+            histogram=[summary.histogram.get(str(stars), 0) for stars in range(6)],
+            recent_reviews=[ReviewSummaryEntryDto.from_entry(entry) for entry in summary.recent_reviews]
+        )
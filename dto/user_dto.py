@@ -1,10 +1,10 @@
 from bson import ObjectId
 from pydantic import BaseModel, EmailStr, SkipValidation
 from fastapi import HTTPException, status
-from typing import Optional
+from typing import List, Optional, Union
 import datetime
 from services.cipher_service import encode
-from model.user import Role, User
+from model.user import Role, User, UserSummary
 
 
 class UserDto(BaseModel):
@@ -30,10 +30,32 @@ class UserDto(BaseModel):
             active=user.active
         )
 
+    @classmethod
+    def fields_from_document(cls, document: dict, fields: List[str]) -> dict:
+        """
+        Función para construir solo los campos pedidos del DTO a partir de un documento de Mongo leído con una
+        proyección, sin crear el usuario entero.
+        :param document: Documento del usuario, con al menos el ID y los campos pedidos.
+        :param fields: Campos del DTO que se quieren.
+        :return: Diccionario con los campos pedidos, listo para devolverlo como JSON.
+        """
+        values = {**document, "id": str(document["id"])}
+        return {field: values.get(field) for field in fields}
+
     class Config:
         arbitrary_types_allowed = True
 
 
+# Campos que se pueden pedir con el parámetro fields.
+USER_DTO_FIELDS = list(UserDto.model_fields)
+
+
+class UserDtoBatchEntry(BaseModel):
+    # ID tal y como se pidió, y el usuario, o None si no existe.
+    id: str
+    user: Optional[UserDto]
+
+
 class UserDtoShort(BaseModel):
     id: str
     name: str
@@ -42,7 +64,7 @@ class UserDtoShort(BaseModel):
     email: EmailStr
 
     @classmethod
-    async def from_user(cls, user: User):
+    async def from_user(cls, user: Union[User, UserSummary]):
         return UserDtoShort(
             id=str(user.id),
             name=user.name,
@@ -55,6 +77,11 @@ class UserDtoShort(BaseModel):
 class UserDtoToken(BaseModel):
     user: UserDto
     token: str
+    refresh_token: str
+
+
+class UserDtoRefresh(BaseModel):
+    refresh_token: str
 
 
 class UserDtoLogin(BaseModel):
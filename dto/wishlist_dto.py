@@ -1,3 +1,4 @@
+import asyncio
 from pydantic import BaseModel
 from model.wishlist import Wishlist
 from dto.game_dto import GameDtoShort
@@ -12,14 +13,10 @@ class WishlistDto(BaseModel):
 
     @classmethod
     async def from_wishlist(cls, wishlist: Wishlist, user_service: UserService, game_service: GameService):
-        games: [GameDtoShort] = []
-        for game_id in wishlist.game_ids:
-            game_to_add = await game_service.get_game_by_id_short(game_id)
-            if game_to_add is not None:
-                games.append(game_to_add)
-
+        user, games = await asyncio.gather(user_service.get_user_by_id_short(wishlist.id),
+                                           game_service.get_games_by_ids_short(wishlist.game_ids))
         return WishlistDto(
-            user=await user_service.get_user_by_id_short(wishlist.id),
+            user=user,
             games=games
         )
 
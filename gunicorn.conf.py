@@ -0,0 +1,16 @@
+import os
+import uuid
+from decouple import config
+
+# Configuración para arrancar la aplicación con gunicorn, en lugar de con __main__.py:
+#   gunicorn app:app
+# Igual que en __main__.py, los workers heredan el ID del despliegue y usan Mongo como estado compartido.
+os.environ.setdefault("DEPLOYMENT_ID", uuid.uuid4().hex)
+
+bind = f"{config('HOST', default='127.0.0.1')}:{config('PORT', default=80, cast=int)}"
+workers = config("WEB_WORKERS", default=os.cpu_count() or 1, cast=int)
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = config("GRACEFUL_SHUTDOWN_SECONDS", default=30, cast=int)
+
+if workers > 1:
+    os.environ.setdefault("SHARED_STATE_BACKEND", "mongo")
@@ -0,0 +1,273 @@
+import hashlib
+import time
+import zlib
+from typing import List, Optional
+from decouple import config, Csv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from db.lru_cache import LRUCache
+from services.metrics_service import metrics, LATENCY_BUCKETS
+
+# brotli y zstandard son opcionales: si no están instalados, solo se comprime con gzip.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Las respuestas más pequeñas se envían sin comprimir: la cabecera de compresión casi no ahorra nada y cuesta CPU.
+COMPRESSION_MIN_BYTES = config("COMPRESSION_MIN_BYTES", default=1024, cast=int)
+# Tamaño máximo de cada trozo comprimido de las respuestas que se envían por partes.
+COMPRESSION_CHUNK_BYTES = config("COMPRESSION_CHUNK_BYTES", default=64 * 1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config("COMPRESSION_BROTLI_QUALITY", default=5, cast=int)
+COMPRESSION_ZSTD_LEVEL = config("COMPRESSION_ZSTD_LEVEL", default=3, cast=int)
+# Rutas del catálogo cuyas respuestas comprimidas se guardan, por si se vuelve a enviar el mismo contenido.
+COMPRESSION_CACHE_PATHS = config("COMPRESSION_CACHE_PATHS", default="/games,/genres,/languages,/reviews",
+                                 cast=Csv())
+COMPRESSION_CACHE_SIZE = config("COMPRESSION_CACHE_SIZE", default=256, cast=int)
+COMPRESSION_CACHE_TTL_SECONDS = config("COMPRESSION_CACHE_TTL_SECONDS", default=300, cast=float)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+
+class GzipStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def sync(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """
+    Función que devuelve las codificaciones que se pueden usar, de la preferida a la menos preferida.
+    :return: Lista de codificaciones.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Función que elige la codificación de la respuesta según la cabecera Accept-Encoding de la petición.
+    Entre las que acepta el cliente, se queda con la de mayor q, y a igualdad, con la preferida por el servidor.
+    :param accept_encoding: Valor de la cabecera.
+    :return: La codificación elegida, o None si no se puede comprimir.
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    """
+    Función para comprimir un cuerpo entero.
+    :param encoding: Codificación.
+    :param data: Cuerpo sin comprimir.
+    :return: Cuerpo comprimido.
+    """
+    stream = create_stream(encoding)
+    return stream.compress(data) + stream.finish()
+
+
+def create_stream(encoding: str):
+    """
+    Función que crea un compresor para comprimir una respuesta por partes.
+    :param encoding: Codificación.
+    :return: Compresor de la codificación.
+    """
+    if encoding == "zstd":
+        return ZstdStream()
+    if encoding == "br":
+        return BrotliStream()
+    return GzipStream()
+
+
+def split_chunks(data: bytes) -> List[bytes]:
+    return [data[start:start + COMPRESSION_CHUNK_BYTES] for start in range(0, len(data), COMPRESSION_CHUNK_BYTES)]
+
+
+class CompressionMiddleware:
+    """
+    Middleware que comprime las respuestas de texto y JSON con la mejor codificación que acepte el cliente
+    (zstd, brotli o gzip). Las respuestas del catálogo, que se repiten mucho, se comprimen una vez y se guardan
+    comprimidas, indexadas por el hash de su contenido.
+    """
+    compressed_cache = LRUCache("compressed_responses", COMPRESSION_CACHE_SIZE, COMPRESSION_CACHE_TTL_SECONDS)
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        cacheable = scope["method"] == "GET" and any(scope["path"].startswith(path)
+                                                     for path in COMPRESSION_CACHE_PATHS)
+        responder = CompressionResponder(encoding, cacheable, self.compressed_cache, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """
+    Envoltorio del send de una petición, que comprime la respuesta que pasa por él.
+    """
+
+    def __init__(self, encoding: Optional[str], cacheable: bool, cache: LRUCache, send: Send):
+        self.encoding = encoding
+        self.cacheable = cacheable
+        self.cache = cache
+        self.next_send = send
+        self.start_message: Optional[Message] = None
+        # None hasta que llega el primer trozo del cuerpo; después, si se comprime o no.
+        self.compressing: Optional[bool] = None
+        self.stream = None
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self.next_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressing is None:
+            headers = MutableHeaders(raw=list(self.start_message.get("headers", [])))
+            self.compressing = self.should_compress(headers, body, more_body)
+            if self.compressing or self.is_compressible(headers):
+                headers.add_vary_header("Accept-Encoding")
+            if not self.compressing:
+                self.start_message["headers"] = headers.raw
+                await self.next_send(self.start_message)
+                await self.next_send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            if not more_body:
+                # El cuerpo entero ha llegado en un solo mensaje: se comprime de una vez.
+                compressed = self.compress_body(body)
+                headers["Content-Length"] = str(len(compressed))
+                self.start_message["headers"] = headers.raw
+                await self.next_send(self.start_message)
+                await self.next_send({"type": "http.response.body", "body": compressed})
+                return
+            del headers["Content-Length"]
+            self.start_message["headers"] = headers.raw
+            await self.next_send(self.start_message)
+            self.stream = create_stream(self.encoding)
+        elif not self.compressing:
+            await self.next_send(message)
+            return
+
+        # Cada trozo se vacía del compresor al recibirlo, para que el cliente no tenga que esperar al final.
+        start = time.perf_counter()
+        compressed = self.stream.compress(body) + (self.stream.sync() if more_body else self.stream.finish())
+        self.record(len(body), len(compressed), time.perf_counter() - start)
+        chunks = split_chunks(compressed)
+        for chunk in chunks:
+            await self.next_send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if not more_body:
+            await self.next_send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def is_compressible(self, headers: MutableHeaders) -> bool:
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(compressible) for compressible in COMPRESSIBLE_TYPES)
+
+    def should_compress(self, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if self.encoding is None or "content-encoding" in headers or self.start_message["status"] in (204, 304):
+            return False
+        if not self.is_compressible(headers):
+            return False
+        # Si la respuesta llega por partes no se sabe su tamaño total, así que se comprime siempre.
+        return more_body or len(body) >= COMPRESSION_MIN_BYTES
+
+    def compress_body(self, body: bytes) -> bytes:
+        """
+        Función que comprime un cuerpo entero. Si la respuesta es del catálogo, busca antes si ya se comprimió
+        ese mismo contenido, y si no, guarda el resultado.
+        :param body: Cuerpo sin comprimir.
+        :return: Cuerpo comprimido.
+        """
+        key = None
+        if self.cacheable:
+            key = (hashlib.blake2b(body, digest_size=16).digest(), self.encoding)
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                self.record(len(body), len(compressed), 0)
+                return compressed
+        start = time.perf_counter()
+        compressed = compress(self.encoding, body)
+        self.record(len(body), len(compressed), time.perf_counter() - start)
+        if key is not None:
+            self.cache.set(key, compressed)
+        return compressed
+
+    def record(self, original_bytes: int, compressed_bytes: int, seconds: float):
+        metrics.inc("compression_bytes_total", "Response bytes before and after compression.", original_bytes,
+                    encoding=self.encoding, stage="original")
+        metrics.inc("compression_bytes_total", "Response bytes before and after compression.", compressed_bytes,
+                    encoding=self.encoding, stage="compressed")
+        if seconds:
+            metrics.observe("compression_duration_seconds", "Time spent compressing response bodies.",
+                            LATENCY_BUCKETS, seconds, encoding=self.encoding)
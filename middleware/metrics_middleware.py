@@ -0,0 +1,54 @@
+import time
+from decouple import config
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics_service import (metrics, current_request_stats, RequestStats, LATENCY_BUCKETS,
+                                      ROUND_TRIP_BUCKETS)
+
+# Si está activado, cada respuesta lleva una cabecera con el número de consultas a Mongo que ha necesitado.
+METRICS_HEADERS = config("METRICS_HEADERS", default=False, cast=bool)
+
+
+class MetricsMiddleware:
+    """
+    Middleware que mide la latencia de cada petición y el número de consultas a Mongo que necesita,
+    agrupándolas por la ruta (la plantilla, no la URL concreta) que la ha atendido.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_metrics(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if METRICS_HEADERS:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-db-round-trips", str(stats.round_trips).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request_stats.reset(token)
+            # El router guarda en el scope la ruta que ha atendido la petición. Si no hay, no agrupamos por la URL
+            # para no crear una serie por cada URL distinta.
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            metrics.observe("http_request_duration_seconds", "Latency of the HTTP requests.", LATENCY_BUCKETS,
+                            time.perf_counter() - start, method=method, route=path)
+            metrics.observe("http_request_db_round_trips", "MongoDB round-trips needed by each HTTP request.",
+                            ROUND_TRIP_BUCKETS, stats.round_trips, method=method, route=path)
+            metrics.inc("http_requests_total", "Number of HTTP requests.", method=method, route=path,
+                        status=str(status_code))
@@ -0,0 +1,38 @@
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel, SkipValidation, Field
+from bson import ObjectId
+import datetime
+
+
+class JobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class Job(BaseModel):
+    id: ObjectId
+    # Tipo de tarea, que decide qué función la ejecuta.
+    type: str
+    payload: dict = Field(default_factory=dict)
+    status: JobStatus = Field(default=JobStatus.PENDING)
+    attempts: int = Field(default=0)
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: SkipValidation[datetime] = Field(default_factory=datetime.datetime.utcnow)
+    # Cuándo se puede ejecutar la tarea. Tras un fallo se retrasa para reintentarla más tarde.
+    run_at: SkipValidation[datetime] = Field(default_factory=datetime.datetime.utcnow)
+    # Mientras se ejecuta, hasta cuándo es del worker que la cogió. Si el worker muere, pasado este momento
+    # otro worker la vuelve a coger.
+    locked_until: Optional[SkipValidation[datetime]] = None
+    # Identifica cada vez que se coge la tarea. El worker solo puede renovarla y guardar su resultado si sigue
+    # siendo el mismo, es decir, si nadie la ha vuelto a coger.
+    lock_id: Optional[ObjectId] = None
+    finished_at: Optional[SkipValidation[datetime]] = None
+    # Las tareas terminadas las borra Mongo pasado este momento.
+    expires_at: Optional[SkipValidation[datetime]] = None
+
+    class Config:
+        arbitrary_types_allowed = True
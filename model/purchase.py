@@ -0,0 +1,17 @@
+from pydantic import BaseModel, SkipValidation, Field
+from bson import ObjectId
+import datetime
+
+
+class Purchase(BaseModel):
+    id: ObjectId
+    user_id: ObjectId
+    game_id: ObjectId
+    price: float
+    idempotency_key: str
+    # Si la venta ya está sumada a los contadores de ventas. Las compras sin sumar las cuenta la consolidación.
+    counted: bool = False
+    purchase_date: SkipValidation[datetime] = Field(default_factory=datetime.datetime.now)
+
+    class Config:
+        arbitrary_types_allowed = True
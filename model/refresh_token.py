@@ -0,0 +1,18 @@
+from pydantic import BaseModel, SkipValidation
+from bson import ObjectId
+import datetime
+
+
+class RefreshToken(BaseModel):
+    id: ObjectId
+    # Solo se guarda el hash del token, así que quien lea la base de datos no puede usar los tokens.
+    token_hash: str
+    user_id: ObjectId
+    # Todos los tokens que salen de rotar uno mismo comparten familia. Si se reutiliza un token ya rotado,
+    # se revoca la familia entera.
+    family_id: str
+    used: bool = False
+    expires_at: SkipValidation[datetime]
+
+    class Config:
+        arbitrary_types_allowed = True
@@ -0,0 +1,53 @@
+from pydantic import BaseModel, SkipValidation, Field
+from bson import ObjectId
+from typing import Dict, List
+import datetime
+
+# Número de reviews más recientes que se guardan dentro del resumen de cada juego.
+RECENT_REVIEWS_SIZE = 5
+
+
+def rating_bucket(rating: float) -> str:
+    """
+    Función que devuelve la posición del histograma (de 0 a 5 estrellas) en la que cae un rating.
+    Se guarda como string porque es la clave del documento del histograma en Mongo.
+    :param rating: Rating de la review, ya acotado entre 0 y 5.
+    :return: String con el número de estrellas redondeado.
+    """
+    return str(min(5, max(0, int(rating + 0.5))))
+
+
+def summary_rating(count: int, rating_sum: float) -> float:
+    """
+    Función que calcula el rating medio de un juego a partir del número de reviews y la suma de sus ratings.
+    :param count: Número de reviews.
+    :param rating_sum: Suma de los ratings.
+    :return: Rating medio redondeado a dos decimales, o 0 si el juego no tiene reviews.
+    """
+    if count <= 0:
+        return 0
+    return round(rating_sum / count, 2)
+
+
+class ReviewSummaryEntry(BaseModel):
+    id: ObjectId
+    user_id: ObjectId
+    username: str
+    publish_date: SkipValidation[datetime]
+    rating: float
+    description: str
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class ReviewSummary(BaseModel):
+    # El ID del resumen es el ID del juego al que pertenece, igual que las librerías y las wishlists.
+    id: ObjectId
+    count: int = Field(default=0)
+    rating_sum: float = Field(default=0)
+    histogram: Dict[str, int] = Field(default={})
+    recent_reviews: List[ReviewSummaryEntry] = Field(default=[])
+
+    class Config:
+        arbitrary_types_allowed = True
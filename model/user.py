@@ -23,3 +23,19 @@ class User(BaseModel):
 
     class Config:
         arbitrary_types_allowed = True
+
+
+# Campos de los usuarios que se muestran junto a reviews, listas de deseados y librerías.
+USER_SUMMARY_FIELDS = ["id", "name", "surname", "username", "email", "profile_picture"]
+
+
+class UserSummary(BaseModel):
+    id: ObjectId
+    name: str
+    surname: str
+    username: str
+    email: EmailStr
+    profile_picture: str = Field(default="base.png")
+
+    class Config:
+        arbitrary_types_allowed = True
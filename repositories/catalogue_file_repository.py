@@ -0,0 +1,151 @@
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+from bson import ObjectId
+from decouple import config
+from model.game import Game, Genre, Language
+
+logger = logging.getLogger("vgameshop.catalogue")
+
+# Ruta del archivo binario con el catálogo, que escribe el líder y leen los demás workers al arrancar.
+CATALOGUE_FILE = config("CATALOGUE_FILE", default=os.path.join(tempfile.gettempdir(), "tfg-catalogue.bin"))
+
+CATALOGUE_FILE_MAGIC = b"TFGCAT02"
+# Cabecera: firma, ID del despliegue, cuándo se escribió, número de juegos y posición de cada sección.
+HEADER = struct.Struct("<8s32sdIQQQQ")
+# Juego: ID, rating, precio, fecha de lanzamiento, ventas, máscaras de géneros e idiomas, visible,
+# y posición y tamaño de sus textos.
+RECORD = struct.Struct("<12sdddqIIB3xQI")
+# Nombres de los géneros o de los idiomas, en el orden de los bits de las máscaras.
+TAG_NAME = struct.Struct("<32s")
+COUNT = struct.Struct("<I")
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_timestamp(date: datetime.datetime) -> float:
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (date - EPOCH).total_seconds()
+
+
+def write_catalogue_file(path: str, deployment_id: str, written_at: float, games: List[Tuple[Game, float]]):
+    """
+    Función para escribir el archivo del catálogo. Se escribe en un archivo temporal que luego sustituye al anterior,
+    así que los workers que ya lo tienen abierto siguen leyendo el suyo sin ver un archivo a medias.
+    :param path: Ruta del archivo.
+    :param deployment_id: ID del despliegue, porque el archivo de otro despliegue no sirve.
+    :param written_at: Momento del que son los datos, desde el que hay que aplicar los cambios al cargarlo.
+    :param games: Juegos con su rating, en el orden en el que se listan.
+    """
+    genres = [genre.value for genre in Genre]
+    languages = [language.value for language in Language]
+    strings = bytearray()
+    records = bytearray()
+    for game, rating in games:
+        text = json.dumps({"name": game.name, "developer": game.developer, "publisher": game.publisher,
+                           "description": game.description, "main_image": game.main_image, "file": game.file,
+                           "game_showcase_images": list(game.game_showcase_images)}).encode()
+        genre_mask = 0
+        for genre in game.genres:
+            genre_mask |= 1 << genres.index(Genre(genre).value)
+        language_mask = 0
+        for language in game.languages:
+            language_mask |= 1 << languages.index(Language(language).value)
+        records += RECORD.pack(game.id.binary, rating, game.price, to_timestamp(game.release_date), game.sell_number,
+                               genre_mask, language_mask, game.visible, len(strings), len(text))
+        strings += text
+
+    def tag_section(names: List[str]) -> bytes:
+        return COUNT.pack(len(names)) + b"".join(TAG_NAME.pack(name.encode()) for name in names)
+
+    genre_section = tag_section(genres)
+    language_section = tag_section(languages)
+    records_offset = HEADER.size
+    genres_offset = records_offset + len(records)
+    languages_offset = genres_offset + len(genre_section)
+    strings_offset = languages_offset + len(language_section)
+    header = HEADER.pack(CATALOGUE_FILE_MAGIC, deployment_id.encode()[:32], written_at,
+                         len(games), records_offset, genres_offset, languages_offset, strings_offset)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".catalogue-")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(header + records + genre_section + language_section + strings)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+class CatalogueFile:
+    """
+    Archivo del catálogo abierto con mmap, de solo lectura, para decodificar los juegos uno a uno sin leerlo entero.
+    Al cargarlo, cada worker decodifica todos los juegos a su catálogo en memoria y lo cierra.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, deployment_id, self.written_at, self.count, self.records_offset, self.genres_offset,
+             self.languages_offset, self.strings_offset) = HEADER.unpack_from(self.data)
+        except struct.error:
+            magic = None
+        if magic != CATALOGUE_FILE_MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not a catalogue file.")
+        self.deployment_id = deployment_id.rstrip(b"\0").decode()
+        self.genres = self.read_tag_names(self.genres_offset)
+        self.languages = self.read_tag_names(self.languages_offset)
+
+    def close(self):
+        self.data.close()
+
+    def read_tag_names(self, offset: int) -> List[str]:
+        count, = COUNT.unpack_from(self.data, offset)
+        return [TAG_NAME.unpack_from(self.data, offset + COUNT.size + TAG_NAME.size * index)[0]
+                .rstrip(b"\0").decode() for index in range(count)]
+
+    def get(self, index: int) -> Tuple[Game, float]:
+        """
+        Función que decodifica un juego del archivo.
+        :param index: Número del juego, en el orden en el que se listan.
+        :return: El juego y su rating.
+        """
+        (game_id, rating, price, release_date, sell_number, genre_mask, language_mask, visible, strings_offset,
+         strings_length) = RECORD.unpack_from(self.data, self.records_offset + RECORD.size * index)
+        start = self.strings_offset + strings_offset
+        text = json.loads(self.data[start:start + strings_length])
+        game = Game(id=ObjectId(game_id), genres=self.decode_mask(self.genres, genre_mask, Genre),
+                    languages=self.decode_mask(self.languages, language_mask, Language), price=price,
+                    release_date=EPOCH + datetime.timedelta(seconds=release_date), sell_number=sell_number,
+                    visible=bool(visible), **text)
+        return game, rating
+
+    @staticmethod
+    def decode_mask(names: List[str], mask: int, enum) -> list:
+        return [enum(name) for position, name in enumerate(names) if mask & (1 << position)]
+
+    def __iter__(self) -> Iterator[Tuple[Game, float]]:
+        return (self.get(index) for index in range(self.count))
+
+
+def open_catalogue_file(path: str) -> Optional[CatalogueFile]:
+    """
+    Función para abrir el archivo del catálogo.
+    :param path: Ruta del archivo.
+    :return: El archivo abierto, o None si no existe o no es válido.
+    """
+    try:
+        return CatalogueFile(path)
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("Ignoring catalogue file %s: %s", path, e)
+        return None
@@ -0,0 +1,79 @@
+import datetime
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+from typing import Optional
+from db.database import db
+from repositories.shared_state_repository import expiration
+
+# Único documento de la colección: el estado del despliegue actual.
+DEPLOYMENT_STATE_ID = "deployment"
+
+
+class DeploymentRepository:
+    collection: AsyncIOMotorCollection = db.meta_collection("deployment_routes")
+
+    async def acquire_leadership(self, deployment_id: str, worker: str, lease_seconds: float) -> bool:
+        """
+        Función para intentar ser el líder del despliegue indicado. Solo un worker de cada despliegue lo consigue:
+        el primero que sustituye el estado de un despliegue anterior (o lo crea, si no existe).
+        :param deployment_id: ID del despliegue del worker.
+        :param worker: Nombre del worker, para saber quién es el líder.
+        :param lease_seconds: Segundos que dura el liderazgo si el líder no lo renueva.
+        :return: True si el worker es el líder, o False si otro worker del mismo despliegue lo es ya.
+        """
+        try:
+            await self.collection.update_one(
+                {"_id": DEPLOYMENT_STATE_ID, "deployment_id": {"$ne": deployment_id}},
+                {"$set": {"deployment_id": deployment_id, "leader": worker, "ready": False,
+                          "expires_at": expiration(lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # El documento ya es de este despliegue, así que el filtro no coincide y el upsert choca con él.
+            return False
+
+    async def renew_leadership(self, deployment_id: str, worker: str, lease_seconds: float) -> bool:
+        """
+        Función para renovar el liderazgo del despliegue, o quedárselo si el líder ha dejado de renovarlo. Solo se
+        puede quedar con él un worker de un despliegue ya preparado, porque si el líder muere mientras prepara la base
+        de datos, los demás no arrancan.
+        :param deployment_id: ID del despliegue del worker.
+        :param worker: Nombre del worker.
+        :param lease_seconds: Segundos que dura el liderazgo si el líder no lo renueva.
+        :return: True si el worker es el líder, o False en caso contrario.
+        """
+        result = await self.collection.update_one(
+            {"_id": DEPLOYMENT_STATE_ID, "deployment_id": deployment_id,
+             "$or": [{"leader": worker},
+                     {"ready": True, "expires_at": {"$lt": datetime.datetime.utcnow()}}]},
+            {"$set": {"leader": worker, "expires_at": expiration(lease_seconds)}}
+        )
+        return result.matched_count > 0
+
+    async def release_leadership(self, deployment_id: str, worker: str):
+        """
+        Función para dejar el liderazgo al apagar el líder, para que otro worker se quede con él sin esperar a que
+        caduque.
+        :param deployment_id: ID del despliegue del worker.
+        :param worker: Nombre del worker.
+        """
+        await self.collection.update_one({"_id": DEPLOYMENT_STATE_ID, "deployment_id": deployment_id,
+                                          "leader": worker},
+                                         {"$set": {"expires_at": datetime.datetime.utcnow()}})
+
+    async def mark_ready(self, deployment_id: str):
+        """
+        Función para indicar que el líder ya ha preparado la base de datos del despliegue.
+        :param deployment_id: ID del despliegue.
+        """
+        await self.collection.update_one({"_id": DEPLOYMENT_STATE_ID, "deployment_id": deployment_id},
+                                         {"$set": {"ready": True}})
+
+    async def get_state(self) -> Optional[dict]:
+        """
+        Función para obtener el estado del despliegue actual.
+        :return: Diccionario con el ID del despliegue, su líder, hasta cuándo lo es y si está listo, o None si no hay
+        ninguno.
+        """
+        return await self.collection.find_one({"_id": DEPLOYMENT_STATE_ID})
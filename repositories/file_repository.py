@@ -1,7 +1,12 @@
 import os
+import uuid
 import aiofiles
+from typing import Optional
 from fastapi import HTTPException, status, UploadFile
 
+# Tamaño de cada parte al copiar un archivo subido.
+STAGE_CHUNK_BYTES = 1024 * 1024
+
 
 def get_resources_directory() -> str:
     """
@@ -55,6 +60,115 @@ async def upload_file(file: UploadFile, directory_from_resources: str, image_id:
                             detail=f"Exception while uploading file: {e}")
 
 
+# Primeros bytes de cada formato de imágen admitido, y extensión que le corresponde.
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+]
+# Marcas de la caja "ftyp" de los formatos ISO-BMFF (AVIF y HEIF) admitidos, de la más concreta a la más genérica,
+# y extensión que le corresponde.
+HEIF_BRANDS = {b"avif": ".avif", b"avis": ".avif", b"heic": ".heic", b"mif1": ".heif"}
+
+
+async def sniff_image(file: UploadFile) -> Optional[str]:
+    """
+    Función para saber si un archivo subido es una imágen mirando sus primeros bytes, en vez de fiarse del tipo
+    que dice el cliente. Deja el archivo listo para volver a leerlo desde el principio.
+    :param file: Archivo subido.
+    :return: La extensión que corresponde al formato de la imágen, o None si no es una imágen admitida.
+    """
+    header = await file.read(64)
+    await file.seek(0)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    if header[4:8] == b"ftyp":
+        # La caja empieza con su tamaño, y tiene la marca principal, una versión y las marcas compatibles.
+        size = int.from_bytes(header[:4], "big")
+        brands = [header[8:12]] + [header[index:index + 4] for index in range(16, min(size, len(header)) - 3, 4)]
+        for brand, extension in HEIF_BRANDS.items():
+            if brand in brands:
+                return extension
+        return None
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+async def stage_file(file: UploadFile, extension: Optional[str] = None) -> str:
+    """
+    Función para guardar un archivo subido en la carpeta de subidas pendientes (resources/uploads) con un nombre
+    aleatorio, para procesarlo después en segundo plano. Se copia por partes, sin leerlo entero en memoria.
+    :param file: Archivo a guardar.
+    :param extension: Extensión con la que guardarlo. Si no se indica, la del nombre del archivo.
+    :return: Ruta relativa desde resources del archivo guardado, o error 500 si no se pudo guardar.
+    """
+    if extension is None:
+        _, extension = os.path.splitext(file.filename)
+    directory = os.path.join(get_resources_directory(), "uploads")
+    name = f"{uuid.uuid4().hex}{extension}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        async with aiofiles.open(os.path.join(directory, name), 'wb') as out_file:
+            while chunk := await file.read(STAGE_CHUNK_BYTES):
+                await out_file.write(chunk)
+        return os.path.join("uploads", name)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Exception while uploading file: {e}")
+
+
+def move_file(path_from_resources: str, directory_from_resources: str, file_id: str) -> str:
+    """
+    Función para mover un archivo de resources a otro directorio de resources, con el nombre especificado y la misma
+    extensión. Igual que al subir un archivo, borra los que tengan el mismo nombre y distinta extensión.
+    Si el archivo ya se había movido, no hace nada, así que se puede repetir.
+    :param path_from_resources: Ruta relativa desde resources del archivo a mover.
+    :param directory_from_resources: Ruta relativa desde resources del directorio de destino.
+    :param file_id: Nombre nuevo del archivo, sin la extensión.
+    :return: Nombre del archivo movido.
+    """
+    _, extension = os.path.splitext(path_from_resources)
+    directory = os.path.join(get_resources_directory(), directory_from_resources)
+    new_name = f"{file_id}{extension}"
+    source = os.path.join(get_resources_directory(), path_from_resources)
+    destination = os.path.join(directory, new_name)
+    if not os.path.isfile(source) and os.path.isfile(destination):
+        return new_name
+
+    os.makedirs(directory, exist_ok=True)
+    for existing_file in os.listdir(directory):
+        existing_name, existing_extension = os.path.splitext(existing_file)
+        if existing_name == file_id and existing_extension != extension:
+            os.remove(os.path.join(directory, existing_file))
+    os.replace(source, destination)
+    return new_name
+
+
+def create_thumbnail(path_from_resources: str, thumbnail_directory_from_resources: str, max_size: int) -> bool:
+    """
+    Función para crear una copia reducida de una imágen, con el mismo nombre, en otro directorio de resources.
+    Necesita Pillow, que es opcional: si no está instalado no hace nada.
+    :param path_from_resources: Ruta relativa desde resources de la imágen.
+    :param thumbnail_directory_from_resources: Ruta relativa desde resources del directorio de las copias reducidas.
+    :param max_size: Tamaño máximo en píxeles del lado más largo de la copia.
+    :return: True si se creó la copia, o False si Pillow no está instalado.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    directory = os.path.join(get_resources_directory(), thumbnail_directory_from_resources)
+    os.makedirs(directory, exist_ok=True)
+    with Image.open(os.path.join(get_resources_directory(), path_from_resources)) as image:
+        image.thumbnail((max_size, max_size))
+        image.save(os.path.join(directory, os.path.basename(path_from_resources)))
+    return True
+
+
 def delete_file(path_from_resources: str) -> bool:
     """
     Función para borrar un archivo dentro del directorio de resources.
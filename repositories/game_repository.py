@@ -2,11 +2,15 @@ import os
 from fastapi import UploadFile
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
-from typing import List, Optional
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from typing import Dict, List, Optional
 from db.database import db
+from db.projection import projection
 from model.game import Game
 from repositories import file_repository
 
+SHOWCASE_THUMBNAILS_DIRECTORY = os.path.join("game_images", "thumbnails")
+
 
 def get_image_by_name(name: str) -> str:
     """
@@ -27,8 +31,84 @@ def get_game_downloadable_by_name(name: str) -> str:
     return file_repository.get_file_full_path("game_downloadables", name)
 
 
+async def sniff_showcase_image(file: UploadFile) -> Optional[str]:
+    """
+    Función para comprobar por su contenido que una foto de muestra subida es una imágen.
+    :param file: Foto de muestra.
+    :return: La extensión que corresponde al formato de la imágen, o None si no es una imágen admitida.
+    """
+    return await file_repository.sniff_image(file)
+
+
+async def stage_showcase_image(file: UploadFile, extension: str) -> str:
+    """
+    Función para guardar una foto de muestra subida en la carpeta de subidas pendientes, hasta que se procese.
+    :param file: Foto de muestra.
+    :param extension: Extensión que corresponde al formato de la imágen.
+    :return: Ruta relativa desde resources de la foto guardada.
+    """
+    return await file_repository.stage_file(file, extension)
+
+
+def delete_staged_showcase_image(staged_path: str):
+    """
+    Función para borrar una foto de muestra subida que no se va a procesar.
+    :param staged_path: Ruta relativa desde resources de la foto subida.
+    """
+    file_repository.delete_file(staged_path)
+
+
+def store_showcase_image(staged_path: str, game_id: ObjectId, name: str) -> str:
+    """
+    Función para mover una foto de muestra ya subida desde la carpeta de subidas pendientes a la de imágenes de juegos.
+    :param staged_path: Ruta relativa desde resources de la foto subida.
+    :param game_id: ID del juego al que pertenece la foto.
+    :param name: Nombre original de la foto, sin la extensión.
+    :return: Nombre final de la foto.
+    """
+    return file_repository.move_file(staged_path, "game_images", f"{str(game_id)}-showcase{name}")
+
+
+def create_showcase_thumbnail(name: str, max_size: int) -> bool:
+    """
+    Función para crear la copia reducida de una foto de muestra.
+    :param name: Nombre de la foto.
+    :param max_size: Tamaño máximo en píxeles del lado más largo de la copia.
+    :return: True si se creó la copia, o False si no se pueden crear copias reducidas (falta Pillow).
+    """
+    return file_repository.create_thumbnail(os.path.join("game_images", name), SHOWCASE_THUMBNAILS_DIRECTORY,
+                                            max_size)
+
+
+def get_showcase_thumbnail_by_name(name: str) -> Optional[str]:
+    """
+    Función para obtener la ruta absoluta de la copia reducida de una foto de muestra.
+    :param name: Nombre de la foto.
+    :return: String de la ruta absoluta de la copia reducida, o None si no existe.
+    """
+    path = os.path.join(file_repository.get_resources_directory(), SHOWCASE_THUMBNAILS_DIRECTORY, name)
+    return path if os.path.isfile(path) else None
+
+
+def delete_showcase_image(name: str):
+    """
+    Función para borrar una foto de muestra y su copia reducida. Si no existen, no hace nada.
+    :param name: Nombre de la foto.
+    """
+    file_repository.delete_file(os.path.join("game_images", name))
+    file_repository.delete_file(os.path.join(SHOWCASE_THUMBNAILS_DIRECTORY, name))
+
+
 class GameRepository:
-    collection: AsyncIOMotorCollection = db.client.vgameshop_db.game_routes
+    collection: AsyncIOMotorCollection = db.collection("game_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de juegos. No puede haber dos juegos con el mismo nombre
+        y desarrollador.
+        """
+        await self.collection.create_index([("id", ASCENDING)], unique=True)
+        await self.collection.create_index([("name", ASCENDING), ("developer", ASCENDING)], unique=True)
 
     async def get_game_by_id(self, game_id: ObjectId) -> Optional[Game]:
         """
@@ -41,18 +121,52 @@ class GameRepository:
             return Game(**game)
         return None
 
-    async def get_game_by_name_and_dev(self, name: str, dev: str) -> Optional[Game]:
+    async def get_game_document_by_id(self, game_id: ObjectId, fields: List[str]) -> Optional[dict]:
+        """
+        Función para leer solo algunos campos de un juego.
+        :param game_id: ID del juego.
+        :param fields: Campos a leer, además del ID.
+        :return: Documento con los campos leídos, o None si el juego no existe.
+        """
+        return await self.collection.find_one({"id": game_id}, projection(fields))
+
+    async def get_game_documents(self, fields: List[str]) -> List[dict]:
         """
-        Función para buscar un juego por su nombre y desarrollador.
-        :param name: Nombre del juego.
-        :param dev: Desarrollador del juego.
-        :return: El juego encontrado, o None si no existe ningún juego con ese nombre y desarrollador.
+        Función para leer solo algunos campos de todos los juegos, ordenados por fecha de lanzamiento,
+        de más reciente a más antiguo.
+        :param fields: Campos a leer, además del ID.
+        :return: Lista con los documentos leídos.
+        """
+        return await self.collection.find({}, projection(fields)).sort("release_date", DESCENDING).to_list(length=None)
+
+    async def get_games_by_ids(self, game_ids: List[ObjectId]) -> List[Game]:
         """
-        game = await self.collection.find_one({"name": name, "developer": dev})
+        Función para obtener varios juegos por su ID con una sola consulta.
+        :param game_ids: IDs de los juegos a buscar.
+        :return: Lista con los juegos que existen, sin ningún orden concreto.
+        """
+        games = await self.collection.find({"id": {"$in": game_ids}}).to_list(length=None)
+        return [Game(**game) for game in games]
+
+    async def get_game_file_by_id(self, game_id: ObjectId) -> Optional[str]:
+        """
+        Función para obtener solo el nombre del archivo descargable de un juego, sin leer el resto del juego.
+        :param game_id: ID del juego.
+        :return: El nombre del archivo del juego, o None si el juego no existe.
+        """
+        game = await self.collection.find_one({"id": game_id}, {"_id": 0, "file": 1})
         if game:
-            return Game(**game)
+            return game.get("file", "")
         return None
 
+    async def game_exists(self, game_id: ObjectId) -> bool:
+        """
+        Función para saber si existe un juego, sin leerlo.
+        :param game_id: ID del juego.
+        :return: True si el juego existe, o False en caso contrario.
+        """
+        return await self.collection.find_one({"id": game_id}, {"_id": 1}) is not None
+
     async def get_games(self) -> List[Game]:
         """
         Función para encontrar todos los juegos existentes en la base de datos.
@@ -65,11 +179,10 @@ class GameRepository:
         """
         Función para crear un juego.
         :param game: Información del juego a crear.
-        :return: El juego creado, o None si no se pudo crear.
+        :return: El juego creado. Si ya existe un juego con el mismo nombre y desarrollador, lanza DuplicateKeyError.
         """
         await self.collection.insert_one(game.dict())
-        res = await self.get_game_by_id(game.id)
-        return res
+        return game
 
     async def update_game(self, game_id: ObjectId, game_data: dict) -> Optional[Game]:
         """
@@ -84,40 +197,47 @@ class GameRepository:
         await self.collection.update_one({"id": game.dict().pop('id', None)}, {"$set": game_data})
         return await self.get_game_by_id(game_id)
 
-    async def upload_showcase_image(self, file: UploadFile, game_id: ObjectId) -> bool:
+    async def increment_sell_numbers(self, amounts: Dict[ObjectId, int], generation: int, session=None):
         """
-        Función para subir una foto de muestra asociada a un juego.
-        :param file: Foto de muestra.
-        :param game_id: ID del juego al que asociar la foto.
-        :return: True si se pudo guardar la imágen y asociarla al juego,
-        o False si no se pudo o el juego no existe.
+        Función para incrementar atómicamente el número de ventas de varios juegos con una única escritura en bloque.
+        Cada juego guarda la última tanda de ventas que se le ha sumado, así que repetir una tanda no suma nada.
+        :param amounts: Diccionario con el número de ventas a sumar a cada juego.
+        :param generation: Número de generación de la tanda de ventas.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
         """
-        game = await self.get_game_by_id(game_id)
-        if not game:
-            return False
-        filename, _ = os.path.splitext(file.filename)
-        image = await file_repository.upload_file(file, "game_images",
-                                                  f"{str(game_id)}-showcase{filename}")
-        game.game_showcase_images.append(image)
-        await self.collection.update_one({"id": game.dict().pop('id', None)},
-                                         {"$set": game.dict()})
-        return True
+        if not amounts:
+            return
+        await self.collection.bulk_write(
+            [UpdateOne({"id": game_id, "rollup_generation": {"$not": {"$gte": generation}}},
+                       {"$inc": {"sell_number": amount}, "$set": {"rollup_generation": generation}})
+             for game_id, amount in amounts.items()],
+            ordered=False, session=session
+        )
 
-    async def clear_showcase_images(self, game_id: ObjectId) -> bool:
+    async def add_showcase_images(self, game_id: ObjectId, images: List[str]) -> bool:
         """
-        Función para borrar todas las fotos de muestra de un juego.
-        :param game_id: ID del juego cuyas fotos de muestra queremos eliminar.
-        :return: True si se eliminaron exitosamente, o False en caso contrario.
+        Función para asociar a un juego fotos de muestra ya guardadas, con una única escritura atómica.
+        Si alguna ya estaba asociada no se repite, así que se puede reintentar sin duplicarlas.
+        :param game_id: ID del juego al que asociar las fotos.
+        :param images: Nombres de las fotos.
+        :return: True si el juego existe, o False en caso contrario.
         """
-        game = await self.get_game_by_id(game_id)
-        if not game:
-            return False
-        for image_path in game.game_showcase_images:
-            file_repository.delete_file(os.path.join("game_images", image_path))
-        game.game_showcase_images = []
-        await self.collection.update_one({"id": game.dict().pop('id', None)},
-                                         {"$set": game.dict()})
-        return True
+        result = await self.collection.update_one({"id": game_id},
+                                                  {"$addToSet": {"game_showcase_images": {"$each": images}}})
+        return result.matched_count > 0
+
+    async def clear_showcase_images(self, game_id: ObjectId) -> Optional[List[str]]:
+        """
+        Función para quitar todas las fotos de muestra de un juego, de forma atómica. No borra los archivos.
+        :param game_id: ID del juego cuyas fotos de muestra queremos quitar.
+        :return: Los nombres de las fotos que tenía el juego, o None si el juego no existe.
+        """
+        game = await self.collection.find_one_and_update({"id": game_id},
+                                                         {"$set": {"game_showcase_images": []}},
+                                                         projection={"_id": 0, "game_showcase_images": 1})
+        if game is None:
+            return None
+        return game.get("game_showcase_images", [])
 
     async def upload_main_image(self, file: UploadFile, game_id: ObjectId) -> bool:
         """
@@ -130,9 +250,8 @@ class GameRepository:
         if not game:
             return False
         image = await file_repository.upload_file(file, "game_images", str(game_id))
-        game.main_image = image
-        await self.collection.update_one({"id": game.dict().pop('id', None)},
-                                         {"$set": game.dict()})
+        # Solo se escribe la foto, para no pisar las ventas que se hayan sumado desde que se leyó el juego.
+        await self.collection.update_one({"id": game_id}, {"$set": {"main_image": image}})
         return True
 
     async def upload_game_file(self, file: UploadFile, game_id: ObjectId) -> bool:
@@ -146,10 +265,8 @@ class GameRepository:
         if not game:
             return False
         image = await file_repository.upload_file(file, "game_downloadables", str(game_id))
-        game.file = image
-        await self.collection.update_one({"id": game.dict().pop('id', None)},
-                                         {"$set": game.dict()})
-        print(game.file)
+        await self.collection.update_one({"id": game_id}, {"$set": {"file": image}})
+        print(image)
         return True
 
     async def delete_game(self, game_id: ObjectId) -> Optional[Game]:
@@ -162,6 +279,7 @@ class GameRepository:
         game = await self.get_game_by_id(game_id)
         if not game:
             return None
-        game.visible = not game.visible
-        await self.collection.update_one({"id": game.dict().pop('id', None)}, {"$set": game.dict()})
+        # Solo cambia si sigue con la visibilidad leída, así dos peticiones a la vez no se anulan entre sí.
+        await self.collection.update_one({"id": game_id, "visible": game.visible},
+                                         {"$set": {"visible": not game.visible}})
         return await self.get_game_by_id(game_id)
@@ -0,0 +1,114 @@
+import datetime
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from typing import Optional
+from db.database import db
+from model.job import Job, JobStatus
+
+
+class JobRepository:
+    collection: AsyncIOMotorCollection = db.collection("job_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de tareas. Las tareas terminadas las borra Mongo.
+        """
+        await self.collection.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+        await self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    async def create_job(self, job: Job) -> Job:
+        """
+        Función para guardar una tarea nueva.
+        :param job: Tarea a guardar.
+        :return: La tarea guardada.
+        """
+        await self.collection.insert_one(job.dict())
+        return job
+
+    async def get_job_by_id(self, job_id: ObjectId) -> Optional[Job]:
+        """
+        Función para buscar una tarea por su ID.
+        :param job_id: ID de la tarea.
+        :return: La tarea, o None si no existe.
+        """
+        job = await self.collection.find_one({"id": job_id})
+        if job:
+            return Job(**job)
+        return None
+
+    async def claim_job(self, lease_seconds: float) -> Optional[Job]:
+        """
+        Función para coger la siguiente tarea pendiente, de forma atómica: aunque varios workers lo intenten a la vez,
+        cada tarea solo la coge uno. También coge las tareas en ejecución cuyo worker haya dejado de renovarlas.
+        :param lease_seconds: Segundos que la tarea es del worker que la coge.
+        :return: La tarea cogida, o None si no hay ninguna lista para ejecutarse.
+        """
+        now = datetime.datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {"$or": [{"status": JobStatus.PENDING.value, "run_at": {"$lte": now}},
+                     {"status": JobStatus.RUNNING.value, "locked_until": {"$lte": now}}]},
+            {"$set": {"status": JobStatus.RUNNING.value, "lock_id": ObjectId(),
+                      "locked_until": now + datetime.timedelta(seconds=lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            return Job(**job)
+        return None
+
+    async def extend_lease(self, job_id: ObjectId, lock_id: ObjectId, lease_seconds: float) -> bool:
+        """
+        Función para renovar la reserva de una tarea en ejecución, mientras la siga teniendo el mismo worker.
+        :param job_id: ID de la tarea.
+        :param lock_id: ID de la reserva, que se genera al coger la tarea.
+        :param lease_seconds: Segundos que la tarea sigue siendo del worker a partir de ahora.
+        :return: True si se ha renovado, o False si otro worker ha vuelto a coger la tarea.
+        """
+        result = await self.collection.update_one(
+            {"id": job_id, "lock_id": lock_id, "status": JobStatus.RUNNING.value},
+            {"$set": {"locked_until": datetime.datetime.utcnow() + datetime.timedelta(seconds=lease_seconds)}}
+        )
+        return result.matched_count > 0
+
+    async def complete_job(self, job_id: ObjectId, lock_id: ObjectId, retention: datetime.timedelta):
+        """
+        Función para marcar una tarea como terminada, si el worker todavía la tiene reservada.
+        :param job_id: ID de la tarea.
+        :param lock_id: ID de la reserva, que se genera al coger la tarea.
+        :param retention: Tiempo que se guarda la tarea terminada antes de borrarla.
+        """
+        now = datetime.datetime.utcnow()
+        await self.collection.update_one({"id": job_id, "lock_id": lock_id, "status": JobStatus.RUNNING.value},
+                                         {"$set": {"status": JobStatus.DONE.value, "error": None,
+                                                   "locked_until": None, "finished_at": now,
+                                                   "expires_at": now + retention}})
+
+    async def retry_job(self, job_id: ObjectId, lock_id: ObjectId, error: str, run_at: datetime.datetime):
+        """
+        Función para devolver una tarea fallida a la cola, para reintentarla más tarde, si el worker todavía la tiene
+        reservada.
+        :param job_id: ID de la tarea.
+        :param lock_id: ID de la reserva, que se genera al coger la tarea.
+        :param error: Error del último intento.
+        :param run_at: Cuándo se puede volver a intentar.
+        """
+        await self.collection.update_one({"id": job_id, "lock_id": lock_id, "status": JobStatus.RUNNING.value},
+                                         {"$set": {"status": JobStatus.PENDING.value, "error": error,
+                                                   "locked_until": None, "run_at": run_at}})
+
+    async def fail_job(self, job_id: ObjectId, lock_id: ObjectId, error: str, retention: datetime.timedelta):
+        """
+        Función para marcar una tarea como fallida, cuando ya no quedan reintentos, si el worker todavía la tiene
+        reservada.
+        :param job_id: ID de la tarea.
+        :param lock_id: ID de la reserva, que se genera al coger la tarea.
+        :param error: Error del último intento.
+        :param retention: Tiempo que se guarda la tarea fallida antes de borrarla.
+        """
+        now = datetime.datetime.utcnow()
+        await self.collection.update_one({"id": job_id, "lock_id": lock_id, "status": JobStatus.RUNNING.value},
+                                         {"$set": {"status": JobStatus.FAILED.value, "error": error,
+                                                   "locked_until": None, "finished_at": now,
+                                                   "expires_at": now + retention}})
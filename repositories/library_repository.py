@@ -6,7 +6,7 @@ from model.library import Library
 
 
 class LibraryRepository:
-    collection: AsyncIOMotorCollection = db.client.vgameshop_db.library_routes
+    collection: AsyncIOMotorCollection = db.collection("library_routes")
 
     async def get_library_by_id(self, library_id: ObjectId) -> Optional[Library]:
         """
@@ -19,6 +19,31 @@ class LibraryRepository:
             return Library(**library)
         return None
 
+    async def library_exists(self, library_id: ObjectId) -> bool:
+        """
+        Función para saber si un usuario tiene librería, sin traerse sus juegos.
+        :param library_id: ID del usuario cuya librería queremos buscar.
+        :return: True si la librería existe, False en caso contrario.
+        """
+        return await self.collection.count_documents({"id": library_id}, limit=1) > 0
+
+    async def find_game_ids(self, library_id: ObjectId, game_ids: List[ObjectId]) -> Optional[List[ObjectId]]:
+        """
+        Función para saber cuáles de los juegos pasados por parámetro están en la librería de un usuario, con una sola
+        consulta y sin traer el resto de juegos de la librería.
+        :param library_id: ID del usuario cuya librería queremos consultar.
+        :param game_ids: IDs de los juegos a buscar.
+        :return: IDs de los juegos que están en la librería, o None si la librería no existe.
+        """
+        documents = await self.collection.aggregate([
+            {"$match": {"id": library_id}},
+            {"$project": {"_id": 0, "game_ids": {"$filter": {"input": "$game_ids",
+                                                             "cond": {"$in": ["$$this", game_ids]}}}}}
+        ]).to_list(length=1)
+        if not documents:
+            return None
+        return documents[0]["game_ids"]
+
     async def get_libraries(self) -> List[Library]:
         """
         Función para obtener todas las librerías existentes.
@@ -49,3 +74,16 @@ class LibraryRepository:
             return None
         await self.collection.update_one({"id": library.dict().pop('id', None)}, {"$set": library_data})
         return await self.get_library_by_id(library_id)
+
+    async def add_game(self, library_id: ObjectId, game_id: ObjectId, session=None) -> bool:
+        """
+        Función para añadir atómicamente un juego a la librería de un usuario, sin leerla ni reescribirla entera.
+        Si el juego ya estaba en la librería, no se modifica.
+        :param library_id: ID del usuario cuya librería queremos modificar.
+        :param game_id: ID del juego a añadir.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        :return: True si la librería existe, False en caso contrario.
+        """
+        result = await self.collection.update_one({"id": library_id}, {"$addToSet": {"game_ids": game_id}},
+                                                  session=session)
+        return result.matched_count > 0
@@ -0,0 +1,90 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from typing import List, Optional, Tuple
+from db.database import db
+from model.purchase import Purchase
+
+
+class PurchaseRepository:
+    # Libro de compras: los documentos nunca se borran, y solo se modifican para marcar su venta como contada.
+    collection: AsyncIOMotorCollection = db.collection("purchase_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de compras. La clave de idempotencia es única para cada
+        usuario (la de un usuario no sirve para buscar las compras de otro), y un usuario solo puede comprar cada
+        juego una vez, así que los reintentos de una misma compra no se duplican. Las compras cuya venta no se ha
+        contado tienen su propio índice, que solo contiene esas.
+        """
+        await self.collection.create_index([("user_id", ASCENDING), ("idempotency_key", ASCENDING)], unique=True)
+        await self.collection.create_index([("user_id", ASCENDING), ("game_id", ASCENDING)], unique=True)
+        await self.collection.create_index([("counted", ASCENDING)], partialFilterExpression={"counted": False})
+
+    async def get_purchases_from_user(self, user_id: ObjectId) -> List[Purchase]:
+        """
+        Función para obtener todas las compras realizadas por un usuario.
+        :param user_id: ID del usuario cuyas compras queremos buscar.
+        :return: Lista con todas las compras del usuario.
+        """
+        purchases = await self.collection.find({"user_id": user_id}).to_list(length=None)
+        return [Purchase(**purchase) for purchase in purchases]
+
+    async def get_purchase(self, user_id: ObjectId, idempotency_key: str, game_id: ObjectId,
+                           session=None) -> Optional[Purchase]:
+        """
+        Función para buscar una compra de un usuario por su clave de idempotencia o por el juego comprado.
+        :param user_id: ID del usuario que hizo la compra.
+        :param idempotency_key: Clave de idempotencia de la compra.
+        :param game_id: ID del juego comprado.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        :return: La compra si existe, o None en caso contrario.
+        """
+        purchase = await self.collection.find_one(
+            {"user_id": user_id, "$or": [{"idempotency_key": idempotency_key}, {"game_id": game_id}]},
+            session=session
+        )
+        if purchase:
+            return Purchase(**purchase)
+        return None
+
+    async def get_uncounted_purchases(self, limit: int) -> List[dict]:
+        """
+        Función para obtener las compras cuya venta todavía no se ha sumado a los contadores de ventas.
+        :param limit: Número máximo de compras a devolver.
+        :return: Lista de documentos con el ID y el ID del juego de cada compra.
+        """
+        return await self.collection.find({"counted": False}, {"_id": 0, "id": 1, "game_id": 1}) \
+            .to_list(length=limit)
+
+    async def mark_counted(self, purchase_ids: List[ObjectId], session=None):
+        """
+        Función para marcar como contadas las ventas de varias compras. Marcar una compra ya contada no cambia nada.
+        :param purchase_ids: IDs de las compras.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        """
+        if not purchase_ids:
+            return
+        await self.collection.update_many({"id": {"$in": purchase_ids}}, {"$set": {"counted": True}},
+                                          session=session)
+
+    async def create_purchase(self, purchase: Purchase, session=None) -> Tuple[Purchase, bool]:
+        """
+        Función para añadir una compra al libro de compras. Si el mismo usuario ya tenía una compra con la misma clave
+        de idempotencia, o del mismo juego, no se inserta nada y se devuelve la ya existente (que puede ser de otro
+        juego, si se ha repetido la clave).
+        :param purchase: Compra a registrar.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        :return: Tupla con la compra registrada y True si se acaba de insertar, o False si ya existía.
+        """
+        try:
+            await self.collection.insert_one(purchase.dict(), session=session)
+            return purchase, True
+        except DuplicateKeyError:
+            # Dentro de una transacción el error la aborta, así que es el servicio quien tiene que resolverlo.
+            if session is not None:
+                raise
+            existing = await self.get_purchase(purchase.user_id, purchase.idempotency_key, purchase.game_id,
+                                               session=session)
+            return existing, False
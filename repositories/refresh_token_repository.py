@@ -0,0 +1,68 @@
+import datetime
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from typing import Optional
+from db.database import db
+from model.refresh_token import RefreshToken
+
+
+class RefreshTokenRepository:
+    collection: AsyncIOMotorCollection = db.collection("refresh_token_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de refresh tokens. Los tokens caducados los borra Mongo.
+        """
+        await self.collection.create_index([("token_hash", ASCENDING)], unique=True)
+        await self.collection.create_index([("family_id", ASCENDING)])
+        await self.collection.create_index([("user_id", ASCENDING)])
+        await self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    async def create_refresh_token(self, refresh_token: RefreshToken):
+        """
+        Función para guardar un refresh token nuevo.
+        :param refresh_token: Refresh token a guardar.
+        """
+        await self.collection.insert_one(refresh_token.dict())
+
+    async def get_refresh_token(self, token_hash: str) -> Optional[RefreshToken]:
+        """
+        Función para buscar un refresh token por su hash.
+        :param token_hash: Hash del token.
+        :return: El refresh token, o None si no existe.
+        """
+        refresh_token = await self.collection.find_one({"token_hash": token_hash})
+        if refresh_token:
+            return RefreshToken(**refresh_token)
+        return None
+
+    async def use_refresh_token(self, token_hash: str) -> Optional[RefreshToken]:
+        """
+        Función para marcar un refresh token como usado, de forma atómica: si llegan dos peticiones con el mismo
+        token a la vez, solo una de ellas lo consigue.
+        :param token_hash: Hash del token.
+        :return: El refresh token si no se había usado y no ha caducado, o None en caso contrario.
+        """
+        refresh_token = await self.collection.find_one_and_update(
+            {"token_hash": token_hash, "used": False, "expires_at": {"$gt": datetime.datetime.utcnow()}},
+            {"$set": {"used": True}},
+            return_document=ReturnDocument.AFTER
+        )
+        if refresh_token:
+            return RefreshToken(**refresh_token)
+        return None
+
+    async def delete_family(self, family_id: str):
+        """
+        Función para borrar todos los refresh tokens de una familia.
+        :param family_id: ID de la familia.
+        """
+        await self.collection.delete_many({"family_id": family_id})
+
+    async def delete_from_user(self, user_id: ObjectId):
+        """
+        Función para borrar todos los refresh tokens de un usuario.
+        :param user_id: ID del usuario.
+        """
+        await self.collection.delete_many({"user_id": user_id})
@@ -1,12 +1,19 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from db.database import db
 from model.review import Review
+from model.review_summary import summary_rating
+from repositories.game_repository import GameRepository
+from repositories.user_repository import UserRepository
+
+# Colección de los resúmenes de reviews. ReviewSummaryRepository importa este módulo, así que no se puede importar aquí.
+REVIEW_SUMMARY_COLLECTION = "review_summary_routes"
 
 
 class ReviewRepository:
-    collection: AsyncIOMotorCollection = db.client.vgameshop_db.review_routes
+    collection: AsyncIOMotorCollection = db.collection("review_routes")
 
     async def get_review_by_id(self, review_id: ObjectId) -> Optional[Review]:
         """
@@ -27,6 +34,53 @@ class ReviewRepository:
         reviews = await self.collection.find({}).to_list(length=None)
         return [Review(**review) for review in reviews]
     
+    async def get_reviews_page(self, match: dict, own_user_id: Optional[ObjectId] = None,
+                               skip: int = 0, limit: int = 20) -> Tuple[int, List[dict]]:
+        """
+        Función para obtener una página de reviews con su usuario y su juego ya resueltos en el servidor,
+        usando un pipeline de agregación para la página y, a la vez, un conteo para el total.
+        La review del usuario indicado (si existe) va siempre la primera, y el resto se ordenan por fecha de publicación.
+        :param match: Filtro de Mongo que deben cumplir las reviews.
+        :param own_user_id: ID del usuario cuya review queremos que aparezca la primera.
+        :param skip: Número de reviews a saltar.
+        :param limit: Número máximo de reviews a devolver.
+        :return: Tupla con el número total de reviews que cumplen el filtro y la lista de documentos de la página,
+        cada uno con los campos "user" y "game" con los datos resumidos de su usuario y su juego.
+        """
+        pipeline = [
+            {"$match": match},
+            {"$addFields": {"is_own": {"$eq": ["$user_id", own_user_id]}}},
+            # Con el $skip y el $limit justo detrás, Mongo solo guarda en memoria las reviews hasta la página pedida.
+            {"$sort": {"is_own": -1, "publish_date": 1, "id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            # Los joins se hacen después de paginar, así solo se resuelven usuarios y juegos de la página pedida.
+            # El rating del juego sale de su resumen de reviews, en vez de recorrer todas sus reviews.
+            {"$lookup": {"from": UserRepository.collection.name, "localField": "user_id", "foreignField": "id",
+                         "as": "user"}},
+            {"$lookup": {"from": GameRepository.collection.name, "localField": "game_id", "foreignField": "id",
+                         "as": "game"}},
+            {"$lookup": {"from": REVIEW_SUMMARY_COLLECTION, "localField": "game_id", "foreignField": "id",
+                         "as": "summary"}},
+            {"$unwind": "$user"},
+            {"$unwind": "$game"},
+            {"$project": {
+                "_id": 0, "id": 1, "game_id": 1, "user_id": 1, "publish_date": 1, "rating": 1, "description": 1,
+                "user.id": 1, "user.name": 1, "user.surname": 1, "user.username": 1, "user.email": 1,
+                "game.id": 1, "game.name": 1, "game.developer": 1, "game.publisher": 1, "game.description": 1,
+                "game.price": 1, "summary.count": 1, "summary.rating_sum": 1
+            }}
+        ]
+        # El total se cuenta aparte: dentro de un $facet, todas las reviews acabarían en un único documento.
+        total, documents = await asyncio.gather(
+            self.collection.count_documents(match),
+            self.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=limit))
+        for document in documents:
+            summary = document.pop("summary")
+            summary = summary[0] if summary else {}
+            document["game"]["rating"] = summary_rating(summary.get("count", 0), summary.get("rating_sum", 0))
+        return total, documents
+
     async def get_reviews_from_user(self, user_id: ObjectId) -> List[Review]:
         """
         Función para obtener todas las reviews realizadas por el usuario cuyo ID
@@ -0,0 +1,147 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from typing import Dict, List, Optional
+from db.database import db
+from model.review import Review
+from model.review_summary import ReviewSummary, RECENT_REVIEWS_SIZE, rating_bucket, summary_rating
+from repositories.review_repository import ReviewRepository, REVIEW_SUMMARY_COLLECTION
+from repositories.user_repository import UserRepository
+
+
+class ReviewSummaryRepository:
+    collection: AsyncIOMotorCollection = db.collection(REVIEW_SUMMARY_COLLECTION)
+
+    async def get_summary_by_game_id(self, game_id: ObjectId) -> Optional[ReviewSummary]:
+        """
+        Función para obtener el resumen de las reviews de un juego.
+        :param game_id: ID del juego cuyo resumen queremos buscar.
+        :return: El resumen si existe, o None si el juego todavía no tiene reviews.
+        """
+        summary = await self.collection.find_one({"id": game_id})
+        if summary:
+            return ReviewSummary(**summary)
+        return None
+
+    async def get_ratings(self, game_ids: List[ObjectId]) -> Dict[ObjectId, float]:
+        """
+        Función para obtener el rating medio de varios juegos con una sola consulta, leyendo solo los contadores
+        de sus resúmenes.
+        :param game_ids: IDs de los juegos.
+        :return: Diccionario con el rating de cada juego que tiene reviews. Los que no aparecen tienen rating 0.
+        """
+        summaries = await self.collection.find({"id": {"$in": game_ids}},
+                                               {"_id": 0, "id": 1, "count": 1, "rating_sum": 1}).to_list(length=None)
+        return {summary["id"]: summary_rating(summary.get("count", 0), summary.get("rating_sum", 0))
+                for summary in summaries}
+
+    async def add_review(self, review: Review, username: str):
+        """
+        Función para sumar una review nueva al resumen de su juego. Si el resumen no existe, lo crea.
+        :param review: Review creada.
+        :param username: Username del autor de la review, para guardarlo junto a las reviews recientes.
+        """
+        entry = {
+            "id": review.id,
+            "user_id": review.user_id,
+            "username": username,
+            "publish_date": review.publish_date,
+            "rating": review.rating,
+            "description": review.description
+        }
+        await self.collection.update_one(
+            {"id": review.game_id},
+            {
+                "$inc": {"count": 1, "rating_sum": review.rating, f"histogram.{rating_bucket(review.rating)}": 1},
+                "$push": {"recent_reviews": {"$each": [entry], "$sort": {"publish_date": -1},
+                                             "$slice": RECENT_REVIEWS_SIZE}}
+            },
+            upsert=True
+        )
+
+    async def update_review(self, old_review: Review, new_review: Review):
+        """
+        Función para actualizar el resumen del juego cuando se modifica una de sus reviews.
+        :param old_review: Review antes de modificarse.
+        :param new_review: Review ya modificada.
+        """
+        increments = {"rating_sum": new_review.rating - old_review.rating}
+        old_bucket = rating_bucket(old_review.rating)
+        new_bucket = rating_bucket(new_review.rating)
+        if old_bucket != new_bucket:
+            increments[f"histogram.{old_bucket}"] = -1
+            increments[f"histogram.{new_bucket}"] = 1
+
+        await self.collection.update_one(
+            {"id": new_review.game_id},
+            {
+                "$inc": increments,
+                "$set": {"recent_reviews.$[entry].rating": new_review.rating,
+                         "recent_reviews.$[entry].description": new_review.description}
+            },
+            array_filters=[{"entry.id": new_review.id}]
+        )
+
+    async def remove_review(self, review: Review):
+        """
+        Función para restar una review borrada del resumen de su juego. Si la review estaba entre las más recientes,
+        se vuelve a calcular la lista de reviews recientes para que siga teniendo el tamaño correcto.
+        :param review: Review borrada.
+        """
+        result = await self.collection.update_one(
+            {"id": review.game_id, "recent_reviews.id": review.id},
+            {
+                "$inc": {"count": -1, "rating_sum": -review.rating, f"histogram.{rating_bucket(review.rating)}": -1},
+                "$pull": {"recent_reviews": {"id": review.id}}
+            }
+        )
+        if result.modified_count:
+            await self.refresh_recent_reviews(review.game_id)
+        else:
+            await self.collection.update_one(
+                {"id": review.game_id},
+                {"$inc": {"count": -1, "rating_sum": -review.rating,
+                          f"histogram.{rating_bucket(review.rating)}": -1}}
+            )
+
+    async def refresh_recent_reviews(self, game_id: ObjectId):
+        """
+        Función para volver a calcular las reviews más recientes de un juego a partir de la colección de reviews.
+        :param game_id: ID del juego.
+        """
+        pipeline = [
+            {"$match": {"game_id": game_id}},
+            {"$sort": {"publish_date": -1, "id": -1}},
+            {"$limit": RECENT_REVIEWS_SIZE},
+            {"$lookup": {
+                "from": UserRepository.collection.name,
+                "localField": "user_id",
+                "foreignField": "id",
+                "as": "user"
+            }},
+            {"$unwind": "$user"},
+            {"$project": {"_id": 0, "id": 1, "user_id": 1, "username": "$user.username", "publish_date": 1,
+                          "rating": 1, "description": 1}}
+        ]
+        recent_reviews = await ReviewRepository.collection.aggregate(pipeline).to_list(length=None)
+        await self.collection.update_one({"id": game_id}, {"$set": {"recent_reviews": recent_reviews}})
+
+    async def rebuild_summary(self, game_id: ObjectId):
+        """
+        Función para calcular desde cero el resumen de las reviews de un juego.
+        Se usa para generar los resúmenes de las reviews cargadas por defecto.
+        :param game_id: ID del juego.
+        """
+        pipeline = [
+            {"$match": {"game_id": game_id}},
+            {"$group": {"_id": {"$floor": {"$add": ["$rating", 0.5]}},
+                        "count": {"$sum": 1}, "rating_sum": {"$sum": "$rating"}}}
+        ]
+        buckets = await ReviewRepository.collection.aggregate(pipeline).to_list(length=None)
+        summary = ReviewSummary(
+            id=game_id,
+            count=sum(bucket["count"] for bucket in buckets),
+            rating_sum=sum(bucket["rating_sum"] for bucket in buckets),
+            histogram={str(min(5, int(bucket["_id"]))): bucket["count"] for bucket in buckets}
+        )
+        await self.collection.replace_one({"id": game_id}, summary.dict(), upsert=True)
+        await self.refresh_recent_reviews(game_id)
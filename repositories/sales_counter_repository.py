@@ -0,0 +1,56 @@
+import random
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from decouple import config
+from pymongo import ASCENDING, UpdateOne
+from typing import List
+from db.database import db
+
+# Número de contadores en los que se reparten las ventas de cada juego. Cuantos más haya, menos se pisan
+# las escrituras concurrentes sobre un mismo juego.
+SALES_COUNTER_SHARDS = config("SALES_COUNTER_SHARDS", default=8, cast=int)
+
+
+class SalesCounterRepository:
+    collection: AsyncIOMotorCollection = db.collection("sales_counter_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de contadores de ventas.
+        """
+        await self.collection.create_index([("game_id", ASCENDING), ("shard", ASCENDING)], unique=True)
+
+    async def increment(self, game_id: ObjectId, amount: int = 1, session=None):
+        """
+        Función para sumar ventas a un juego en uno de sus contadores, elegido al azar.
+        :param game_id: ID del juego.
+        :param amount: Número de ventas a sumar.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        """
+        await self.collection.update_one({"game_id": game_id, "shard": random.randrange(SALES_COUNTER_SHARDS)},
+                                         {"$inc": {"count": amount}}, upsert=True, session=session)
+
+    async def get_pending_counters(self) -> List[dict]:
+        """
+        Función para obtener todos los contadores que tienen ventas pendientes de consolidar.
+        :return: Lista con los documentos de los contadores cuyo número de ventas no es 0.
+        """
+        return await self.collection.find({"count": {"$ne": 0}}).to_list(length=None)
+
+    async def discount(self, counters: List[dict], generation: int, session=None):
+        """
+        Función para restar de cada contador las ventas que ya se han consolidado. Se resta la cantidad leída en vez
+        de ponerlo a 0 para no perder las ventas que hayan entrado mientras tanto. Como en los juegos, cada contador
+        guarda la última tanda que se le ha restado, así que repetir una tanda no resta nada.
+        :param counters: Lista con los documentos de los contadores ya consolidados.
+        :param generation: Número de generación de la tanda de ventas.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        """
+        if not counters:
+            return
+        await self.collection.bulk_write(
+            [UpdateOne({"_id": counter["_id"], "rollup_generation": {"$not": {"$gte": generation}}},
+                       {"$inc": {"count": -counter["count"]}, "$set": {"rollup_generation": generation}})
+             for counter in counters],
+            ordered=False, session=session
+        )
@@ -0,0 +1,48 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import Dict, List, Optional
+from db.database import db
+
+# ID del único documento de la colección, con la última tanda de ventas consolidada.
+SALES_ROLLUP_ID = "rollup"
+
+
+class SalesRollupRepository:
+    # Cada tanda se guarda antes de aplicarla, así que si la consolidación se corta, la siguiente la repite.
+    collection: AsyncIOMotorCollection = db.collection("sales_rollup_routes")
+
+    async def get_unfinished_batch(self) -> Optional[dict]:
+        """
+        Función para obtener la última tanda de ventas, si no se llegó a aplicar entera.
+        :return: El documento de la tanda, o None si no hay ninguna a medias.
+        """
+        return await self.collection.find_one({"_id": SALES_ROLLUP_ID, "done": False})
+
+    async def start_batch(self, amounts: Dict[ObjectId, int], counters: List[dict],
+                          purchase_ids: List[ObjectId]) -> dict:
+        """
+        Función para guardar una tanda de ventas antes de aplicarla, con el siguiente número de generación.
+        :param amounts: Diccionario con el número de ventas a sumar a cada juego.
+        :param counters: Documentos de los contadores de ventas que se consolidan.
+        :param purchase_ids: IDs de las compras sin contar que se consolidan.
+        :return: El documento de la tanda.
+        """
+        return await self.collection.find_one_and_update(
+            {"_id": SALES_ROLLUP_ID},
+            {"$inc": {"generation": 1},
+             "$set": {"done": False,
+                      "amounts": [{"game_id": game_id, "amount": amount} for game_id, amount in amounts.items()],
+                      "counters": [{"_id": counter["_id"], "count": counter["count"]} for counter in counters],
+                      "purchase_ids": purchase_ids}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    async def finish_batch(self, generation: int, session=None):
+        """
+        Función para marcar una tanda de ventas como aplicada entera.
+        :param generation: Número de generación de la tanda.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        """
+        await self.collection.update_one({"_id": SALES_ROLLUP_ID, "generation": generation},
+                                         {"$set": {"done": True}}, session=session)
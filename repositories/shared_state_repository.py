@@ -0,0 +1,89 @@
+import datetime
+import re
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Any, Dict, Optional
+from db.database import db
+
+
+def expiration(ttl: Optional[float]) -> Optional[datetime.datetime]:
+    """
+    Función que calcula la fecha de caducidad de una clave.
+    :param ttl: Segundos que dura la clave, o None si no caduca.
+    :return: Fecha de caducidad, o None si no caduca.
+    """
+    if ttl is None:
+        return None
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+
+
+def alive_filter() -> dict:
+    """
+    Función que devuelve el filtro de las claves que no han caducado. Mongo borra las caducadas con el índice TTL,
+    pero solo lo revisa cada minuto, así que también hay que filtrarlas al leer.
+    :return: Filtro de Mongo.
+    """
+    return {"$or": [{"expires_at": None}, {"expires_at": {"$gt": datetime.datetime.utcnow()}}]}
+
+
+class SharedStateRepository:
+    collection: AsyncIOMotorCollection = db.meta_collection("shared_state_routes")
+
+    async def ensure_indexes(self):
+        """
+        Función para crear el índice TTL que borra las claves caducadas.
+        """
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Any:
+        document = await self.collection.find_one({"_id": key, **alive_filter()})
+        return document["value"] if document else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.collection.replace_one({"_id": key}, {"value": value, "expires_at": expiration(ttl)}, upsert=True)
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Función para guardar una clave solo si no existe (o si ha caducado).
+        :return: True si se ha guardado, o False si ya existía.
+        """
+        try:
+            await self.collection.update_one(
+                {"_id": key, "expires_at": {"$ne": None, "$lte": datetime.datetime.utcnow()}},
+                {"$set": {"value": value, "expires_at": expiration(ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        """
+        Función para sumar una cantidad a una clave numérica. La caducidad solo se fija al crear la clave,
+        así que sirve para contadores por ventana de tiempo.
+        :return: El valor después de sumar.
+        """
+        await self.collection.delete_one({"_id": key, "expires_at": {"$ne": None,
+                                                                     "$lte": datetime.datetime.utcnow()}})
+        document = await self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": expiration(ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return document["value"]
+
+    async def delete(self, key: str):
+        await self.collection.delete_one({"_id": key})
+
+    async def items(self, prefix: str) -> Dict[str, Any]:
+        """
+        Función para obtener todas las claves que empiezan por un prefijo.
+        :param prefix: Prefijo de las claves.
+        :return: Diccionario con las claves (sin el prefijo) y sus valores.
+        """
+        documents = await self.collection.find(
+            {"_id": {"$regex": f"^{re.escape(prefix)}"}, **alive_filter()}
+        ).to_list(length=None)
+        return {document["_id"][len(prefix):]: document["value"] for document in documents}
@@ -0,0 +1,83 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReplaceOne
+from typing import List
+from db.database import db
+from model.review_summary import summary_rating
+from repositories.game_repository import GameRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
+
+# ID del ranking que incluye todos los géneros.
+ALL_GENRES = "ALL"
+
+
+def ranking_entry(game: dict) -> dict:
+    """
+    Función que construye la entrada de un juego en un ranking, con su rating calculado a partir de su resumen
+    de reviews. El redondeo se hace aquí y no en el pipeline, igual que en el resto de ratings.
+    :param game: Documento del juego leído por el pipeline, con su resumen.
+    :return: Entrada del ranking.
+    """
+    summary = game["summary"][0] if game["summary"] else {}
+    entry = {key: value for key, value in game.items() if key not in ("genres", "summary")}
+    entry["rating"] = summary_rating(summary.get("count", 0), summary.get("rating_sum", 0))
+    return entry
+
+
+class TopSellerRepository:
+    collection: AsyncIOMotorCollection = db.collection("top_seller_routes")
+
+    async def get_top_sellers(self, genre: str, size: int) -> List[dict]:
+        """
+        Función para obtener los juegos más vendidos de un género, ya precalculados.
+        :param genre: Género del ranking, o ALL_GENRES para el ranking general.
+        :param size: Número de juegos a devolver.
+        :return: Lista con los juegos más vendidos, ordenados de más a menos ventas.
+        """
+        ranking = await self.collection.find_one({"id": genre}, {"games": {"$slice": size}})
+        if ranking:
+            return ranking["games"]
+        return []
+
+    async def rebuild(self, size: int):
+        """
+        Función para volver a calcular los rankings de juegos más vendidos, uno por género y otro general,
+        a partir del número de ventas de cada juego.
+        :param size: Número de juegos que se guardan en cada ranking.
+        """
+        pipeline = [
+            {"$match": {"visible": True}},
+            {"$sort": {"sell_number": -1, "name": 1}},
+            {"$lookup": {
+                "from": ReviewSummaryRepository.collection.name,
+                "localField": "id",
+                "foreignField": "id",
+                "as": "summary"
+            }},
+            {"$project": {
+                "_id": 0, "id": 1, "name": 1, "developer": 1, "publisher": 1, "description": 1, "price": 1,
+                "sell_number": 1, "genres": 1, "summary.count": 1, "summary.rating_sum": 1
+            }},
+            {"$facet": {
+                ALL_GENRES: [{"$limit": size}],
+                "by_genre": [
+                    {"$unwind": "$genres"},
+                    {"$group": {"_id": "$genres", "games": {"$push": "$$ROOT"}}},
+                    {"$project": {"games": {"$slice": ["$games", size]}}}
+                ]
+            }}
+        ]
+        result = await GameRepository.collection.aggregate(pipeline).to_list(length=1)
+        if not result:
+            return
+
+        rankings = {ALL_GENRES: result[0][ALL_GENRES]}
+        for ranking in result[0]["by_genre"]:
+            rankings[ranking["_id"]] = ranking["games"]
+
+        await self.collection.bulk_write(
+            [ReplaceOne({"id": key}, {"id": key, "games": [ranking_entry(game) for game in games]}, upsert=True)
+             for key, games in rankings.items()],
+            ordered=False
+        )
+        # Los géneros que se hayan quedado sin juegos visibles ya no tienen ranking.
+        await self.collection.delete_many({"id": {"$nin": list(rankings)}})
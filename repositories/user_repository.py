@@ -1,12 +1,20 @@
 from fastapi import UploadFile
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
-from typing import List, Optional
-from pydantic import EmailStr
+from pymongo import ASCENDING
+from typing import Dict, List, Optional
+from decouple import config
 from db.database import db
-from model.user import User
+from db.projection import projection
+from db.invalidation_bus import invalidation_bus
+from db.lru_cache import LRUCache
+from model.user import User, UserSummary, USER_SUMMARY_FIELDS
 from repositories import file_repository
 
+# Número máximo de resúmenes de usuarios en la caché, y segundos que dura cada uno.
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", default=10_000, cast=int)
+USER_CACHE_TTL_SECONDS = config("USER_CACHE_TTL_SECONDS", default=30, cast=float)
+
 
 def get_pfp_by_name(name: str) -> str:
     """
@@ -19,7 +27,18 @@ def get_pfp_by_name(name: str) -> str:
 
 
 class UserRepository:
-    collection: AsyncIOMotorCollection = db.client.vgameshop_db.user_routes
+    collection: AsyncIOMotorCollection = db.collection("user_routes")
+    # Las invalidaciones se mandan a todos los workers, así que los demás no siguen devolviendo datos antiguos.
+    summary_cache = invalidation_bus.register(LRUCache("user_summary", USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS))
+
+    async def ensure_indexes(self):
+        """
+        Función para crear los índices de la colección de usuarios. El username y el email son únicos, así que
+        dos registros simultáneos con los mismos datos no pueden crear dos usuarios.
+        """
+        await self.collection.create_index([("id", ASCENDING)], unique=True)
+        await self.collection.create_index([("username", ASCENDING)], unique=True)
+        await self.collection.create_index([("email", ASCENDING)], unique=True)
 
     async def get_user_by_id(self, user_id: ObjectId) -> Optional[User]:
         """
@@ -32,6 +51,62 @@ class UserRepository:
             return User(**user)
         return None
 
+    async def get_users_by_ids(self, user_ids: List[ObjectId]) -> List[User]:
+        """
+        Función para obtener varios usuarios por su ID con una sola consulta.
+        :param user_ids: IDs de los usuarios a buscar.
+        :return: Lista con los usuarios que existen, sin ningún orden concreto.
+        """
+        users = await self.collection.find({"id": {"$in": user_ids}}).to_list(length=None)
+        return [User(**user) for user in users]
+
+    async def get_user_summary_by_id(self, user_id: ObjectId) -> Optional[UserSummary]:
+        """
+        Función para obtener los datos públicos de un usuario por su ID, sin su contraseña ni el resto de campos.
+        Se guardan en caché, así que no hace falta consultar la base de datos para cada review, lista de deseados
+        o librería del mismo usuario.
+        :param user_id: ID del usuario a buscar.
+        :return: Resumen del usuario, o None si no existe.
+        """
+        summary = self.summary_cache.get(user_id)
+        if summary is not None:
+            return summary
+        invalidations = self.summary_cache.invalidations
+        user = await self.collection.find_one({"id": user_id},
+                                              {"_id": 0, **{field: 1 for field in USER_SUMMARY_FIELDS}})
+        if not user:
+            return None
+        summary = UserSummary(**user)
+        self.summary_cache.set(user_id, summary, invalidations)
+        return summary
+
+    async def get_user_summaries_by_ids(self, user_ids: List[ObjectId]) -> Dict[ObjectId, UserSummary]:
+        """
+        Función para obtener los datos públicos de varios usuarios: los que no están en caché se leen con una sola
+        consulta, y se guardan en caché.
+        :param user_ids: IDs de los usuarios a buscar.
+        :return: Diccionario con el resumen de cada usuario que existe.
+        """
+        summaries = {}
+        missing = []
+        for user_id in set(user_ids):
+            summary = self.summary_cache.get(user_id)
+            if summary is not None:
+                summaries[user_id] = summary
+            else:
+                missing.append(user_id)
+        if not missing:
+            return summaries
+        invalidations = self.summary_cache.invalidations
+        users = await self.collection.find({"id": {"$in": missing}},
+                                           {"_id": 0, **{field: 1 for field in USER_SUMMARY_FIELDS}}) \
+            .to_list(length=None)
+        for user in users:
+            summary = UserSummary(**user)
+            self.summary_cache.set(summary.id, summary, invalidations)
+            summaries[summary.id] = summary
+        return summaries
+
     async def get_user_by_username(self, username: str) -> Optional[User]:
         """
         Función para encontrar un usuario por su username.
@@ -43,19 +118,6 @@ class UserRepository:
             return User(**user)
         return None
 
-    async def user_exists_by_username_or_email(self, username: str, email: EmailStr) -> bool:
-        """
-        Función para determinar si existe un usuario en la base de datos con el mismo username o email.
-        :param username: Username del usuario a buscar.
-        :param email: Email del usuario a buscar.
-        :return: True si existe un usuario con el mismo username o email; False en caso contrario.
-        """
-        user_by_username = await self.collection.find_one({"username": username})
-        user_by_email = await self.collection.find_one({"email": email})
-        if user_by_username or user_by_email:
-            return True
-        return False
-
     async def get_users(self) -> List[User]:
         """
         Función para obtener todos los usuarios de la base de datos.
@@ -64,6 +126,25 @@ class UserRepository:
         users = await self.collection.find({}).to_list(length=None)
         return [User(**user) for user in users]
 
+    async def get_user_document_by_id(self, user_id: ObjectId, fields: List[str]) -> Optional[dict]:
+        """
+        Función para leer solo algunos campos de un usuario.
+        :param user_id: ID del usuario.
+        :param fields: Campos a leer, además del ID.
+        :return: Documento con los campos leídos, o None si el usuario no existe.
+        """
+        return await self.collection.find_one({"id": user_id}, projection(fields))
+
+    async def get_user_documents(self, fields: List[str], active: Optional[bool] = None) -> List[dict]:
+        """
+        Función para leer solo algunos campos de todos los usuarios, o de los que tengan la actividad indicada.
+        :param fields: Campos a leer, además del ID.
+        :param active: Si están habilitados o deshabilitados, o None para todos.
+        :return: Lista con los documentos leídos.
+        """
+        query = {} if active is None else {"active": active}
+        return await self.collection.find(query, projection(fields)).to_list(length=None)
+
     async def get_users_active(self, active: bool) -> List[User]:
         """
         Función para obtener todos los usuarios de la base de datos
@@ -78,10 +159,10 @@ class UserRepository:
         """
         Función para insertar un nuevo usuario.
         :param user: Datos del usuario a crear.
-        :return: El usuario creado, o None si no lo pudo crear.
+        :return: El usuario creado. Si ya existe un usuario con el mismo username o email, lanza DuplicateKeyError.
         """
         await self.collection.insert_one(user.dict())
-        return await self.get_user_by_id(user.id)
+        return user
 
     async def update_user(self, user_id: ObjectId, user_data: dict) -> Optional[User]:
         """
@@ -95,6 +176,7 @@ class UserRepository:
             return None
         await self.collection.update_one({"id": user.dict().pop('id', None)},
                                          {"$set": user_data})
+        await invalidation_bus.invalidate(self.summary_cache, user_id)
         return await self.get_user_by_id(user_id)
 
     async def upload_image_for_user(self, file: UploadFile, user_id: ObjectId) -> bool:
@@ -112,6 +194,7 @@ class UserRepository:
         user.profile_picture = pfp
         await self.collection.update_one({"id": user.dict().pop('id', None)},
                                          {"$set": user.dict()})
+        await invalidation_bus.invalidate(self.summary_cache, user_id)
         return True
 
     async def delete_user(self, user_id: ObjectId) -> Optional[User]:
@@ -125,4 +208,5 @@ class UserRepository:
             return None
         user.active = not user.active
         await self.collection.update_one({"id": user.dict().pop('id', None)}, {"$set": user.dict()})
+        await invalidation_bus.invalidate(self.summary_cache, user_id)
         return await self.get_user_by_id(user_id)
@@ -6,7 +6,7 @@ from model.wishlist import Wishlist
 
 
 class WishlistRepository:
-    collection: AsyncIOMotorCollection = db.client.vgameshop_db.wishlist_routes
+    collection: AsyncIOMotorCollection = db.collection("wishlist_routes")
 
     async def get_wishlist_by_id(self, wishlist_id: ObjectId) -> Optional[Wishlist]:
         """
@@ -19,6 +19,23 @@ class WishlistRepository:
             return Wishlist(**wishlist)
         return None
 
+    async def find_game_ids(self, wishlist_id: ObjectId, game_ids: List[ObjectId]) -> Optional[List[ObjectId]]:
+        """
+        Función para saber cuáles de los juegos pasados por parámetro están en la lista de deseados de un usuario,
+        con una sola consulta y sin traer el resto de juegos de la lista.
+        :param wishlist_id: ID del usuario cuya lista de deseados queremos consultar.
+        :param game_ids: IDs de los juegos a buscar.
+        :return: IDs de los juegos que están en la lista de deseados, o None si la lista de deseados no existe.
+        """
+        documents = await self.collection.aggregate([
+            {"$match": {"id": wishlist_id}},
+            {"$project": {"_id": 0, "game_ids": {"$filter": {"input": "$game_ids",
+                                                             "cond": {"$in": ["$$this", game_ids]}}}}}
+        ]).to_list(length=1)
+        if not documents:
+            return None
+        return documents[0]["game_ids"]
+
     async def get_wishlists(self) -> List[Wishlist]:
         """
         Función para obtener todas las listas de deseados.
@@ -50,3 +67,16 @@ class WishlistRepository:
             return None
         await self.collection.update_one({"id": wishlist.dict().pop('id', None)}, {"$set": wishlist_data})
         return await self.get_wishlist_by_id(wishlist_id)
+
+    async def remove_game(self, wishlist_id: ObjectId, game_id: ObjectId, session=None) -> bool:
+        """
+        Función para quitar atómicamente un juego de la lista de deseados de un usuario,
+        sin leerla ni reescribirla entera.
+        :param wishlist_id: ID del usuario cuya lista de deseados queremos modificar.
+        :param game_id: ID del juego a quitar.
+        :param session: Sesión de Mongo, si la operación forma parte de una transacción.
+        :return: True si la lista de deseados existe, False en caso contrario.
+        """
+        result = await self.collection.update_one({"id": wishlist_id}, {"$pull": {"game_ids": game_id}},
+                                                  session=session)
+        return result.matched_count > 0
@@ -1,12 +1,17 @@
 from typing import List
+import uuid
 import jwt
 from datetime import datetime, timedelta
 from decouple import config
 from starlette import status
 from starlette.exceptions import HTTPException
 from model.user import User
+from services.revocation_service import revocation_list
 
 SECRET_KEY = config("SECRET_KEY", default="El_br4inr0t_de_Jujutsu_Ka1sen_me_ha_c0nsum1do_la_v1d4")
+# Los tokens de acceso duran poco, y se renuevan con un refresh token. Comprobarlos no necesita consultar la base de
+# datos, y las revocaciones solo hay que recordarlas durante este tiempo.
+ACCESS_TOKEN_MINUTES = config("ACCESS_TOKEN_MINUTES", default=15, cast=int)
 
 
 def create_access_token(user: User):
@@ -15,12 +20,14 @@ def create_access_token(user: User):
     :param user: Usuario para el cual se va a generar el token.
     :return: El token (un string).
     """
-    expiration = datetime.utcnow() + timedelta(days=1)
+    now = datetime.utcnow()
     payload = {
         "id": str(user.id),
         "username": user.username,
         "role": user.role,
-        "exp": expiration
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_MINUTES)
     }
     token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
     return token
@@ -28,12 +35,14 @@ def create_access_token(user: User):
 
 def decode_access_token(token: str):
     """
-    Función que decodifica el token si es válido.
+    Función que decodifica el token si es válido y no ha sido revocado.
     :param token: Token que queremos descifrar y comprobar su validez.
     :return: El token decodificado o None si no es válido.
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        if revocation_list.is_revoked(payload):
+            return None
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -0,0 +1,313 @@
+import asyncio
+import datetime
+import logging
+import time
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+from bson import ObjectId
+from decouple import config
+from db.invalidation_bus import invalidation_bus
+from model.game import Game
+from repositories.catalogue_file_repository import CATALOGUE_FILE, open_catalogue_file, write_catalogue_file
+from repositories.game_repository import GameRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
+from services.container import Singleton
+from services.deployment_service import DeploymentService, DEPLOYMENT_ID
+from services.metrics_service import metrics, LATENCY_BUCKETS
+
+logger = logging.getLogger("vgameshop.catalogue")
+
+# Si cada worker guarda en memoria el catálogo entero (juegos y ratings) y lee los juegos de ahí en vez de Mongo.
+CATALOGUE_SNAPSHOT = config("CATALOGUE_SNAPSHOT", default=False, cast=bool)
+# Cada cuántos segundos se vuelve a cargar el catálogo entero, por si se hubiera perdido algún cambio.
+CATALOGUE_SNAPSHOT_RELOAD_SECONDS = config("CATALOGUE_SNAPSHOT_RELOAD_SECONDS", default=300, cast=float)
+# Cada cuántos segundos el líder guarda el catálogo en CATALOGUE_FILE, para que los workers que arrancan después
+# lo carguen de ahí en vez de Mongo.
+CATALOGUE_FILE_WRITE_SECONDS = config("CATALOGUE_FILE_WRITE_SECONDS", default=60, cast=float)
+
+
+class CatalogueEntry(NamedTuple):
+    game: Game
+    document: dict
+    rating: float
+
+
+class CatalogueSnapshot:
+    """
+    Copia inmutable del catálogo. Nunca se modifica: cada cambio crea una copia nueva con los juegos cambiados,
+    así que una petición que ya la está leyendo no ve cambios a medias.
+    """
+
+    def __init__(self, entries: Dict[ObjectId, CatalogueEntry]):
+        self.entries: Mapping[ObjectId, CatalogueEntry] = MappingProxyType(entries)
+        # Igual que en Mongo, los juegos se listan de más reciente a más antiguo.
+        self.order: Tuple[CatalogueEntry, ...] = tuple(sorted(entries.values(),
+                                                              key=lambda entry: entry.game.release_date,
+                                                              reverse=True))
+
+    def with_changes(self, changes: Dict[ObjectId, Optional[CatalogueEntry]]) -> "CatalogueSnapshot":
+        """
+        Función que crea una copia del catálogo con algunos juegos cambiados.
+        :param changes: Juegos nuevos o cambiados, o None para los que ya no existen.
+        :return: La copia nueva.
+        """
+        entries = dict(self.entries)
+        for game_id, entry in changes.items():
+            if entry is None:
+                entries.pop(game_id, None)
+            else:
+                entries[game_id] = entry
+        return CatalogueSnapshot(entries)
+
+
+def create_entry(game: Game, rating: float) -> CatalogueEntry:
+    return CatalogueEntry(game=game, document=game.dict(), rating=rating)
+
+
+class CatalogueService:
+    """
+    Catálogo en memoria de cada worker, si CATALOGUE_SNAPSHOT está activado. Mongo sigue siendo la fuente de verdad:
+    al escribir un juego o sus reviews se vuelve a leer ese juego y se cambia en la copia, y los demás workers se
+    enteran a través del bus de invalidaciones.
+    Tiene el mismo nombre, invalidate y clear que las cachés, para poder registrarse en el bus.
+    """
+    game_repository = Singleton(GameRepository)
+    review_summary_repository = Singleton(ReviewSummaryRepository)
+    deployment_service = Singleton(DeploymentService)
+    name = "catalogue"
+
+    def __init__(self):
+        # None si no está activado o todavía no se ha cargado.
+        self.snapshot: Optional[CatalogueSnapshot] = None
+        # Juegos cambiados en otros workers que todavía no se han vuelto a leer, con cuándo se supo del cambio.
+        self.pending: Dict[ObjectId, float] = {}
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.reload_task: Optional[asyncio.Task] = None
+        # Los cambios de la copia se hacen de uno en uno, para que una lectura más antigua no sustituya a una más nueva.
+        self.lock = asyncio.Lock()
+        # Juegos cambiados durante cada carga entera en curso, que hay que volver a leer antes de usar lo cargado.
+        self.loads: List[Set[ObjectId]] = []
+        invalidation_bus.register(self)
+
+    def get_snapshot(self) -> Optional[CatalogueSnapshot]:
+        """
+        Función que devuelve el catálogo en memoria, si se puede usar.
+        :return: El catálogo, o None si no está activado, todavía no se ha cargado o le falta algún cambio hecho en
+        otro worker (mientras tanto se lee de Mongo, que ya lo tiene).
+        """
+        if self.pending:
+            return None
+        return self.snapshot
+
+    async def load(self):
+        """
+        Función para cargar el catálogo entero: todos los juegos con una consulta y sus ratings con otra.
+        Los juegos que cambian mientras tanto se vuelven a leer antes de sustituir la copia, porque lo que ha leído la
+        carga de esos juegos puede ser más antiguo que lo que ya hay en la copia.
+        """
+        loaded_at = time.time()
+        changed: Set[ObjectId] = set()
+        self.loads.append(changed)
+        try:
+            games = await self.game_repository.get_games()
+            ratings = await self.review_summary_repository.get_ratings([game.id for game in games])
+            async with self.lock:
+                snapshot = CatalogueSnapshot({game.id: create_entry(game, ratings.get(game.id, 0)) for game in games})
+                if changed:
+                    snapshot = snapshot.with_changes(await self.read_entries(changed))
+                self.snapshot = snapshot
+        finally:
+            self.loads.remove(changed)
+        self.pending = {game_id: at for game_id, at in self.pending.items() if at > loaded_at}
+        metrics.set("catalogue_snapshot_games", "Games held in the in-memory catalogue.", len(self.snapshot.entries))
+        metrics.set("catalogue_snapshot_loaded_timestamp_seconds", "When the in-memory catalogue was last fully loaded.",
+                    loaded_at)
+        self.set_pending_metric()
+
+    async def refresh_games(self, game_ids: Iterable[ObjectId]):
+        """
+        Función que vuelve a leer algunos juegos y sus ratings y los cambia en una copia nueva del catálogo.
+        Se lee y se cambia con el lock cogido, así que cada lectura de un juego es más nueva que la que sustituye.
+        :param game_ids: IDs de los juegos.
+        """
+        game_ids = list(game_ids)
+        for changed in self.loads:
+            changed.update(game_ids)
+        if self.snapshot is None or not game_ids:
+            return
+        async with self.lock:
+            self.snapshot = self.snapshot.with_changes(await self.read_entries(game_ids))
+        metrics.set("catalogue_snapshot_games", "Games held in the in-memory catalogue.", len(self.snapshot.entries))
+
+    async def read_entries(self, game_ids: Iterable[ObjectId]) -> Dict[ObjectId, Optional[CatalogueEntry]]:
+        """
+        Función que lee de Mongo algunos juegos y sus ratings.
+        :param game_ids: IDs de los juegos.
+        :return: Diccionario con la entrada de cada juego, o None para los que ya no existen.
+        """
+        game_ids = list(game_ids)
+        games, ratings = await asyncio.gather(self.game_repository.get_games_by_ids(game_ids),
+                                              self.review_summary_repository.get_ratings(game_ids))
+        changes: Dict[ObjectId, Optional[CatalogueEntry]] = {game_id: None for game_id in game_ids}
+        for game in games:
+            changes[game.id] = create_entry(game, ratings.get(game.id, 0))
+        return changes
+
+    async def games_changed(self, *game_ids: ObjectId):
+        """
+        Función que usan los servicios después de escribir en uno o varios juegos o en sus reviews: los actualiza
+        en el catálogo de este worker y avisa a los demás.
+        :param game_ids: IDs de los juegos.
+        """
+        if self.snapshot is None:
+            return
+        try:
+            await self.refresh_games(game_ids)
+        except Exception as e:
+            # La escritura ya está hecha, así que no se devuelve un error: se vuelve a intentar en segundo plano.
+            logger.warning("Exception while refreshing the in-memory catalogue, retrying in the background: %s", e)
+            for game_id in game_ids:
+                self.invalidate(game_id)
+        for game_id in game_ids:
+            await invalidation_bus.publish(self, game_id)
+
+    def invalidate(self, game_id: ObjectId):
+        """
+        Función que llama el bus de invalidaciones cuando otro worker cambia un juego. El juego se vuelve a leer
+        en segundo plano; mientras tanto se sigue sirviendo la versión anterior.
+        :param game_id: ID del juego.
+        """
+        if self.snapshot is None:
+            return
+        self.pending.setdefault(game_id, time.time())
+        self.set_pending_metric()
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self.refresh_pending())
+
+    def clear(self):
+        """
+        Función que llama el bus de invalidaciones cuando se han perdido cambios: se vuelve a cargar todo.
+        """
+        if self.snapshot is not None and (self.reload_task is None or self.reload_task.done()):
+            self.reload_task = asyncio.create_task(self.load())
+
+    async def refresh_pending(self):
+        """
+        Función que vuelve a leer los juegos cambiados en otros workers, hasta que no quede ninguno.
+        """
+        while self.pending:
+            pending, self.pending = self.pending, {}
+            try:
+                await self.refresh_games(pending)
+            except Exception as e:
+                logger.warning("Exception while refreshing the in-memory catalogue, retrying: %s", e)
+                self.pending = {**pending, **self.pending}
+                self.set_pending_metric()
+                await asyncio.sleep(1)
+                continue
+            now = time.time()
+            for changed_at in pending.values():
+                metrics.observe("catalogue_snapshot_update_seconds",
+                                "Delay until a change made by another worker reaches the in-memory catalogue.",
+                                LATENCY_BUCKETS, now - changed_at)
+            self.set_pending_metric()
+
+    def load_file(self) -> bool:
+        """
+        Función para cargar el catálogo del archivo que guarda el líder, sin consultar Mongo. Los cambios hechos
+        después de guardarlo llegan por el bus de invalidaciones, o, si no hay bus, con una recarga en segundo plano.
+        :return: True si se ha cargado, o False si no hay archivo de este despliegue.
+        """
+        started_at = time.perf_counter()
+        catalogue_file = open_catalogue_file(CATALOGUE_FILE)
+        if catalogue_file is None:
+            return False
+        try:
+            if catalogue_file.deployment_id != DEPLOYMENT_ID[:32]:
+                return False
+            self.snapshot = CatalogueSnapshot({game.id: create_entry(game, rating) for game, rating in catalogue_file})
+            written_at = catalogue_file.written_at
+        finally:
+            catalogue_file.close()
+        if invalidation_bus.is_shared():
+            invalidation_bus.replay_since(datetime.datetime.fromtimestamp(written_at, datetime.timezone.utc))
+        else:
+            self.clear()
+        metrics.set("catalogue_snapshot_games", "Games held in the in-memory catalogue.", len(self.snapshot.entries))
+        metrics.set("catalogue_snapshot_loaded_timestamp_seconds", "When the in-memory catalogue was last fully loaded.",
+                    written_at)
+        logger.debug("In-memory catalogue loaded from %s in %.1f ms.", CATALOGUE_FILE,
+                     (time.perf_counter() - started_at) * 1000)
+        return True
+
+    async def write_file(self):
+        """
+        Función para guardar el catálogo en memoria en CATALOGUE_FILE, fuera del bucle de eventos.
+        """
+        # Si falta algún cambio de otro worker, se espera a la siguiente vez.
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return
+        games = [(entry.game, entry.rating) for entry in snapshot.order]
+        await asyncio.to_thread(write_catalogue_file, CATALOGUE_FILE, DEPLOYMENT_ID, time.time(), games)
+        metrics.set("catalogue_file_written_timestamp_seconds", "When the leader last wrote the catalogue file.",
+                    time.time())
+
+    async def run_write_periodically(self):
+        """
+        Función que guarda el catálogo en el archivo cada CATALOGUE_FILE_WRITE_SECONDS segundos, hasta que se cancele.
+        Se ejecuta en todos los workers, pero solo lo guarda el que es el líder en ese momento.
+        """
+        while True:
+            await asyncio.sleep(CATALOGUE_FILE_WRITE_SECONDS)
+            if not self.deployment_service.is_leader:
+                continue
+            try:
+                await self.write_file()
+            except Exception:
+                logger.exception("Exception while writing the catalogue file")
+
+    async def prepare(self):
+        """
+        Función que ejecuta el líder después de preparar la base de datos, antes de que arranquen los demás workers:
+        carga el catálogo y lo guarda en el archivo, para que ellos lo carguen de ahí.
+        """
+        if not CATALOGUE_SNAPSHOT:
+            return
+        await self.load()
+        try:
+            await self.write_file()
+        except Exception:
+            logger.exception("Exception while writing the catalogue file")
+
+    def set_pending_metric(self):
+        # Con la hora del cambio pendiente más antiguo, Prometheus puede calcular lo desactualizado que está el catálogo.
+        metrics.set("catalogue_snapshot_oldest_pending_timestamp_seconds",
+                    "When the oldest change not yet applied to the in-memory catalogue was received (0 if none).",
+                    min(self.pending.values(), default=0))
+
+    async def run_reload_periodically(self):
+        """
+        Función que vuelve a cargar el catálogo entero cada CATALOGUE_SNAPSHOT_RELOAD_SECONDS segundos,
+        hasta que se cancele.
+        """
+        while True:
+            await asyncio.sleep(CATALOGUE_SNAPSHOT_RELOAD_SECONDS)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Exception while reloading the in-memory catalogue")
+
+    async def start(self) -> List[asyncio.Task]:
+        """
+        Función que carga el catálogo, si está activado y no lo ha cargado ya prepare(): del archivo del líder si
+        existe, y si no, de Mongo. Se llama antes de que el bus de invalidaciones empiece a leer.
+        :return: Las tareas en segundo plano del catálogo, que hay que cancelar al apagar.
+        """
+        if not CATALOGUE_SNAPSHOT:
+            return []
+        if self.snapshot is None and not self.load_file():
+            invalidation_bus.replay_since(datetime.datetime.now(datetime.timezone.utc))
+            await self.load()
+        return [asyncio.create_task(self.run_reload_periodically()),
+                asyncio.create_task(self.run_write_periodically())]
@@ -0,0 +1,76 @@
+import threading
+from typing import Any, Dict, Generic, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class Container:
+    """
+    Contenedor de dependencias. Crea cada servicio o repositorio la primera vez que se pide, y a partir de ahí
+    devuelve siempre la misma instancia. Así, importar un módulo no construye nada, y arrancar es más rápido.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.instances: Dict[type, Any] = {}
+
+    def get(self, cls: Type[T]) -> T:
+        """
+        Función para obtener la instancia única de una clase, creándola si todavía no existe.
+        :param cls: Clase del servicio o repositorio.
+        :return: La instancia de la clase.
+        """
+        instance = self.instances.get(cls)
+        if instance is None:
+            with self.lock:
+                instance = self.instances.get(cls)
+                if instance is None:
+                    instance = self.instances[cls] = cls()
+        return instance
+
+    def override(self, cls: Type[T], instance: T):
+        """
+        Función para sustituir la instancia de una clase por otra, por ejemplo por una de prueba.
+        :param cls: Clase del servicio o repositorio.
+        :param instance: Instancia que se devolverá a partir de ahora.
+        """
+        with self.lock:
+            self.instances[cls] = instance
+
+    def reset(self):
+        """
+        Función para olvidar todas las instancias creadas.
+        """
+        with self.lock:
+            self.instances.clear()
+
+
+container = Container()
+
+
+class Singleton(Generic[T]):
+    """
+    Atributo de clase que, al usarse, devuelve la instancia única de la clase indicada del contenedor.
+    Sustituye a crear las dependencias como atributos de clase (user_service = UserService()), que las construía
+    todas al importar el módulo.
+    """
+
+    def __init__(self, cls: Type[T]):
+        self.cls = cls
+
+    def __get__(self, instance, owner) -> T:
+        return container.get(self.cls)
+
+
+class Lazy(Generic[T]):
+    """
+    Variable de módulo que se comporta como la instancia única de la clase indicada del contenedor, pero que no la
+    pide hasta que se usa. Sustituye a pedirla al importar el módulo (user_service = container.get(UserService)),
+    que construía el servicio y todas sus dependencias al importar los controladores.
+    """
+
+    def __init__(self, cls: Type[T]):
+        self.cls = cls
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(container.get(self.cls), name)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Optional
+from decouple import config
+from db.database import db
+from repositories.deployment_repository import DeploymentRepository
+from services.metrics_service import metrics
+from services.container import Singleton
+
+logger = logging.getLogger("vgameshop.deployment")
+
+# ID del despliegue. El proceso principal lo genera antes de arrancar los workers, que lo heredan, así que todos los
+# workers de un mismo arranque comparten el ID. Si se arranca un único proceso sin él, se genera uno nuevo.
+DEPLOYMENT_ID = config("DEPLOYMENT_ID", default=uuid.uuid4().hex)
+# Segundos que un worker espera a que el líder prepare la base de datos antes de darse por vencido.
+LEADER_WAIT_SECONDS = config("LEADER_WAIT_SECONDS", default=120, cast=float)
+LEADER_POLL_SECONDS = 0.5
+# Segundos que dura el liderazgo si el líder no lo renueva (porque se ha colgado o ha muerto). Pasado ese tiempo, otro
+# worker se queda con él. El líder lo renueva tres veces en ese tiempo.
+LEADER_LEASE_SECONDS = config("LEADER_LEASE_SECONDS", default=15, cast=float)
+
+
+class DeploymentService:
+    """
+    Coordina el arranque de los workers de un despliegue: uno de ellos (el líder) borra y prepara la base de datos
+    y ejecuta las tareas que no se pueden repetir en paralelo, y los demás esperan a que termine.
+    El liderazgo caduca si no se renueva, así que si el líder muere, otro worker se queda con él y sigue ejecutando
+    esas tareas. Por eso las tareas del líder miran is_leader cada vez, en vez de solo al arrancar.
+    También guarda si el worker está listo para recibir peticiones.
+    """
+    deployment_repository = Singleton(DeploymentRepository)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    is_leader = False
+    ready = False
+    lease_task: Optional[asyncio.Task] = None
+
+    async def start(self, prepare_database: Callable[[], Awaitable[None]]) -> bool:
+        """
+        Función para arrancar el worker. Si es el líder, prepara la base de datos; si no, espera a que el líder
+        termine de hacerlo.
+        :param prepare_database: Función que borra y vuelve a generar la base de datos.
+        :return: True si el worker es el líder.
+        """
+        self.set_leader(await self.deployment_repository.acquire_leadership(DEPLOYMENT_ID, self.worker,
+                                                                            LEADER_LEASE_SECONDS))
+        if self.is_leader:
+            logger.info("Worker %s is the leader of deployment %s, preparing the database.", self.worker, DEPLOYMENT_ID)
+            # Mientras se prepara la base de datos, el liderazgo ya se renueva.
+            DeploymentService.lease_task = asyncio.create_task(self.run_lease_periodically())
+            await prepare_database()
+            await self.deployment_repository.mark_ready(DEPLOYMENT_ID)
+        else:
+            await self.wait_for_leader()
+            DeploymentService.lease_task = asyncio.create_task(self.run_lease_periodically())
+        return self.is_leader
+
+    def set_leader(self, is_leader: bool):
+        DeploymentService.is_leader = is_leader
+        metrics.set("deployment_leader", "Whether this worker is the leader of its deployment.",
+                    int(is_leader), worker=self.worker)
+
+    async def run_lease_periodically(self):
+        """
+        Función que renueva el liderazgo (si el worker es el líder) o intenta quedárselo (si ha caducado), tres veces
+        cada LEADER_LEASE_SECONDS segundos, hasta que se cancele. Si no puede comprobarlo, deja de considerarse el
+        líder, porque otro worker puede quedarse con el liderazgo mientras tanto.
+        """
+        while True:
+            await asyncio.sleep(LEADER_LEASE_SECONDS / 3)
+            was_leader = self.is_leader
+            try:
+                self.set_leader(await self.deployment_repository.renew_leadership(DEPLOYMENT_ID, self.worker,
+                                                                                  LEADER_LEASE_SECONDS))
+            except Exception:
+                logger.exception("Exception while renewing the deployment leadership")
+                self.set_leader(False)
+            if self.is_leader and not was_leader:
+                logger.info("Worker %s is now the leader of deployment %s.", self.worker, DEPLOYMENT_ID)
+            elif was_leader and not self.is_leader:
+                logger.warning("Worker %s is no longer the leader of deployment %s.", self.worker, DEPLOYMENT_ID)
+
+    async def stop(self):
+        """
+        Función que deja de renovar el liderazgo al apagar el worker, y si es el líder, lo deja libre para otro.
+        """
+        if self.lease_task is not None:
+            self.lease_task.cancel()
+            await asyncio.gather(self.lease_task, return_exceptions=True)
+            DeploymentService.lease_task = None
+        if self.is_leader:
+            await self.deployment_repository.release_leadership(DEPLOYMENT_ID, self.worker)
+            self.set_leader(False)
+
+    async def wait_for_leader(self):
+        """
+        Función que espera a que el líder del despliegue haya preparado la base de datos.
+        Falla (y por tanto el worker no arranca) si tarda más de LEADER_WAIT_SECONDS segundos.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LEADER_WAIT_SECONDS
+        while loop.time() < deadline:
+            state = await self.deployment_repository.get_state()
+            if state and state["deployment_id"] == DEPLOYMENT_ID and state["ready"]:
+                logger.debug("Worker %s joined deployment %s led by %s.", self.worker, DEPLOYMENT_ID, state["leader"])
+                return
+            await asyncio.sleep(LEADER_POLL_SECONDS)
+        raise RuntimeError(f"The leader of deployment {DEPLOYMENT_ID} did not prepare the database "
+                           f"in {LEADER_WAIT_SECONDS} seconds.")
+
+    @staticmethod
+    def set_ready(ready: bool):
+        """
+        Función para indicar si el worker puede recibir peticiones. Se desactiva al empezar a apagarse,
+        para que el balanceador deje de mandarle peticiones mientras termina las que tiene.
+        :param ready: Si el worker está listo.
+        """
+        DeploymentService.ready = ready
+
+    async def check_ready(self) -> bool:
+        """
+        Función que comprueba si el worker está listo: ha terminado de arrancar, no se está apagando
+        y llega a la base de datos.
+        :return: True si el worker está listo.
+        """
+        if not self.ready:
+            return False
+        try:
+            await db.get_database().command("ping")
+            return True
+        except Exception as e:
+            logger.warning("Readiness check failed: %s", e)
+            return False
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Callable, List, Optional, Set
+from decouple import config
+from db.database import MONGO_URL
+from repositories.game_repository import GameRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
+from services.metrics_service import metrics
+
+logger = logging.getLogger("vgameshop.events")
+
+# De dónde salen los eventos: "change_streams" los lee de los change streams de Mongo (necesita un replica set, y así
+# llegan los cambios hechos en cualquier worker), "local" los genera cada worker al escribir (solo ve sus cambios),
+# y "auto" usa los change streams si Mongo los permite al arrancar, y si no, los locales.
+EVENTS_SOURCE = config("EVENTS_SOURCE", default="auto")
+# Eventos pendientes que se guardan por cliente. Si un cliente no los lee a tiempo, se descartan y se le manda
+# un evento "resync" para que vuelva a pedir los datos.
+EVENTS_QUEUE_SIZE = config("EVENTS_QUEUE_SIZE", default=100, cast=int)
+EVENTS_MAX_SUBSCRIBERS = config("EVENTS_MAX_SUBSCRIBERS", default=1000, cast=int)
+# Cada cuántos segundos se manda un comentario a los clientes sin eventos, para que los proxies no cierren la conexión.
+EVENTS_HEARTBEAT_SECONDS = config("EVENTS_HEARTBEAT_SECONDS", default=15, cast=float)
+# Segundos que esperan los clientes antes de reconectarse, y el lector de change streams antes de reabrirlos.
+EVENTS_RETRY_SECONDS = config("EVENTS_RETRY_SECONDS", default=5, cast=float)
+
+EVENT_TOPICS = ("games", "reviews")
+# Cambios de los juegos que no se publican: la consolidación de ventas cambia el número de ventas (y la tanda de ventas
+# que se le ha sumado) continuamente, y las imágenes de muestra se asocian en segundo plano (los servicios tampoco
+# publican esos cambios).
+IGNORED_GAME_FIELDS = {"sell_number", "rollup_generation", "game_showcase_images"}
+
+
+def game_event_data(game: dict) -> dict:
+    return {"game_id": str(game["id"]), "name": game["name"], "price": game["price"], "visible": game["visible"]}
+
+
+def format_event(event: dict) -> str:
+    """
+    Función que escribe un evento en el formato de Server-Sent Events.
+    :param event: Evento.
+    :return: Texto del evento.
+    """
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscriber:
+    """
+    Cliente conectado al feed de eventos, con los temas (y opcionalmente el juego) que le interesan y una cola
+    limitada de eventos pendientes de mandar.
+    """
+
+    def __init__(self, topics: Set[str], game_id: Optional[str]):
+        self.topics = topics
+        self.game_id = game_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+    def matches(self, event: dict) -> bool:
+        if event["topic"] not in self.topics:
+            return False
+        return self.game_id is None or event["data"].get("game_id") == self.game_id
+
+    def offer(self, event: dict):
+        """
+        Función para añadir un evento a la cola sin esperar. Si está llena, el cliente va demasiado lento: se vacía
+        y se deja solo un evento "resync", así que la memoria que ocupa cada cliente está limitada.
+        :param event: Evento.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            dropped = self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "resync", "topic": event["topic"], "data": {}})
+            metrics.inc("events_dropped_total", "Events dropped because a subscriber fell behind.", dropped + 1)
+
+
+class EventBus:
+    """
+    Reparte los eventos de cambios del catálogo y de las reviews entre los clientes conectados a este worker.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.sequence = 0
+        # Si los eventos los generan los servicios al escribir, en vez de los change streams.
+        self.local = True
+
+    def subscribe(self, topics: Set[str], game_id: Optional[str]) -> Optional[Subscriber]:
+        """
+        Función para conectar un cliente al feed.
+        :param topics: Temas que le interesan.
+        :param game_id: ID del juego que le interesa, o None para todos.
+        :return: El cliente, o None si ya hay EVENTS_MAX_SUBSCRIBERS clientes conectados.
+        """
+        if len(self.subscribers) >= EVENTS_MAX_SUBSCRIBERS:
+            return None
+        subscriber = Subscriber(topics, game_id)
+        self.subscribers.add(subscriber)
+        metrics.set("events_subscribers", "Clients connected to the event feed.", len(self.subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        metrics.set("events_subscribers", "Clients connected to the event feed.", len(self.subscribers))
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[str]:
+        """
+        Función que genera el texto que se manda a un cliente: sus eventos según van llegando, y un comentario cada
+        EVENTS_HEARTBEAT_SECONDS segundos sin eventos. Al terminar (cuando el cliente se desconecta), lo desconecta
+        del feed.
+        :param subscriber: Cliente.
+        :return: Generador con el texto de cada evento.
+        """
+        try:
+            # La primera línea sale enseguida, para que el cliente reciba las cabeceras sin esperar al primer evento.
+            yield f"retry: {int(EVENTS_RETRY_SECONDS * 1000)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def publish(self, event_type: str, topic: str, data: dict):
+        """
+        Función para mandar un evento a todos los clientes interesados. No espera a ninguno.
+        :param event_type: Tipo del evento.
+        :param topic: Tema del evento.
+        :param data: Datos del evento.
+        """
+        self.sequence += 1
+        event = {"id": self.sequence, "type": event_type, "topic": topic, "data": data}
+        for subscriber in list(self.subscribers):
+            if subscriber.matches(event):
+                subscriber.offer(event)
+        metrics.inc("events_published_total", "Events published to the event feed.", type=event_type)
+
+    def publish_local(self, event_type: str, topic: str, data: dict):
+        """
+        Función que usan los servicios después de escribir. Si los eventos salen de los change streams no hace nada,
+        porque el cambio ya llegará por ahí.
+        """
+        if self.local:
+            self.publish(event_type, topic, data)
+
+    async def start(self) -> List[asyncio.Task]:
+        """
+        Función que decide de dónde salen los eventos y, si es de los change streams, empieza a leerlos.
+        :return: Las tareas que leen los change streams, que hay que cancelar al apagar.
+        """
+        if EVENTS_SOURCE == "local" or MONGO_URL.startswith("mongomock://"):
+            return []
+        if EVENTS_SOURCE == "auto":
+            try:
+                async with GameRepository.collection.watch():
+                    pass
+            except Exception as e:
+                logger.warning("Change streams are not available (%s), events are published locally.", e)
+                return []
+        self.local = False
+        return [asyncio.create_task(self.watch(GameRepository.collection, game_change_event)),
+                asyncio.create_task(self.watch(ReviewSummaryRepository.collection, review_summary_change_event))]
+
+    async def watch(self, collection, to_event: Callable[[dict], Optional[tuple]]):
+        """
+        Función que lee el change stream de una colección y publica sus cambios, hasta que se cancele.
+        Si se corta, se vuelve a abrir donde se quedó, con el resume token del último cambio leído.
+        :param collection: Colección.
+        :param to_event: Función que convierte un cambio en (tipo, tema, datos), o en None si no interesa.
+        """
+        resume_token = None
+        while True:
+            try:
+                async with collection.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        if change["operationType"] == "invalidate":
+                            # La colección se ha borrado: el stream ya no se puede reanudar, se abre uno nuevo.
+                            resume_token = None
+                            break
+                        event = to_event(change)
+                        if event is not None:
+                            self.publish(*event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Exception while watching %s", collection.name)
+                await asyncio.sleep(EVENTS_RETRY_SECONDS)
+
+
+def game_change_event(change: dict) -> Optional[tuple]:
+    game = change.get("fullDocument")
+    if game is None:
+        return None
+    if change["operationType"] == "insert":
+        return "game_created", "games", game_event_data(game)
+    # Los cambios de un elemento de una lista llegan como "campo.posición", así que solo se mira el campo.
+    updated_fields = {field.split(".")[0] for field in change.get("updateDescription", {}).get("updatedFields", {})}
+    if change["operationType"] == "update" and updated_fields <= IGNORED_GAME_FIELDS:
+        return None
+    return "game_updated", "games", game_event_data(game)
+
+
+def review_summary_change_event(change: dict) -> Optional[tuple]:
+    summary = change.get("fullDocument")
+    if summary is None:
+        return None
+    return "reviews_changed", "reviews", {"game_id": str(summary["id"])}
+
+
+event_bus = EventBus()
@@ -1,35 +1,95 @@
+import asyncio
 import os.path
-from typing import List, Set
+from typing import List, Optional
 from bson import ObjectId
+from decouple import config
 from fastapi import UploadFile, HTTPException, status
-from dto.game_dto import GameDto, GameDtoCreate, GameDtoUpdate, GameDtoShort
-from repositories.game_repository import GameRepository, get_game_downloadable_by_name, get_image_by_name
+from pymongo.errors import DuplicateKeyError
+from db.invalidation_bus import invalidation_bus
+from dto.game_dto import GameDto, GameDtoCreate, GameDtoUpdate, GameDtoShort, GameDtoBatchEntry
+from dto.job_dto import JobDto
+from model.game import Game
+from repositories.game_repository import (GameRepository, get_game_downloadable_by_name, get_image_by_name,
+                                          sniff_showcase_image, stage_showcase_image, delete_staged_showcase_image,
+                                          store_showcase_image, create_showcase_thumbnail,
+                                          get_showcase_thumbnail_by_name, delete_showcase_image)
 from repositories.review_repository import ReviewRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
+from services.catalogue_service import CatalogueService, CatalogueEntry
+from services.container import Singleton
+from services.event_service import event_bus, game_event_data
+from services.job_service import JobService
+from services.single_flight_service import SingleFlight
+from services.version_service import resource_versions
 
+# Tamaño máximo en píxeles del lado más largo de las copias reducidas de las imágenes de muestra.
+SHOWCASE_THUMBNAIL_SIZE = config("SHOWCASE_THUMBNAIL_SIZE", default=320, cast=int)
+# Número máximo de imágenes de muestra de una misma subida que se guardan en disco a la vez.
+SHOWCASE_UPLOAD_CONCURRENCY = config("SHOWCASE_UPLOAD_CONCURRENCY", default=4, cast=int)
 
-def get_showcase_image(name: str):
+# Número máximo de juegos que se pueden pedir a la vez.
+GAMES_BATCH_MAX_IDS = config("GAMES_BATCH_MAX_IDS", default=100, cast=int)
+
+# Tipos de las tareas en segundo plano de los juegos.
+INGEST_SHOWCASE_IMAGES_JOB = "ingest_showcase_images"
+CREATE_SHOWCASE_THUMBNAILS_JOB = "create_showcase_thumbnails"
+DELETE_SHOWCASE_IMAGES_JOB = "delete_showcase_images"
+
+# Lecturas de un juego por ID que se hacen a la vez, por ejemplo en un lanzamiento.
+game_flight = invalidation_bus.register(SingleFlight("game"))
+
+
+def get_showcase_image(name: str, thumbnail: bool = False):
     """
     Función que devuelve el path completo de la imágen guardada que coincida con ese nombre,
     o el de una imágen por defecto si no existe.
     :param name: El nombre de la imágen que queremos.
+    :param thumbnail: Si queremos la copia reducida. Si todavía no se ha creado, se devuelve la imágen original.
     :return: String con la ruta absoluta de la imágen.
     """
+    if thumbnail:
+        thumbnail_path = get_showcase_thumbnail_by_name(name)
+        if thumbnail_path is not None:
+            return thumbnail_path
     return get_image_by_name(name)
 
 
 class GameService:
-    game_repository = GameRepository()
-    review_repository = ReviewRepository()
+    game_repository = Singleton(GameRepository)
+    review_repository = Singleton(ReviewRepository)
+    review_summary_repository = Singleton(ReviewSummaryRepository)
+    job_service = Singleton(JobService)
+    catalogue_service = Singleton(CatalogueService)
 
-    async def get_all_games(self) -> List[GameDto]:
+    def get_catalogue_entry(self, game_id: ObjectId) -> Optional[CatalogueEntry]:
         """
-        Función que obtiene todos los juegos de la base de datos como una lista de DTO de juegos,
-        ordenados por su fecha de lanzamiento.
-        :return: Lista de GameDto ordenada por fecha de lanzamiento.
+        Función que busca un juego en el catálogo en memoria.
+        :param game_id: ID del juego.
+        :return: El juego y su rating, o None si el catálogo no está cargado o no tiene el juego (en ese caso se
+        busca en Mongo, por si se acaba de crear en otro worker).
         """
-        games = await self.game_repository.get_games()
-        return sorted([await GameDto.from_game(game, self.review_repository) for game in games],
-                      key=lambda game_dto: game_dto.release_date, reverse=True)
+        snapshot = self.catalogue_service.get_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot.entries.get(game_id)
+
+    async def get_all_games(self, fields: List[str]) -> List[dict]:
+        """
+        Función que obtiene todos los juegos de la base de datos, ordenados por su fecha de lanzamiento, leyendo solo
+        los campos pedidos. Si se pide el rating, se leen los de todos los juegos de sus resúmenes con una consulta.
+        Si el catálogo en memoria está cargado, se leen de ahí sin ninguna consulta.
+        :param fields: Campos de GameDto que se quieren.
+        :return: Lista de diccionarios con los campos pedidos de cada juego, ordenada por fecha de lanzamiento.
+        """
+        snapshot = self.catalogue_service.get_snapshot()
+        if snapshot is not None:
+            return [GameDto.fields_from_document(entry.document, entry.rating, fields) for entry in snapshot.order]
+        documents = await self.game_repository.get_game_documents([field for field in fields if field != "rating"])
+        ratings = {}
+        if "rating" in fields:
+            ratings = await self.review_summary_repository.get_ratings([document["id"] for document in documents])
+        return [GameDto.fields_from_document(document, ratings.get(document["id"], 0), fields)
+                for document in documents]
 
     async def get_game_by_id(self, game_id: ObjectId) -> GameDto:
         """
@@ -37,12 +97,87 @@ class GameService:
         :param game_id: ID del juego que queremos buscar.
         :return: El DTO del juego, o 404 si no existe.
         """
+        entry = self.get_catalogue_entry(game_id)
+        if entry is not None:
+            return GameDto.from_game_and_rating(entry.game, entry.rating)
+        return await game_flight.do(game_id, lambda: self.read_game_by_id(game_id))
+
+    async def read_game_by_id(self, game_id: ObjectId) -> GameDto:
+        """
+        Función que lee de Mongo el juego cuyo ID coincida con el pasado por parámetro, y sus reviews para el rating.
+        Las peticiones iguales que llegan a la vez comparten una sola lectura.
+        :param game_id: ID del juego que queremos buscar.
+        :return: El DTO del juego, o 404 si no existe.
+        """
         game = await self.game_repository.get_game_by_id(game_id)
         if not game:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
         return await GameDto.from_game(game, self.review_repository)
 
+    async def get_game_fields_by_id(self, game_id: ObjectId, fields: List[str]) -> dict:
+        """
+        Función que obtiene solo los campos pedidos del juego cuyo ID coincida con el pasado por parámetro.
+        :param game_id: ID del juego que queremos buscar.
+        :param fields: Campos de GameDto que se quieren.
+        :return: Diccionario con los campos pedidos del juego, o 404 si no existe.
+        """
+        entry = self.get_catalogue_entry(game_id)
+        if entry is not None:
+            return GameDto.fields_from_document(entry.document, entry.rating, fields)
+        document = await self.game_repository.get_game_document_by_id(
+            game_id, [field for field in fields if field != "rating"])
+        if not document:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Game with ID: {game_id} not found.")
+        rating = 0
+        if "rating" in fields:
+            rating = (await self.review_summary_repository.get_ratings([game_id])).get(game_id, 0)
+        return GameDto.fields_from_document(document, rating, fields)
+
+    async def get_games_by_ids(self, game_ids: List[str]) -> List[GameDtoBatchEntry]:
+        """
+        Función que obtiene varios juegos a la vez: una consulta para los juegos y otra, a la vez, para sus ratings,
+        que se leen de los resúmenes de reviews en vez de recorrer las reviews de cada juego.
+        :param game_ids: IDs de los juegos, tal y como los manda el cliente.
+        :return: Lista con una entrada por cada ID, en el mismo orden, con el juego o con None si no existe
+        (o si el ID no es válido), o 400 si se piden más de GAMES_BATCH_MAX_IDS juegos.
+        """
+        if len(game_ids) > GAMES_BATCH_MAX_IDS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {GAMES_BATCH_MAX_IDS} games can be requested at once.")
+        valid_ids = list({ObjectId(game_id) for game_id in game_ids if ObjectId.is_valid(game_id)})
+        snapshot = self.catalogue_service.get_snapshot()
+        if snapshot is not None:
+            entries = [snapshot.entries.get(game_id) for game_id in valid_ids]
+            games_by_id = {str(entry.game.id): GameDto.from_game_and_rating(entry.game, entry.rating)
+                           for entry in entries if entry is not None}
+            return [GameDtoBatchEntry(id=game_id, game=games_by_id.get(game_id)) for game_id in game_ids]
+        games, ratings = await asyncio.gather(self.game_repository.get_games_by_ids(valid_ids),
+                                              self.review_summary_repository.get_ratings(valid_ids))
+        games_by_id = {str(game.id): GameDto.from_game_and_rating(game, ratings.get(game.id, 0)) for game in games}
+        return [GameDtoBatchEntry(id=game_id, game=games_by_id.get(game_id)) for game_id in game_ids]
+
+    async def get_games_by_ids_short(self, game_ids: List[ObjectId]) -> List[GameDtoShort]:
+        """
+        Función que obtiene varios juegos con una cantidad reducida de campos, para las librerías y las listas de
+        deseados: una consulta para los juegos y otra, a la vez, para sus ratings, en vez de dos por cada juego.
+        :param game_ids: IDs de los juegos.
+        :return: Lista con el DTO corto de cada juego que existe, en el mismo orden.
+        """
+        if not game_ids:
+            return []
+        snapshot = self.catalogue_service.get_snapshot()
+        if snapshot is not None:
+            entries = [snapshot.entries.get(game_id) for game_id in game_ids]
+            return [GameDtoShort.from_game_and_rating(entry.game, entry.rating) for entry in entries if entry]
+        unique_ids = list(set(game_ids))
+        games, ratings = await asyncio.gather(self.game_repository.get_games_by_ids(unique_ids),
+                                              self.review_summary_repository.get_ratings(unique_ids))
+        games_by_id = {game.id: game for game in games}
+        return [GameDtoShort.from_game_and_rating(games_by_id[game_id], ratings.get(game_id, 0))
+                for game_id in game_ids if game_id in games_by_id]
+
     async def get_game_by_id_short(self, game_id: ObjectId) -> GameDtoShort:
         """
         Función que obtiene el juego cuyo ID coincida con el pasado por parámetro,
@@ -50,35 +185,27 @@ class GameService:
         :param game_id: ID del juego que queremos buscar.
         :return: El DTO corto del juego, o 404 si no existe.
         """
+        entry = self.get_catalogue_entry(game_id)
+        if entry is not None:
+            return GameDtoShort.from_game_and_rating(entry.game, entry.rating)
         game = await self.game_repository.get_game_by_id(game_id)
         if not game:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
         return await GameDtoShort.from_game(game, self.review_repository)
 
-    async def get_game_by_name_and_dev(self, name: str, dev: str) -> GameDto | None:
-        """
-        Función que busca un juego por nombre y desarrollador.
-        :param name: Nombre del juego
-        :param dev: Desarrollador del juego
-        :return: El DTO del juego encontrado, o None si no encontró ninguno.
-        """
-        game = await self.game_repository.get_game_by_name_and_dev(name, dev)
-        if not game:
-            return None
-        return await GameDto.from_game(game, self.review_repository)
-
     async def create_game(self, game_dto: GameDtoCreate) -> GameDto:
         """
         Función que inserta un juego en la base de datos.
         :param game_dto: DTO de creación del juego.
-        :return: DTO del juego creado, o 503 si hay un error al crear el juego.
+        :return: DTO del juego creado, o 409 si ya existe un juego con el mismo nombre y desarrollador.
         """
-        game = await self.game_repository.create_game(game_dto.to_game())
-        if not game:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail=f"There was an error when creating game: {game_dto.name} -"
-                                       f" {game_dto.developer}.")
+        try:
+            game = await self.game_repository.create_game(game_dto.to_game())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Already exists a game with the same name and developer.")
+        await self.record_change(game.id, event="game_created", game=game)
         return await GameDto.from_game(game, self.review_repository)
 
     async def update_game(self, game_id: ObjectId, game_dto: GameDtoUpdate) -> GameDto:
@@ -86,17 +213,23 @@ class GameService:
         Función que actualiza los datos del juego cuyo ID coincida con el pasado por parámetro.
         :param game_id: ID del juego que queremos modificar.
         :param game_dto: Datos a modificar del juego.
-        :return: DTO del juego modificado, o 404 si el juego no existe, o 503 si no se pudo modificar.
+        :return: DTO del juego modificado, 404 si el juego no existe, 409 si ya existe otro juego con el mismo nombre
+        y desarrollador, o 503 si no se pudo modificar.
         """
         game = await self.game_repository.get_game_by_id(game_id)
         if not game:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
-        updated_game = await self.game_repository.update_game(game_id, game_dto.to_game(game).dict())
+        try:
+            updated_game = await self.game_repository.update_game(game_id, game_dto.to_game_data(game))
+        except DuplicateKeyError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Already exists a game with the same name and developer.")
         if not updated_game:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when updating game: {game_dto.name} -"
                                        f" {game_dto.developer}.")
+        await self.record_change(game_id, event="game_updated", game=updated_game)
         return await GameDto.from_game(game, self.review_repository)
     
     async def upload_main_image(self, game_id: ObjectId, file: UploadFile) -> bool:
@@ -117,52 +250,114 @@ class GameService:
 
         return await self.game_repository.upload_main_image(file, game_id)
     
-    async def upload_showcase_images(self, game_id: ObjectId, files: Set[UploadFile]) -> GameDto:
+    async def upload_showcase_images(self, game_id: ObjectId, files: List[UploadFile]) -> JobDto:
         """
         Función para subir las imágenes de muestra del juego cuyo ID coincida con el pasado por parámetro.
+        Las imágenes solo se guardan en disco, varias a la vez; asociarlas al juego (con una única escritura)
+        y crear sus copias reducidas se hace en segundo plano, en una tarea cuyo estado se puede consultar.
         :param game_id: ID del juego al cual le queremos asignar las imágenes.
         :param files: Imágenes del juego.
-        :return: DTO con los datos actualizados, 404 si el juego no existe, 400 si algún archivo no es una imágen
-        o 503 si no pudo actualizar el juego.
+        :return: DTO de la tarea que asocia las imágenes al juego, 404 si el juego no existe
+        o 400 si algún archivo no es una imágen.
         """
-        game = await self.game_repository.get_game_by_id(game_id)
-        if not game:
+        if not await self.game_repository.game_exists(game_id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
-        for file in files:
-            if not file.content_type.startswith("image/"):
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                                    detail="Uploaded file is not an image.")
+        # El tipo que manda el cliente no es fiable, así que se mira el contenido de los archivos.
+        extensions = [await sniff_showcase_image(file) for file in files]
+        if None in extensions:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
+                                detail="Uploaded file is not an image.")
 
-            await self.game_repository.upload_showcase_image(file, game_id)
+        semaphore = asyncio.Semaphore(SHOWCASE_UPLOAD_CONCURRENCY)
 
-        updated_game = await self.game_repository.get_game_by_id(game_id)
-        if not updated_game:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail=f"There was an error when updating game with ID: {game_id}.")
-        return await GameDto.from_game(updated_game, self.review_repository)
+        async def stage(file: UploadFile, extension: str) -> dict:
+            async with semaphore:
+                filename, _ = os.path.splitext(file.filename)
+                return {"path": await stage_showcase_image(file, extension), "name": filename}
+
+        results = await asyncio.gather(*[stage(file, extension) for file, extension in zip(files, extensions)],
+                                       return_exceptions=True)
+        images = [result for result in results if not isinstance(result, BaseException)]
+        if len(images) < len(results):
+            # Si alguna no se pudo guardar, no se sube ninguna.
+            for image in images:
+                delete_staged_showcase_image(image["path"])
+            raise next(result for result in results if isinstance(result, BaseException))
+        job = await self.job_service.enqueue(INGEST_SHOWCASE_IMAGES_JOB, {"game_id": game_id, "images": images})
+        return JobDto.from_job(job)
+
+    async def ingest_showcase_images(self, payload: dict):
+        """
+        Tarea en segundo plano que mueve las imágenes de muestra subidas a la carpeta de imágenes de juegos,
+        las asocia al juego con una única escritura y programa la creación de sus copias reducidas.
+        :param payload: ID del juego e imágenes subidas (ruta en la carpeta de subidas y nombre original).
+        """
+        game_id = payload["game_id"]
+        names = [store_showcase_image(image["path"], game_id, image["name"]) for image in payload["images"]]
+        if not await self.game_repository.add_showcase_images(game_id, names):
+            # El juego ya no existe, así que las imágenes no se van a usar.
+            await self.job_service.enqueue(DELETE_SHOWCASE_IMAGES_JOB, {"images": names})
+            return
+        await self.record_change(game_id)
+        await self.job_service.enqueue(CREATE_SHOWCASE_THUMBNAILS_JOB, {"images": names})
+
+    async def create_showcase_thumbnails(self, payload: dict):
+        """
+        Tarea en segundo plano que crea las copias reducidas de las imágenes de muestra, fuera del bucle de eventos.
+        :param payload: Nombres de las imágenes.
+        """
+        for name in payload["images"]:
+            await asyncio.to_thread(create_showcase_thumbnail, name, SHOWCASE_THUMBNAIL_SIZE)
+
+    async def delete_showcase_images(self, payload: dict):
+        """
+        Tarea en segundo plano que borra del disco las imágenes de muestra que ya no usa ningún juego.
+        :param payload: Nombres de las imágenes.
+        """
+        for name in payload["images"]:
+            delete_showcase_image(name)
 
     async def clear_showcase_images(self, game_id: ObjectId) -> bool:
         """
         Función para quitar todas las imágenes de muestra del juego cuyo ID coincida con el pasado por parámetro.
+        Los archivos se borran después, en segundo plano.
         :param game_id: ID del juego cuyas imágenes de muestra queremos eliminar.
-        :return: True si las imágenes fueron correctamente eliminadas, 404 si el juego no existe o 503 si hubo un error
-        a la hora de eliminar las imágenes (como no poder conectar con la base de datos).
+        :return: True si las imágenes fueron correctamente eliminadas o 404 si el juego no existe.
         """
-        game = await self.game_repository.get_game_by_id(game_id)
-        if not game:
+        deleted_images = await self.game_repository.clear_showcase_images(game_id)
+        if deleted_images is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
-        deleted_images = await self.game_repository.clear_showcase_images(game_id)
         if deleted_images:
-            game.game_showcase_images.clear()
-            updated_game = await self.game_repository.update_game(game_id, game.dict())
-            return updated_game is not None
-        else:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail=f"There was an error when clearing the showcase images of "
-                                       f"game with ID: {game_id}.")
-    
+            await self.record_change(game_id)
+            await self.job_service.enqueue(DELETE_SHOWCASE_IMAGES_JOB, {"images": deleted_images})
+        return True
+
+    async def record_change(self, *game_ids: ObjectId, event: Optional[str] = None, game: Optional[Game] = None):
+        """
+        Función que vuelve a leer los juegos en el catálogo en memoria, olvida sus lecturas en curso en todos los
+        workers, sube su versión y, si se indica un evento, avisa a los clientes conectados al feed de eventos.
+        Los cambios que no se publican (las ventas y las imágenes de muestra) no llevan evento.
+        :param game_ids: IDs de los juegos cambiados.
+        :param event: Tipo del evento a publicar ("game_created" o "game_updated"), o None para no publicar ninguno.
+        :param game: El juego ya cambiado, con los datos del evento.
+        """
+        await self.catalogue_service.games_changed(*game_ids)
+        for game_id in game_ids:
+            await invalidation_bus.invalidate(game_flight, game_id)
+        await resource_versions.bump("games", *[f"game:{game_id}" for game_id in game_ids])
+        if event is not None:
+            event_bus.publish_local(event, "games", game_event_data(game.dict()))
+
+    def register_jobs(self):
+        """
+        Función para asignar a la cola de tareas las funciones que ejecutan las tareas de los juegos.
+        """
+        self.job_service.register(INGEST_SHOWCASE_IMAGES_JOB, self.ingest_showcase_images)
+        self.job_service.register(CREATE_SHOWCASE_THUMBNAILS_JOB, self.create_showcase_thumbnails)
+        self.job_service.register(DELETE_SHOWCASE_IMAGES_JOB, self.delete_showcase_images)
+
     async def upload_game_file(self, game_id: ObjectId, file: UploadFile) -> bool:
         """
         Función para subir el archivo del juego cuyo ID coincida con el pasado por parámetro.
@@ -192,22 +387,23 @@ class GameService:
         if not deleted_game:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when deleting game with ID: {game_id}.")
+        await self.record_change(game_id, event="game_updated", game=deleted_game)
         return await GameDto.from_game(deleted_game, self.review_repository)
 
     async def get_download(self, game_id: ObjectId) -> str:
         """
         Función que devuelve el archivo del juego para su posterior descarga.
+        Solo lee el nombre del archivo, para que la descarga empiece cuanto antes.
         :param game_id: ID del juego cuyo archivo queremos conseguir.
         :return: La ruta absoluta del archivo a descargar, 404 si el juego o el archivo no existen.
         """
-        game = await self.game_repository.get_game_by_id(game_id)
-        if not game:
+        file_name = await self.game_repository.get_game_file_by_id(game_id)
+        if file_name is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Game with ID: {game_id} not found.")
-        file = get_game_downloadable_by_name(game.file)
+        file = get_game_downloadable_by_name(file_name)
         if os.path.isfile(file):
-            game.sell_number += 1
-            await self.game_repository.update_game(game_id, game.dict())
+            # La venta no se cuenta aquí, sino al registrar la compra en el PurchaseService.
             return file
         else:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
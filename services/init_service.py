@@ -6,18 +6,56 @@ from model.game import Game, Language, Genre
 from repositories.game_repository import GameRepository
 import datetime
 from repositories.review_repository import ReviewRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
 from repositories.wishlist_repository import WishlistRepository
 from repositories.library_repository import LibraryRepository
+from repositories.job_repository import JobRepository
+from repositories.purchase_repository import PurchaseRepository
+from repositories.refresh_token_repository import RefreshTokenRepository
+from repositories.sales_counter_repository import SalesCounterRepository
 from repositories.user_repository import UserRepository
 import asyncio
+from db.database import db
 from services.cipher_service import encode
+from services.sales_service import SalesService
+from services.shared_state_service import shared_state
 from services.wishlist_service import WishlistService
+from services.container import container, Lazy
 
-user_repository = UserRepository()
-game_repository = GameRepository()
-library_repository = LibraryRepository()
-wishlist_repository = WishlistRepository()
-wishlist_service = WishlistService()
+user_repository = Lazy(UserRepository)
+game_repository = Lazy(GameRepository)
+library_repository = Lazy(LibraryRepository)
+wishlist_repository = Lazy(WishlistRepository)
+wishlist_service = Lazy(WishlistService)
+
+
+async def create_indexes():
+    """
+    Función encargada de crear los índices de la base de datos.
+    """
+    await asyncio.gather(container.get(UserRepository).ensure_indexes(),
+                         container.get(GameRepository).ensure_indexes(),
+                         container.get(PurchaseRepository).ensure_indexes(),
+                         container.get(SalesCounterRepository).ensure_indexes(),
+                         container.get(RefreshTokenRepository).ensure_indexes(),
+                         container.get(JobRepository).ensure_indexes(),
+                         shared_state.ensure_indexes())
+
+
+async def prepare_database():
+    """
+    Función encargada de borrar la base de datos y volver a generarla con los datos por defecto.
+    Solo la ejecuta el líder del despliegue.
+    """
+    await db.init_database()
+    await create_indexes()
+    await asyncio.gather(load_users(), load_games(), load_reviews())
+
+    # Estas últimas después de que se creen las demás porque requieren tanto de juegos como de users.
+    await asyncio.gather(load_review_summaries(), load_wishlists())
+
+    # Calculamos los rankings de más vendidos con los datos iniciales.
+    await container.get(SalesService).rollup()
 
 
 async def load_games():
@@ -217,10 +255,19 @@ async def load_reviews():
                            "plin plon. Plon. Plon plin, plin plin plin plin. Plin plin plon."),
     ]
 
-    review_repository = ReviewRepository()
+    review_repository = container.get(ReviewRepository)
     await asyncio.gather(*[review_repository.create_review(review) for review in initial_reviews])
 
 
+async def load_review_summaries():
+    """
+    Función encargada de generar los resúmenes de las reviews por defecto de cada juego.
+    """
+    games = await game_repository.get_games()
+    review_summary_repository = container.get(ReviewSummaryRepository)
+    await asyncio.gather(*[review_summary_repository.rebuild_summary(game.id) for game in games])
+
+
 async def load_wishlists():
     """
     Función encargada de cargar un número aleatorio de juegos (aleatorios) en la lista de deseados de cada usuario.
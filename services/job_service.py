@@ -0,0 +1,202 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List
+from bson import ObjectId
+from decouple import config
+from fastapi import HTTPException, status
+from dto.job_dto import JobDto
+from model.job import Job
+from repositories.job_repository import JobRepository
+from services.container import Singleton
+from services.metrics_service import metrics, LATENCY_BUCKETS
+
+logger = logging.getLogger("vgameshop.jobs")
+
+# Número de tareas que ejecuta a la vez cada worker del servidor.
+JOB_WORKERS = config("JOB_WORKERS", default=4, cast=int)
+# Cada cuántos segundos se buscan tareas nuevas cuando no hay ninguna. Las que se crean en el mismo proceso
+# se empiezan enseguida, sin esperar.
+JOB_POLL_SECONDS = config("JOB_POLL_SECONDS", default=1, cast=float)
+# Segundos que una tarea es del worker que la cogió. El worker la renueva tres veces en ese tiempo mientras la
+# ejecuta; si deja de hacerlo (por ejemplo, porque el proceso ha muerto), la puede volver a coger otro.
+JOB_LEASE_SECONDS = config("JOB_LEASE_SECONDS", default=60, cast=float)
+# Intentos de cada tarea y espera antes del primer reintento, que se dobla en cada fallo.
+JOB_MAX_ATTEMPTS = config("JOB_MAX_ATTEMPTS", default=5, cast=int)
+JOB_RETRY_BASE_SECONDS = config("JOB_RETRY_BASE_SECONDS", default=2, cast=float)
+# Horas que se guardan las tareas terminadas, para poder consultar su estado.
+JOB_RETENTION_HOURS = config("JOB_RETENTION_HOURS", default=24, cast=float)
+# Segundos que se espera al apagar a que terminen las tareas en curso.
+JOB_SHUTDOWN_SECONDS = config("JOB_SHUTDOWN_SECONDS", default=10, cast=float)
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+
+class JobService:
+    """
+    Cola de tareas en segundo plano. Las tareas se guardan en la base de datos, así que cualquier worker las puede
+    ejecutar y no se pierden si el proceso se reinicia. Cada worker del servidor tiene JOB_WORKERS tareas de asyncio
+    que las van cogiendo y ejecutando, y si una falla se reintenta más tarde, hasta JOB_MAX_ATTEMPTS veces.
+    Una tarea se puede llegar a ejecutar más de una vez, así que las funciones que las ejecutan deben poder repetirse.
+    """
+    job_repository = Singleton(JobRepository)
+
+    def __init__(self):
+        self.handlers: Dict[str, JobHandler] = {}
+        self.workers: List[asyncio.Task] = []
+        self.wake_up = asyncio.Event()
+        self.stopping = False
+
+    def register(self, job_type: str, handler: JobHandler):
+        """
+        Función para asignar la función que ejecuta un tipo de tarea.
+        :param job_type: Tipo de tarea.
+        :param handler: Función que recibe los datos de la tarea.
+        """
+        self.handlers[job_type] = handler
+
+    async def enqueue(self, job_type: str, payload: dict, max_attempts: int = JOB_MAX_ATTEMPTS) -> Job:
+        """
+        Función para crear una tarea nueva. No espera a que se ejecute.
+        :param job_type: Tipo de tarea.
+        :param payload: Datos de la tarea.
+        :param max_attempts: Número máximo de intentos.
+        :return: La tarea creada.
+        """
+        job = await self.job_repository.create_job(Job(id=ObjectId(), type=job_type, payload=payload,
+                                                       max_attempts=max_attempts))
+        metrics.inc("jobs_enqueued_total", "Background jobs created.", type=job_type)
+        self.wake_up.set()
+        return job
+
+    async def get_job_by_id(self, job_id: ObjectId) -> JobDto:
+        """
+        Función para obtener el estado de una tarea.
+        :param job_id: ID de la tarea.
+        :return: DTO de la tarea, o 404 si no existe (o hace más de JOB_RETENTION_HOURS horas que terminó).
+        """
+        job = await self.job_repository.get_job_by_id(job_id)
+        if not job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Job with ID: {job_id} not found.")
+        return JobDto.from_job(job)
+
+    async def run_job(self, job: Job):
+        """
+        Función que ejecuta una tarea ya cogida y guarda el resultado: terminada, pendiente de reintentar o fallida.
+        :param job: Tarea.
+        """
+        retention = datetime.timedelta(hours=JOB_RETENTION_HOURS)
+        start = time.perf_counter()
+        try:
+            handler = self.handlers.get(job.type)
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {job.type}")
+            finished = await self.run_handler(handler, job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts < job.max_attempts:
+                delay = JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+                await self.job_repository.retry_job(job.id, job.lock_id, error,
+                                                    datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+                result = "retried"
+            else:
+                await self.job_repository.fail_job(job.id, job.lock_id, error, retention)
+                result = "failed"
+            # Un fallo que se va a reintentar es un aviso; uno que ya no se reintenta, un error.
+            logger.log(logging.WARNING if result == "retried" else logging.ERROR,
+                       "Exception while running job %s (%s, attempt %s): %s", job.id, job.type, job.attempts, error)
+        else:
+            if finished:
+                await self.job_repository.complete_job(job.id, job.lock_id, retention)
+                result = "done"
+            else:
+                logger.warning("Lost the lease of job %s (%s, attempt %s), stopped running it.", job.id, job.type,
+                               job.attempts)
+                result = "lost"
+        metrics.inc("jobs_finished_total", "Background job attempts, by result.", type=job.type, result=result)
+        metrics.observe("job_duration_seconds", "Duration of the background job attempts.", LATENCY_BUCKETS,
+                        time.perf_counter() - start, type=job.type)
+
+    async def run_handler(self, handler: JobHandler, job: Job) -> bool:
+        """
+        Función que ejecuta la función de una tarea mientras renueva su reserva. Si otro worker vuelve a coger la
+        tarea (porque este no ha podido renovarla a tiempo), se deja de ejecutar, para no ejecutarla dos veces a la vez.
+        :param handler: Función que ejecuta la tarea.
+        :param job: Tarea.
+        :return: True si la función ha terminado, o False si se ha perdido la reserva y se ha cancelado.
+        """
+        handler_task = asyncio.create_task(handler(job.payload))
+        heartbeat = asyncio.create_task(self.renew_lease_periodically(job))
+        try:
+            await asyncio.wait([handler_task, heartbeat], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            if not handler_task.done():
+                handler_task.cancel()
+            await asyncio.gather(heartbeat, handler_task, return_exceptions=True)
+        if handler_task.cancelled():
+            return False
+        handler_task.result()
+        return True
+
+    async def renew_lease_periodically(self, job: Job):
+        """
+        Función que renueva la reserva de una tarea tres veces cada JOB_LEASE_SECONDS segundos, hasta que se cancele
+        o hasta que otro worker vuelva a coger la tarea. Si no consigue renovarla, lo sigue intentando.
+        :param job: Tarea.
+        """
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                if not await self.job_repository.extend_lease(job.id, job.lock_id, JOB_LEASE_SECONDS):
+                    return
+            except Exception as e:
+                logger.warning("Exception while renewing the lease of job %s: %s", job.id, e)
+
+    async def run_worker(self):
+        """
+        Función que coge y ejecuta tareas una detrás de otra hasta que se pare la cola. Cuando no hay tareas,
+        espera a que se cree una en este proceso o como mucho JOB_POLL_SECONDS segundos.
+        """
+        while not self.stopping:
+            try:
+                job = await self.job_repository.claim_job(JOB_LEASE_SECONDS)
+            except Exception:
+                logger.exception("Exception while claiming a job")
+                job = None
+            if job is not None:
+                try:
+                    await self.run_job(job)
+                except Exception:
+                    # No se pudo guardar el resultado; la tarea se volverá a coger cuando caduque su reserva.
+                    logger.exception("Exception while saving the result of job %s", job.id)
+                continue
+            self.wake_up.clear()
+            try:
+                await asyncio.wait_for(self.wake_up.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """
+        Función para empezar a ejecutar tareas en segundo plano.
+        """
+        self.stopping = False
+        while len(self.workers) < JOB_WORKERS:
+            self.workers.append(asyncio.create_task(self.run_worker()))
+
+    async def stop(self):
+        """
+        Función para dejar de ejecutar tareas. Espera JOB_SHUTDOWN_SECONDS segundos como mucho a que terminen las
+        que estén en curso; las que no terminen las volverá a coger otro worker cuando caduque su reserva.
+        """
+        self.stopping = True
+        self.wake_up.set()
+        if self.workers:
+            _, pending = await asyncio.wait(self.workers, timeout=JOB_SHUTDOWN_SECONDS)
+            for worker in pending:
+                worker.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
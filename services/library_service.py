@@ -1,18 +1,26 @@
+import asyncio
 from typing import List
 from bson import ObjectId
+from decouple import config
 from fastapi import HTTPException, status
-from dto.library_dto import LibraryDto
+from dto.library_dto import LibraryDto, LibraryGameFlagsDto
 from repositories.library_repository import LibraryRepository
+from repositories.wishlist_repository import WishlistRepository
 from services.game_service import GameService
 from services.user_service import UserService
 from services.wishlist_service import WishlistService
+from services.container import Singleton
+
+# Número máximo de juegos por los que se puede preguntar a la vez si están en la librería y la lista de deseados.
+GAME_FLAGS_MAX_IDS = config("GAME_FLAGS_MAX_IDS", default=100, cast=int)
 
 
 class LibraryService:
-    library_repository = LibraryRepository()
-    user_service = UserService()
-    game_service = GameService()
-    wishlist_service = WishlistService()
+    library_repository = Singleton(LibraryRepository)
+    wishlist_repository = Singleton(WishlistRepository)
+    user_service = Singleton(UserService)
+    game_service = Singleton(GameService)
+    wishlist_service = Singleton(WishlistService)
 
     async def get_all_libraries(self) -> List[LibraryDto]:
         """
@@ -57,14 +65,37 @@ class LibraryService:
     async def is_in_library(self, library_id: ObjectId, game_id: ObjectId) -> bool:
         """
         Función para determinar si el juego cuyo ID coincide con el pasado por parámetro está presente en la
-        librería del usuario cuyo ID coincide con el pasado por parámetro.
+        librería del usuario cuyo ID coincide con el pasado por parámetro, sin leer la librería entera.
         :param library_id: ID del usuario cuya librería queremos buscar.
         :param game_id: ID del juego que queremos buscar.
         :return: True si el juego está en la librería, False si no lo está, o 404 si no existe la librería.
         """
-        library = await self.library_repository.get_library_by_id(library_id)
-        if not library:
+        game_ids = await self.library_repository.find_game_ids(library_id, [game_id])
+        if game_ids is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Library with ID: {library_id} not found.")
+        return len(game_ids) > 0
 
-        return any(gameId == game_id for gameId in library.game_ids)
+    async def get_game_flags(self, user_id: ObjectId, game_ids: List[ObjectId]) -> List[LibraryGameFlagsDto]:
+        """
+        Función para saber, para cada juego de una lista (por ejemplo, una página de la tienda), si el usuario lo tiene
+        en su librería y si lo tiene en su lista de deseados. Hace una consulta a cada colección, a la vez.
+        :param user_id: ID del usuario.
+        :param game_ids: IDs de los juegos.
+        :return: Lista de DTOs con las marcas de cada juego, en el mismo orden, 400 si se pasan más de
+        GAME_FLAGS_MAX_IDS juegos o 404 si el usuario no tiene librería o lista de deseados.
+        """
+        if len(game_ids) > GAME_FLAGS_MAX_IDS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {GAME_FLAGS_MAX_IDS} game IDs can be checked at once.")
+        owned, wishlisted = await asyncio.gather(self.library_repository.find_game_ids(user_id, game_ids),
+                                                 self.wishlist_repository.find_game_ids(user_id, game_ids))
+        if owned is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Library with ID: {user_id} not found.")
+        if wishlisted is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Wishlist with ID: {user_id} not found.")
+        owned, wishlisted = set(owned), set(wishlisted)
+        return [LibraryGameFlagsDto(game_id=str(game_id), owned=game_id in owned, wishlisted=game_id in wishlisted)
+                for game_id in game_ids]
@@ -0,0 +1,201 @@
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+from decouple import config
+from pymongo import monitoring
+
+# Las consultas a Mongo que tarden más de estos milisegundos se escriben en el log de consultas lentas.
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=100, cast=float)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+slow_query_logger = logging.getLogger("vgameshop.slow_queries")
+
+
+class RequestStats:
+    """
+    Estadísticas de la petición en curso. Se guardan en un ContextVar, que Motor copia a los hilos donde ejecuta las
+    consultas, así que el listener de comandos de Mongo puede sumar cada consulta a la petición que la ha lanzado.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.round_trips = 0
+
+    def add_round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] += 1
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Función que da formato de Prometheus a una lista de etiquetas.
+    :param labels: Tupla de pares (nombre, valor).
+    :return: String con las etiquetas entre llaves, o un string vacío si no hay etiquetas.
+    """
+    if not labels:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+               for name, value in labels]
+    return "{" + ",".join(f"{name}=\"{value}\"" for name, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Registro en memoria de las métricas del proceso, que se exponen en formato de texto de Prometheus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[tuple, float]] = {}
+        self.gauges: Dict[str, Dict[tuple, float]] = {}
+        self.histograms: Dict[str, Dict[tuple, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, help_text: str, amount: float = 1, **labels):
+        with self.lock:
+            self.help.setdefault(name, help_text)
+            series = self.counters.setdefault(name, {})
+            key = tuple(sorted(labels.items()))
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, help_text: str, value: float, **labels):
+        with self.lock:
+            self.help.setdefault(name, help_text)
+            self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, help_text: str, buckets: Sequence[float], value: float, **labels):
+        with self.lock:
+            self.help.setdefault(name, help_text)
+            series = self.histograms.setdefault(name, {})
+            key = tuple(sorted(labels.items()))
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def render(self) -> str:
+        """
+        Función que exporta todas las métricas en el formato de texto de Prometheus.
+        :return: String con todas las métricas.
+        """
+        lines = []
+        with self.lock:
+            for name, series in self.counters.items():
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in self.gauges.items():
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in self.histograms.items():
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    for bucket, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bucket),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def filter_shape(value):
+    """
+    Función que devuelve la forma de un filtro de Mongo: los mismos campos y operadores, pero con los valores
+    sustituidos por su tipo, para poder agrupar las consultas lentas sin escribir datos de los usuarios en el log.
+    :param value: Filtro (o parte de un filtro).
+    :return: La forma del filtro.
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [filter_shape(item) for item in value[:3]]
+    return type(value).__name__
+
+
+def command_filter(command_name: str, command: dict):
+    """
+    Función que extrae el filtro de un comando de Mongo, dependiendo del tipo de comando.
+    :param command_name: Nombre del comando.
+    :param command: Documento del comando.
+    :return: El filtro del comando, o None si no tiene.
+    """
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query"))
+    if command_name == "findAndModify":
+        return command.get("query")
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        return pipeline[0].get("$match") if pipeline else None
+    return None
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Listener de los comandos que Motor envía a Mongo. Cuenta las consultas de cada petición, mide su duración y
+    escribe en el log las que superan SLOW_QUERY_MS milisegundos, junto con la forma de su filtro.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_commands: Dict[int, Tuple[str, str, object]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.add_round_trip()
+        collection = event.command.get(event.command_name)
+        with self.lock:
+            self.started_commands[event.request_id] = (
+                str(collection) if isinstance(collection, str) else "",
+                event.command_name,
+                command_filter(event.command_name, event.command)
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self.finished(event.request_id, event.command_name, event.duration_micros, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self.finished(event.request_id, event.command_name, event.duration_micros, "failure")
+
+    def finished(self, request_id: int, command_name: str, duration_micros: int, result: str):
+        with self.lock:
+            collection, _, command_filter_doc = self.started_commands.pop(request_id, ("", command_name, None))
+        duration = duration_micros / 1_000_000
+        metrics.observe("mongo_command_duration_seconds", "Duration of the commands sent to MongoDB.",
+                        LATENCY_BUCKETS, duration, command=command_name, collection=collection)
+        if duration * 1000 > SLOW_QUERY_MS:
+            metrics.inc("mongo_slow_commands_total", "Commands sent to MongoDB slower than SLOW_QUERY_MS.",
+                        command=command_name, collection=collection)
+            slow_query_logger.warning("Slow MongoDB %s on %s (%s): %.1f ms, filter shape: %s", command_name,
+                                      collection, result, duration * 1000, filter_shape(command_filter_doc))
+
+
+mongo_command_listener = MongoCommandListener()
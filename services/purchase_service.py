@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+from db.database import db, MONGO_TRANSACTIONS
+from dto.purchase_dto import PurchaseDto
+from model.purchase import Purchase
+from repositories.game_repository import GameRepository
+from repositories.library_repository import LibraryRepository
+from repositories.purchase_repository import PurchaseRepository
+from repositories.wishlist_repository import WishlistRepository
+from services.sales_service import SalesService
+from services.write_behind_service import WriteBehindQueue
+from services.container import Singleton, container
+
+logger = logging.getLogger("vgameshop.purchases")
+
+# Número máximo de compras de descargas que se registran a la vez al vaciar la cola.
+DOWNLOAD_CHECKOUT_CONCURRENCY = 16
+
+
+async def flush_downloads(downloads: List[Tuple[ObjectId, ObjectId]]) -> List[Tuple[ObjectId, ObjectId]]:
+    """
+    Función que registra las compras de las descargas acumuladas en la cola de escritura diferida de descargas.
+    Las descargas repetidas del mismo usuario y juego se registran una sola vez.
+    :param downloads: Lista de tuplas con el ID del usuario y el ID del juego de cada descarga.
+    :return: Descargas cuya compra ha fallado por un error que se puede reintentar.
+    """
+    purchase_service = container.get(PurchaseService)
+    semaphore = asyncio.Semaphore(DOWNLOAD_CHECKOUT_CONCURRENCY)
+
+    async def checkout(user_id: ObjectId, game_id: ObjectId):
+        async with semaphore:
+            await purchase_service.checkout(user_id, game_id)
+
+    unique_downloads = list(set(downloads))
+    results = await asyncio.gather(*[checkout(user_id, game_id) for user_id, game_id in unique_downloads],
+                                   return_exceptions=True)
+    retry = []
+    for download, result in zip(unique_downloads, results):
+        if not isinstance(result, Exception):
+            continue
+        logger.warning("Exception while registering the purchase of download %s: %s", download, result)
+        # Un 404 (juego o librería inexistentes) no se arregla reintentando; el resto (por ejemplo, que Mongo no
+        # responda) sí, y como la compra es idempotente, reintentarla no la duplica.
+        if not isinstance(result, HTTPException) or result.status_code != status.HTTP_404_NOT_FOUND:
+            retry.append(download)
+    return retry
+
+
+download_queue = WriteBehindQueue("downloads", flush_downloads)
+
+
+def check_same_game(registered: Purchase, purchase: Purchase):
+    """
+    Función que comprueba que la compra ya registrada con la misma clave de idempotencia es la que se está haciendo.
+    Si el cliente ha repetido la clave para otro juego, no se hace nada más.
+    :param registered: Compra registrada.
+    :param purchase: Compra que se está haciendo.
+    :return: 409 si la compra registrada es de otro juego.
+    """
+    if registered.game_id != purchase.game_id:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Idempotency key {purchase.idempotency_key} was already used for another game.")
+
+
+class PurchaseService:
+    purchase_repository = Singleton(PurchaseRepository)
+    game_repository = Singleton(GameRepository)
+    library_repository = Singleton(LibraryRepository)
+    wishlist_repository = Singleton(WishlistRepository)
+    sales_service = Singleton(SalesService)
+
+    async def get_purchases_from_user(self, user_id: ObjectId) -> List[PurchaseDto]:
+        """
+        Función para obtener todas las compras realizadas por un usuario, ordenadas por fecha de compra.
+        :param user_id: ID del usuario cuyas compras queremos buscar.
+        :return: Lista de DTOs de las compras del usuario.
+        """
+        purchases = await self.purchase_repository.get_purchases_from_user(user_id)
+        return [PurchaseDto.from_purchase(purchase)
+                for purchase in sorted(purchases, key=lambda p: p.purchase_date)]
+
+    def record_download(self, user_id: ObjectId, game_id: ObjectId):
+        """
+        Función para registrar la compra asociada a una descarga sin hacer esperar a la descarga.
+        La compra se registra en segundo plano en el siguiente vaciado de la cola de descargas.
+        :param user_id: ID del usuario que descarga el juego.
+        :param game_id: ID del juego descargado.
+        """
+        download_queue.put((user_id, game_id))
+
+    async def checkout(self, user_id: ObjectId, game_id: ObjectId,
+                       idempotency_key: Optional[str] = None) -> PurchaseDto:
+        """
+        Función para comprar un juego: registra la compra en el libro de compras, añade el juego a la librería del
+        usuario, lo quita de su lista de deseados y suma una venta al juego.
+        Es idempotente: repetir la misma compra (misma clave, o mismo usuario y juego) devuelve la compra original
+        sin volver a contar la venta.
+        :param user_id: ID del usuario que compra el juego.
+        :param game_id: ID del juego que se compra.
+        :param idempotency_key: Clave de idempotencia enviada por el cliente. Si no hay, se usa el usuario y el juego.
+        :return: DTO de la compra, 404 si el juego no existe o no está disponible, o si el usuario no tiene librería,
+        o 409 si el usuario ya usó la misma clave para comprar otro juego.
+        """
+        game, has_library = await asyncio.gather(self.game_repository.get_game_by_id(game_id),
+                                                 self.library_repository.library_exists(user_id))
+        if not game or not game.visible:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Game with ID: {game_id} not found.")
+        # Se comprueba antes de escribir nada, para no dejar en el libro una compra que no llega a la librería.
+        if not has_library:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Library with ID: {user_id} not found.")
+
+        purchase = Purchase(
+            id=ObjectId(),
+            user_id=user_id,
+            game_id=game_id,
+            price=game.price,
+            idempotency_key=idempotency_key or f"{user_id}:{game_id}",
+            # Dentro de una transacción la venta se suma junto con la compra; fuera, la suma la consolidación.
+            counted=MONGO_TRANSACTIONS
+        )
+
+        if MONGO_TRANSACTIONS:
+            try:
+                async with await db.client.start_session() as session:
+                    async with session.start_transaction():
+                        return await self._register_purchase(purchase, session)
+            except DuplicateKeyError:
+                # Otra petición con la misma compra se ha confirmado antes que esta: devolvemos esa.
+                existing = await self.purchase_repository.get_purchase(user_id, purchase.idempotency_key, game_id)
+                check_same_game(existing, purchase)
+                return PurchaseDto.from_purchase(existing)
+
+        return await self._register_purchase(purchase)
+
+    async def _register_purchase(self, purchase: Purchase, session=None) -> PurchaseDto:
+        """
+        Función que escribe la compra y sus efectos. El libro de compras es lo primero que se escribe, y es lo que
+        garantiza que la venta solo se cuente una vez: fuera de una transacción, la venta no se suma aquí, sino que la
+        suma la consolidación a partir de las compras que no están contadas, así que no se pierde aunque el proceso
+        muera justo después de insertar la compra.
+        :param purchase: Compra a registrar.
+        :param session: Sesión de Mongo, si la compra se hace dentro de una transacción.
+        :return: DTO de la compra registrada (o de la ya existente), 404 si el usuario no tiene librería, o 409 si la
+        compra ya existente con la misma clave es de otro juego.
+        """
+        registered, _ = await self.purchase_repository.create_purchase(purchase, session=session)
+        check_same_game(registered, purchase)
+
+        if session is not None:
+            # Las operaciones de una misma sesión no se pueden lanzar a la vez, así que van una detrás de otra.
+            in_library = await self.library_repository.add_game(purchase.user_id, purchase.game_id, session=session)
+            await self.wishlist_repository.remove_game(purchase.user_id, purchase.game_id, session=session)
+            await self.sales_service.record_sale(purchase.game_id, session=session)
+        else:
+            # Añadir a la librería y quitar de la wishlist son idempotentes, así que se repiten aunque la compra ya
+            # existiera (por si un intento anterior se quedó a medias).
+            in_library, _ = await asyncio.gather(
+                self.library_repository.add_game(purchase.user_id, purchase.game_id),
+                self.wishlist_repository.remove_game(purchase.user_id, purchase.game_id))
+
+        if not in_library:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Library with ID: {purchase.user_id} not found.")
+        return PurchaseDto.from_purchase(registered)
@@ -0,0 +1,190 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from decouple import config
+from fastapi import HTTPException, Request, status
+from dto.rate_limit_dto import RateLimitCounterDto
+from services.metrics_service import metrics
+from services.shared_state_service import shared_state, SHARED_STATE_BACKEND
+
+# Dónde se guardan los buckets: "memory" (en cada proceso) o "shared" (en el estado compartido entre workers).
+# Si el estado compartido está en Mongo (con varios workers), por defecto también los buckets, para que el límite
+# no se multiplique por el número de workers.
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="shared" if SHARED_STATE_BACKEND == "mongo" else "memory")
+# Número máximo de claves (IPs y usernames) de las que se guarda el bucket y los contadores en memoria.
+RATE_LIMIT_MAX_KEYS = config("RATE_LIMIT_MAX_KEYS", default=100_000, cast=int)
+
+# Tamaño de cada bucket (peticiones seguidas permitidas) y peticiones por segundo con las que se rellena.
+LOGIN_IP_BUCKET_SIZE = config("LOGIN_IP_BUCKET_SIZE", default=20, cast=int)
+LOGIN_IP_REFILL_PER_SECOND = config("LOGIN_IP_REFILL_PER_SECOND", default=1, cast=float)
+LOGIN_USERNAME_BUCKET_SIZE = config("LOGIN_USERNAME_BUCKET_SIZE", default=5, cast=int)
+LOGIN_USERNAME_REFILL_PER_SECOND = config("LOGIN_USERNAME_REFILL_PER_SECOND", default=0.1, cast=float)
+REGISTER_IP_BUCKET_SIZE = config("REGISTER_IP_BUCKET_SIZE", default=5, cast=int)
+REGISTER_IP_REFILL_PER_SECOND = config("REGISTER_IP_REFILL_PER_SECOND", default=0.05, cast=float)
+REGISTER_USERNAME_BUCKET_SIZE = config("REGISTER_USERNAME_BUCKET_SIZE", default=5, cast=int)
+REGISTER_USERNAME_REFILL_PER_SECOND = config("REGISTER_USERNAME_REFILL_PER_SECOND", default=0.1, cast=float)
+
+
+class RateLimit:
+    def __init__(self, name: str, capacity: int, refill_per_second: float):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+
+
+LOGIN_IP_LIMIT = RateLimit("login_ip", LOGIN_IP_BUCKET_SIZE, LOGIN_IP_REFILL_PER_SECOND)
+LOGIN_USERNAME_LIMIT = RateLimit("login_username", LOGIN_USERNAME_BUCKET_SIZE, LOGIN_USERNAME_REFILL_PER_SECOND)
+REGISTER_IP_LIMIT = RateLimit("register_ip", REGISTER_IP_BUCKET_SIZE, REGISTER_IP_REFILL_PER_SECOND)
+REGISTER_USERNAME_LIMIT = RateLimit("register_username", REGISTER_USERNAME_BUCKET_SIZE,
+                                    REGISTER_USERNAME_REFILL_PER_SECOND)
+
+
+class MemoryRateLimitBackend:
+    """
+    Buckets guardados en la memoria del proceso. Como no hay ningún await entre leer y actualizar un bucket,
+    las peticiones concurrentes del mismo proceso no se pueden pisar.
+    Un bucket lleno es igual que uno que no existe, así que cuando hay demasiadas claves se olvidan las más antiguas.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # Clave -> (tokens disponibles, instante de la última recarga)
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_second)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / limit.refill_per_second
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+class SharedRateLimitBackend:
+    """
+    Buckets guardados en el estado compartido, para que el límite sea el mismo con cualquier número de workers.
+    El estado compartido solo permite incrementos atómicos, así que el bucket se aproxima con una ventana fija
+    del tiempo que tarda en rellenarse entero: en cada ventana se permiten tantas peticiones como su tamaño.
+    """
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        window = limit.capacity / limit.refill_per_second
+        now = time.time()
+        window_index = int(now // window)
+        used = await shared_state.incr(f"ratelimit:{key}:{window_index}", ttl=window * 2)
+        if used <= limit.capacity:
+            return 0.0
+        return (window_index + 1) * window - now
+
+
+def create_rate_limit_backend():
+    """
+    Función que crea el almacén de buckets según RATE_LIMIT_BACKEND.
+    :return: El almacén en memoria o el compartido.
+    """
+    if RATE_LIMIT_BACKEND == "shared":
+        return SharedRateLimitBackend()
+    if RATE_LIMIT_BACKEND != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+    return MemoryRateLimitBackend(RATE_LIMIT_MAX_KEYS)
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones por token bucket. Además de los buckets, lleva la cuenta de las peticiones permitidas
+    y rechazadas de cada clave, para poder ver quién está siendo limitado.
+    """
+
+    def __init__(self):
+        self.backend = create_rate_limit_backend()
+        # (Nombre del límite, clave) -> [permitidas, rechazadas]
+        self.counters: "OrderedDict[tuple, List[int]]" = OrderedDict()
+
+    async def check(self, limit: RateLimit, key: str):
+        """
+        Función que gasta un token del bucket de la clave indicada.
+        :param limit: Límite a aplicar.
+        :param key: Clave del bucket (una IP o un username).
+        :return: None si quedaban tokens, o 429 con la cabecera Retry-After si no.
+        """
+        retry_after = await self.backend.take(f"{limit.name}:{key}", limit)
+        allowed = retry_after <= 0
+        self.count(limit.name, key, allowed)
+        metrics.inc("rate_limit_requests_total", "Requests checked by the rate limiter.",
+                    limit=limit.name, result="allowed" if allowed else "rejected")
+        if not allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many requests, try again later.",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+    def count(self, limit_name: str, key: str, allowed: bool):
+        counter = self.counters.pop((limit_name, key), None) or [0, 0]
+        counter[0 if allowed else 1] += 1
+        self.counters[(limit_name, key)] = counter
+        if len(self.counters) > RATE_LIMIT_MAX_KEYS:
+            self.counters.popitem(last=False)
+
+    def get_counters(self, limit_name: Optional[str], size: int) -> List[RateLimitCounterDto]:
+        """
+        Función para obtener los contadores de las claves con más peticiones rechazadas.
+        :param limit_name: Nombre del límite por el que filtrar, o None para todos.
+        :param size: Número máximo de claves a devolver.
+        :return: Lista de DTOs con los contadores, de más a menos peticiones rechazadas.
+        """
+        counters = [(name, key, allowed, rejected) for (name, key), (allowed, rejected) in self.counters.items()
+                    if limit_name is None or name == limit_name]
+        counters.sort(key=lambda counter: (counter[3], counter[2]), reverse=True)
+        return [RateLimitCounterDto(limit=name, key=key, allowed=allowed, rejected=rejected)
+                for name, key, allowed, rejected in counters[:size]]
+
+
+rate_limiter = RateLimiter()
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+async def body_username(request: Request) -> Optional[str]:
+    """
+    Función que lee el username del cuerpo de la petición, sin validarlo. Starlette guarda el cuerpo ya leído,
+    así que el endpoint lo puede volver a leer después.
+    :param request: Petición.
+    :return: El username, o None si el cuerpo no tiene un username.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    username = body.get("username") if isinstance(body, dict) else None
+    return username if isinstance(username, str) else None
+
+
+async def limit_login(request: Request):
+    """
+    Dependencia de /login. Limita los intentos por IP y por username antes de comprobar la contraseña,
+    que es lo más caro del login (BCrypt es lento a propósito).
+    :param request: Petición.
+    """
+    await rate_limiter.check(LOGIN_IP_LIMIT, client_ip(request))
+    username = await body_username(request)
+    if username is not None:
+        await rate_limiter.check(LOGIN_USERNAME_LIMIT, username)
+
+
+async def limit_register(request: Request):
+    """
+    Dependencia de /register. Limita los registros por IP y por username antes de cifrar la contraseña.
+    :param request: Petición.
+    """
+    await rate_limiter.check(REGISTER_IP_LIMIT, client_ip(request))
+    username = await body_username(request)
+    if username is not None:
+        await rate_limiter.check(REGISTER_USERNAME_LIMIT, username)
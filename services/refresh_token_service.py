@@ -0,0 +1,95 @@
+import datetime
+import hashlib
+import secrets
+import time
+import uuid
+from bson import ObjectId
+from decouple import config
+from fastapi import HTTPException, status
+from typing import Optional
+from dto.user_dto import UserDto, UserDtoToken
+from model.refresh_token import RefreshToken
+from model.user import User
+from repositories.refresh_token_repository import RefreshTokenRepository
+from repositories.user_repository import UserRepository
+from services import authentication_service
+from services.container import Singleton
+from services.revocation_service import revocation_list
+
+REFRESH_TOKEN_DAYS = config("REFRESH_TOKEN_DAYS", default=30, cast=int)
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    """
+    Función que calcula el hash con el que se guarda un refresh token. Los refresh tokens son aleatorios y largos,
+    así que basta con SHA-256 (no hace falta un hash lento como BCrypt).
+    :param refresh_token: Refresh token.
+    :return: Hash del token en hexadecimal.
+    """
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+
+class RefreshTokenService:
+    refresh_token_repository = Singleton(RefreshTokenRepository)
+    user_repository = Singleton(UserRepository)
+
+    async def create_tokens(self, user: User, family_id: Optional[str] = None) -> UserDtoToken:
+        """
+        Función que genera un token de acceso y un refresh token para el usuario.
+        :param user: Usuario.
+        :param family_id: Familia del refresh token, si sale de rotar otro. Si no, se crea una familia nueva.
+        :return: DTO con los datos del usuario, el token de acceso y el refresh token.
+        """
+        refresh_token = secrets.token_urlsafe(32)
+        await self.refresh_token_repository.create_refresh_token(RefreshToken(
+            id=ObjectId(),
+            token_hash=hash_refresh_token(refresh_token),
+            user_id=user.id,
+            family_id=family_id or uuid.uuid4().hex,
+            expires_at=datetime.datetime.utcnow() + datetime.timedelta(days=REFRESH_TOKEN_DAYS)
+        ))
+        return UserDtoToken(user=await UserDto.from_user(user), token=authentication_service.create_access_token(user),
+                            refresh_token=refresh_token)
+
+    async def refresh(self, refresh_token: str) -> UserDtoToken:
+        """
+        Función que cambia un refresh token por un token de acceso nuevo y otro refresh token (rotación).
+        Cada refresh token solo se puede usar una vez: si se reutiliza uno ya usado, probablemente lo haya robado
+        alguien, así que se revoca toda su familia.
+        :param refresh_token: Refresh token.
+        :return: DTO con los datos del usuario y los tokens nuevos, o 401 si el token no es válido.
+        """
+        token_hash = hash_refresh_token(refresh_token)
+        used_token = await self.refresh_token_repository.use_refresh_token(token_hash)
+        if used_token is None:
+            existing_token = await self.refresh_token_repository.get_refresh_token(token_hash)
+            if existing_token is not None and existing_token.used:
+                await self.refresh_token_repository.delete_family(existing_token.family_id)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token.")
+
+        user = await self.user_repository.get_user_by_id(used_token.user_id)
+        if user is None or not user.active:
+            await self.refresh_token_repository.delete_from_user(used_token.user_id)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token.")
+        return await self.create_tokens(user, used_token.family_id)
+
+    async def logout(self, refresh_token: str, access_token_payload: Optional[dict]):
+        """
+        Función que cierra la sesión: revoca la familia del refresh token y el token de acceso actual.
+        :param refresh_token: Refresh token de la sesión.
+        :param access_token_payload: Contenido del token de acceso, o None si no es válido.
+        """
+        existing_token = await self.refresh_token_repository.get_refresh_token(hash_refresh_token(refresh_token))
+        if existing_token is not None:
+            await self.refresh_token_repository.delete_family(existing_token.family_id)
+        if access_token_payload is not None and "jti" in access_token_payload:
+            await revocation_list.revoke_token(access_token_payload["jti"], access_token_payload["exp"] - time.time())
+
+    async def revoke_user(self, user_id: ObjectId):
+        """
+        Función que revoca todas las sesiones de un usuario: sus refresh tokens y sus tokens de acceso.
+        Los demás workers dejan de aceptar los tokens de acceso en REVOCATION_SYNC_SECONDS segundos como mucho.
+        :param user_id: ID del usuario.
+        """
+        await self.refresh_token_repository.delete_from_user(user_id)
+        await revocation_list.revoke_user(str(user_id), authentication_service.ACCESS_TOKEN_MINUTES * 60)
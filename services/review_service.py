@@ -1,27 +1,87 @@
+import asyncio
 from typing import List, Optional
 from bson import ObjectId
+from decouple import config
 from fastapi import HTTPException, status
-from dto.review_dto import ReviewDto, ReviewDtoCreate, ReviewDtoUpdate
+import datetime
+from db.invalidation_bus import invalidation_bus
+from dto.game_dto import GameDtoShort
+from dto.review_dto import ReviewDto, ReviewDtoCreate, ReviewDtoUpdate, ReviewDtoPage
+from dto.review_summary_dto import ReviewSummaryDto
+from dto.user_dto import UserDtoShort
+from model.review_summary import summary_rating
 from repositories.game_repository import GameRepository
 from repositories.review_repository import ReviewRepository
+from repositories.review_summary_repository import ReviewSummaryRepository
 from repositories.user_repository import UserRepository
 from services.authentication_service import check_role_and_myself
+from services.catalogue_service import CatalogueService
+from services.container import Singleton
+from services.event_service import event_bus
+from services.game_service import game_flight
+from services.single_flight_service import SingleFlight
+from services.version_service import resource_versions
+
+# Tamaño de página de las reviews si no se indica, y tamaño máximo que se puede pedir.
+REVIEWS_PAGE_SIZE = config("REVIEWS_PAGE_SIZE", default=20, cast=int)
+REVIEWS_MAX_PAGE_SIZE = config("REVIEWS_MAX_PAGE_SIZE", default=100, cast=int)
+
+# Lecturas de las reviews de un juego que se hacen a la vez, por ejemplo en un lanzamiento.
+game_reviews_flight = invalidation_bus.register(SingleFlight("game_reviews"))
 
 
 class ReviewService:
-    review_repository = ReviewRepository()
-    user_repository = UserRepository()
-    game_repository = GameRepository()
+    review_repository = Singleton(ReviewRepository)
+    user_repository = Singleton(UserRepository)
+    game_repository = Singleton(GameRepository)
+    review_summary_repository = Singleton(ReviewSummaryRepository)
+    catalogue_service = Singleton(CatalogueService)
+
+    async def get_all_reviews(self, own_user_id: Optional[ObjectId] = None, user_id: Optional[str] = None,
+                              game_id: Optional[str] = None, rating: Optional[float] = None,
+                              publish_date: Optional[str] = None, page: int = 0,
+                              size: int = REVIEWS_PAGE_SIZE) -> ReviewDtoPage:
+        """
+        Función para obtener todas las reviews existentes que cumplan con todos los filtros presentes,
+        ordenadas por fecha de publicación. Si se indica un usuario propio, su review será siempre la primera.
+        El filtrado, la ordenación, la paginación y la resolución de usuarios y juegos se hacen en la base de datos.
+        :param own_user_id: ID del usuario cuya review queremos que aparezca la primera.
+        :param user_id: ID del usuario por el que filtrar.
+        :param game_id: ID del juego por el que filtrar.
+        :param rating: Rating mínimo.
+        :param publish_date: Fecha de publicación mínima.
+        :param page: Número de página, empezando en 0.
+        :param size: Tamaño de la página, como mucho REVIEWS_MAX_PAGE_SIZE.
+        :return: DTO con el número total de reviews que cumplen los filtros y las reviews de la página pedida,
+        o 400 si algún filtro o parámetro de paginación no es válido.
+        """
+        match = {}
+        if user_id:
+            if not ObjectId.is_valid(user_id):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Invalid user ID: {user_id}")
+            match["user_id"] = ObjectId(user_id)
+
+        if game_id:
+            if not ObjectId.is_valid(game_id):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Invalid game ID: {game_id}")
+            match["game_id"] = ObjectId(game_id)
+
+        if rating is not None:
+            match["rating"] = {"$gte": rating}
+
+        if publish_date:
+            match["publish_date"] = {"$gte": datetime.datetime.fromisoformat(publish_date)}
+
+        if page < 0 or size < 1 or size > REVIEWS_MAX_PAGE_SIZE:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Invalid page: {page} or size: {size}")
+        skip = page * size
+
+        total, documents = await self.review_repository.get_reviews_page(match, own_user_id, skip, size)
+        return ReviewDtoPage(total=total, reviews=[ReviewDto.from_aggregate(document) for document in documents])
 
-    async def get_all_reviews(self) -> List[ReviewDto]:
-        """
-        Función para obtener todas las reviews existentes, ordenadas por fecha de publicación.
-        :return: Lista de ReviewDto ordenada por fecha de publicación.
-        """
-        reviews = await self.review_repository.get_reviews()
-        return [await ReviewDto.from_review(review, self.user_repository, self.game_repository, self.review_repository)
-                for review in sorted(reviews, key=lambda r: r.publish_date)]
-    
     async def get_all_reviews_from_user(self, user_id: ObjectId) -> List[ReviewDto]:
         """
         Función para obtener todas las reviews pertenecientes al usuario cuyo ID coincida
@@ -54,9 +114,38 @@ class ReviewService:
         :param game_id: ID del juego cuyas reviews queremos buscar.
         :return: Lista de ReviewDto ordenada por fecha de publicación.
         """
+        return await game_reviews_flight.do(game_id, lambda: self.read_all_reviews_from_game(game_id))
+
+    async def read_all_reviews_from_game(self, game_id: ObjectId) -> List[ReviewDto]:
+        """
+        Función que lee de Mongo las reviews del juego cuyo ID coincida con el pasado por parámetro, con sus usuarios.
+        Las peticiones iguales que llegan a la vez comparten una sola lectura. El juego y los usuarios se leen una
+        sola vez para todas las reviews, y el rating del juego sale de las mismas reviews.
+        :param game_id: ID del juego cuyas reviews queremos buscar.
+        :return: Lista de ReviewDto ordenada por fecha de publicación.
+        """
         reviews = await self.review_repository.get_reviews_from_game(game_id)
-        return [await ReviewDto.from_review(review, self.user_repository, self.game_repository, self.review_repository)
-                for review in sorted(reviews, key=lambda r: r.publish_date)]
+        if not reviews:
+            return []
+        game, users = await asyncio.gather(
+            self.game_repository.get_game_by_id(game_id),
+            self.user_repository.get_user_summaries_by_ids([review.user_id for review in reviews]))
+        game_dto = GameDtoShort.from_game_and_rating(game, summary_rating(len(reviews),
+                                                                          sum(review.rating for review in reviews)))
+        user_dtos = {user_id: await UserDtoShort.from_user(user) for user_id, user in users.items()}
+        return [ReviewDto.from_review_game_and_user(review, game_dto, user_dtos[review.user_id])
+                for review in sorted(reviews, key=lambda r: r.publish_date) if review.user_id in user_dtos]
+
+    async def get_review_summary_from_game(self, game_id: ObjectId) -> ReviewSummaryDto:
+        """
+        Función para obtener el resumen de las reviews del juego cuyo ID coincida con el pasado por parámetro:
+        número de reviews, rating medio, histograma de 0 a 5 estrellas y las reviews más recientes.
+        El resumen se mantiene actualizado al crear, modificar y borrar reviews, así que es una única lectura.
+        :param game_id: ID del juego cuyo resumen queremos obtener.
+        :return: DTO con el resumen de las reviews del juego.
+        """
+        summary = await self.review_summary_repository.get_summary_by_game_id(game_id)
+        return ReviewSummaryDto.from_summary(game_id, summary)
 
     async def get_review_by_id(self, review_id: ObjectId) -> ReviewDto:
         """
@@ -81,7 +170,11 @@ class ReviewService:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when creating review for user with ID: "
                                        f"{review_dto.user_id} and game with ID: {review_dto.game_id}.")
-        return await ReviewDto.from_review(review, self.user_repository, self.game_repository, self.review_repository)
+        created_review = await ReviewDto.from_review(review, self.user_repository, self.game_repository,
+                                                     self.review_repository)
+        await self.review_summary_repository.add_review(review, created_review.user.username)
+        await self.record_change(review.game_id)
+        return created_review
 
     async def update_review(self, review_id: ObjectId, review_dto: ReviewDtoUpdate) -> ReviewDto:
         """
@@ -99,6 +192,8 @@ class ReviewService:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when creating review for user with ID: "
                                        f"{review_dto.user_id} and game with ID: {review_dto.game_id}.")
+        await self.review_summary_repository.update_review(review, updated_review)
+        await self.record_change(review.game_id)
         return await ReviewDto.from_review(updated_review, self.user_repository,
                                            self.game_repository, self.review_repository)
 
@@ -110,12 +205,29 @@ class ReviewService:
         :return: True si la review fue borrada exitosamente, False si no se pudo borrar,
         404 si la review no existe, 401 si el token es inválido o 403 si no tiene uno de los roles permitidos.
         """
-        review = await self.get_review_by_id(review_id)
+        review = await self.review_repository.get_review_by_id(review_id)
         if not review:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Review with ID: {review_id} not found.")
 
         # ES NECESARIO LLEVARSE EL TOKEN A DENTRO DEL MÉTODO DEL SERVICIO PORQUE PARA CHEQUEAR SI ERES EL MISMO
         # USUARIO QUE EL QUE HIZO LA REVIEW PRIMERO TIENES QUE BUSCAR LA REVIEW POR ID.
-        check_role_and_myself(["ADMIN", "USER"], token, review.user.id)
-        return await self.review_repository.delete_review(review_id)
+        check_role_and_myself(["ADMIN", "USER"], token, str(review.user_id))
+        deleted = await self.review_repository.delete_review(review_id)
+        if deleted:
+            await self.review_summary_repository.remove_review(review)
+            await self.record_change(review.game_id)
+        return deleted
+
+    async def record_change(self, game_id: ObjectId):
+        """
+        Función que actualiza el rating del juego en el catálogo en memoria, sube la versión de todo lo que cambia al
+        modificar las reviews de un juego (sus reviews, y el juego y el catálogo, que muestran su rating) y avisa a
+        los clientes conectados al feed de eventos.
+        :param game_id: ID del juego.
+        """
+        await self.catalogue_service.games_changed(game_id)
+        await invalidation_bus.invalidate(game_reviews_flight, game_id)
+        await invalidation_bus.invalidate(game_flight, game_id)
+        await resource_versions.bump("games", f"game:{game_id}", f"reviews:game:{game_id}")
+        event_bus.publish_local("reviews_changed", "reviews", {"game_id": str(game_id)})
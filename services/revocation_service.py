@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Dict
+from decouple import config
+from services.metrics_service import metrics
+from services.shared_state_service import shared_state
+
+logger = logging.getLogger("vgameshop.revocations")
+
+# Cada cuántos segundos cada worker descarga la lista de revocación del estado compartido.
+REVOCATION_SYNC_SECONDS = config("REVOCATION_SYNC_SECONDS", default=2, cast=float)
+# Tamaño en bits del filtro de Bloom y número de hashes. Con los valores por defecto (128 KiB), hasta unas 100.000
+# revocaciones dan menos de un 1 % de falsos positivos, que solo cuestan una búsqueda en un diccionario.
+REVOCATION_BLOOM_BITS = config("REVOCATION_BLOOM_BITS", default=1 << 20, cast=int)
+REVOCATION_BLOOM_HASHES = config("REVOCATION_BLOOM_HASHES", default=7, cast=int)
+REVOKED_PREFIX = "revoked:"
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom: dice si un elemento no está en el conjunto sin ningún falso negativo, ocupando solo unos bits
+    por elemento. Los falsos positivos se descartan después con la lista exacta.
+    """
+
+    def __init__(self, size_bits: int, hash_count: int):
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        self.bits = bytearray((size_bits + 7) // 8)
+
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size_bits for i in range(self.hash_count)]
+
+    def add(self, item: str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class RevocationList:
+    """
+    Lista de tokens de acceso revocados. Se guarda en el estado compartido con una caducidad igual a la duración
+    de los tokens de acceso (después de eso ya no hace falta revocarlos), y cada worker tiene una copia en memoria
+    que actualiza cada REVOCATION_SYNC_SECONDS segundos. Así, comprobar un token no necesita ninguna consulta.
+    Se revocan usuarios enteros (todos los tokens emitidos antes de la revocación) o tokens concretos (por su jti).
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, int] = {}
+        self.bloom = BloomFilter(REVOCATION_BLOOM_BITS, REVOCATION_BLOOM_HASHES)
+
+    def load(self, entries: Dict[str, int]):
+        """
+        Función para sustituir la copia en memoria. El filtro de Bloom no permite borrar, así que se vuelve a crear
+        para que las revocaciones caducadas desaparezcan.
+        :param entries: Revocaciones, sin el prefijo.
+        """
+        bloom = BloomFilter(REVOCATION_BLOOM_BITS, REVOCATION_BLOOM_HASHES)
+        for key in entries:
+            bloom.add(key)
+        self.entries, self.bloom = entries, bloom
+        metrics.set("revoked_tokens", "Revocation entries held in memory by this worker.", len(entries))
+
+    def add(self, key: str, value: int):
+        self.entries[key] = value
+        self.bloom.add(key)
+
+    async def sync(self):
+        """
+        Función para descargar la lista de revocación del estado compartido.
+        """
+        self.load(await shared_state.items(REVOKED_PREFIX))
+
+    async def run_sync_periodically(self):
+        """
+        Función que sincroniza la lista cada REVOCATION_SYNC_SECONDS segundos, hasta que se cancele.
+        """
+        while True:
+            await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Exception while synchronising the revocation list")
+
+    async def revoke_user(self, user_id: str, ttl: float):
+        """
+        Función para revocar todos los tokens de acceso emitidos para un usuario antes del segundo actual. El iat de
+        los tokens va en segundos enteros, así que la revocación también: un token emitido justo después en el mismo
+        segundo (por ejemplo, al volver a iniciar sesión) no depende de en qué milisegundo se emitió.
+        :param user_id: ID del usuario.
+        :param ttl: Segundos que hay que recordar la revocación (la duración de los tokens de acceso).
+        """
+        key = f"user:{user_id}"
+        revoked_at = int(time.time())
+        self.add(key, revoked_at)
+        await shared_state.set(REVOKED_PREFIX + key, revoked_at, ttl=ttl)
+
+    async def revoke_token(self, jti: str, ttl: float):
+        """
+        Función para revocar un token de acceso concreto.
+        :param jti: ID del token.
+        :param ttl: Segundos que le quedan al token hasta caducar.
+        """
+        key = f"jti:{jti}"
+        revoked_at = int(time.time())
+        self.add(key, revoked_at)
+        await shared_state.set(REVOKED_PREFIX + key, revoked_at, ttl=max(ttl, 1))
+
+    def is_revoked(self, payload: dict) -> bool:
+        """
+        Función para saber si un token de acceso ya decodificado ha sido revocado. Solo mira la memoria.
+        :param payload: Contenido del token.
+        :return: True si el token o su usuario han sido revocados.
+        """
+        user_key = f"user:{payload['id']}"
+        if user_key in self.bloom:
+            revoked_at = self.entries.get(user_key)
+            if revoked_at is not None and payload.get("iat", 0) < revoked_at:
+                return True
+        jti_key = f"jti:{payload.get('jti')}"
+        return jti_key in self.bloom and jti_key in self.entries
+
+
+revocation_list = RevocationList()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import List, Optional
+from bson import ObjectId
+from decouple import config
+from db.database import db, MONGO_TRANSACTIONS
+from dto.game_dto import GameDtoTopSeller
+from model.game import transform_genres
+from repositories.game_repository import GameRepository
+from repositories.purchase_repository import PurchaseRepository
+from repositories.sales_counter_repository import SalesCounterRepository
+from repositories.sales_rollup_repository import SalesRollupRepository
+from repositories.top_seller_repository import TopSellerRepository, ALL_GENRES
+from services.container import Singleton
+from services.deployment_service import DeploymentService
+from services.game_service import GameService
+
+logger = logging.getLogger("vgameshop.sales")
+
+# Cada cuántos segundos se consolidan las ventas de los contadores en el número de ventas de cada juego.
+SALES_ROLLUP_INTERVAL = config("SALES_ROLLUP_INTERVAL", default=30, cast=float)
+# Número máximo de compras sin contar que se consolidan en cada tanda.
+SALES_ROLLUP_BATCH_SIZE = config("SALES_ROLLUP_BATCH_SIZE", default=10000, cast=int)
+# Número de juegos que se guardan en cada ranking de más vendidos.
+TOP_SELLERS_SIZE = config("TOP_SELLERS_SIZE", default=50, cast=int)
+
+
+class SalesService:
+    sales_counter_repository = Singleton(SalesCounterRepository)
+    top_seller_repository = Singleton(TopSellerRepository)
+    game_repository = Singleton(GameRepository)
+    purchase_repository = Singleton(PurchaseRepository)
+    sales_rollup_repository = Singleton(SalesRollupRepository)
+    game_service = Singleton(GameService)
+    deployment_service = Singleton(DeploymentService)
+
+    async def record_sale(self, game_id: ObjectId, session):
+        """
+        Función para registrar una venta de un juego dentro de la transacción de su compra. No modifica el juego,
+        sino uno de sus contadores, así que los juegos más vendidos no se convierten en un cuello de botella. Las
+        ventas se suman al juego en la siguiente consolidación.
+        Fuera de una transacción no se llama: la consolidación cuenta las compras que no están contadas.
+        :param game_id: ID del juego vendido.
+        :param session: Sesión de Mongo de la transacción de la compra.
+        """
+        await self.sales_counter_repository.increment(game_id, session=session)
+
+    async def rollup(self):
+        """
+        Función que consolida las ventas pendientes en el número de ventas de cada juego, y vuelve a calcular los
+        rankings de más vendidos. Las ventas pendientes son las de los contadores y las de las compras que no están
+        contadas, y se consolidan en tandas de como mucho SALES_ROLLUP_BATCH_SIZE compras.
+        """
+        batch = await self.sales_rollup_repository.get_unfinished_batch()
+        if batch is not None:
+            # La consolidación anterior se cortó a medias: se termina antes de empezar otra.
+            await self.apply_batch(batch)
+
+        while True:
+            counters, purchases = await asyncio.gather(
+                self.sales_counter_repository.get_pending_counters(),
+                self.purchase_repository.get_uncounted_purchases(SALES_ROLLUP_BATCH_SIZE))
+            if not counters and not purchases:
+                break
+            amounts = defaultdict(int)
+            for counter in counters:
+                amounts[counter["game_id"]] += counter["count"]
+            for purchase in purchases:
+                amounts[purchase["game_id"]] += 1
+            batch = await self.sales_rollup_repository.start_batch(amounts, counters,
+                                                                   [purchase["id"] for purchase in purchases])
+            await self.apply_batch(batch)
+            if len(purchases) < SALES_ROLLUP_BATCH_SIZE:
+                break
+        await self.top_seller_repository.rebuild(TOP_SELLERS_SIZE)
+
+    async def apply_batch(self, batch: dict):
+        """
+        Función que aplica una tanda de ventas ya guardada: suma las ventas a los juegos, las resta de los contadores
+        y marca las compras como contadas. Con transacciones se aplica entera o nada; sin ellas, cada juego y cada
+        contador guardan la última tanda que se les ha aplicado, así que repetir una tanda cortada a medias solo
+        aplica lo que faltaba.
+        :param batch: Documento de la tanda, con su número de generación.
+        """
+        generation = batch["generation"]
+        amounts = {entry["game_id"]: entry["amount"] for entry in batch["amounts"]}
+        if MONGO_TRANSACTIONS:
+            async with await db.client.start_session() as session:
+                async with session.start_transaction():
+                    # Las operaciones de una misma sesión no se pueden lanzar a la vez, así que van una detrás de otra.
+                    await self.game_repository.increment_sell_numbers(amounts, generation, session=session)
+                    await self.sales_counter_repository.discount(batch["counters"], generation, session=session)
+                    await self.purchase_repository.mark_counted(batch["purchase_ids"], session=session)
+                    await self.sales_rollup_repository.finish_batch(generation, session=session)
+        else:
+            await asyncio.gather(self.game_repository.increment_sell_numbers(amounts, generation),
+                                 self.sales_counter_repository.discount(batch["counters"], generation),
+                                 self.purchase_repository.mark_counted(batch["purchase_ids"]))
+            await self.sales_rollup_repository.finish_batch(generation)
+
+        if amounts:
+            # El número de ventas no se publica en el feed de eventos, así que no lleva evento.
+            await self.game_service.record_change(*amounts)
+
+    async def run_rollup_periodically(self):
+        """
+        Función que consolida las ventas cada SALES_ROLLUP_INTERVAL segundos, hasta que se cancele.
+        Se ejecuta en todos los workers, pero solo consolida el que es el líder en ese momento.
+        Los errores de una consolidación no detienen las siguientes.
+        """
+        while True:
+            await asyncio.sleep(SALES_ROLLUP_INTERVAL)
+            if not self.deployment_service.is_leader:
+                continue
+            try:
+                await self.rollup()
+            except Exception:
+                logger.exception("Exception while rolling up sales")
+
+    async def get_top_sellers(self, genre: Optional[str], size: int) -> List[GameDtoTopSeller]:
+        """
+        Función para obtener los juegos más vendidos, en general o de un género.
+        Los rankings están precalculados, así que es una única lectura del tamaño de la página.
+        :param genre: Género por el que filtrar, o None para el ranking general.
+        :param size: Número de juegos a devolver (como mucho TOP_SELLERS_SIZE).
+        :return: Lista de DTOs de los juegos más vendidos, o 400 si el género no existe.
+        """
+        ranking_id = ALL_GENRES if not genre else transform_genres([genre])[0].value
+        entries = await self.top_seller_repository.get_top_sellers(ranking_id, min(max(size, 1), TOP_SELLERS_SIZE))
+        return [GameDtoTopSeller.from_ranking_entry(entry) for entry in entries]
@@ -0,0 +1,80 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+from decouple import config
+from repositories.shared_state_repository import SharedStateRepository
+
+# Dónde se guarda el estado que comparten los workers (contadores, listas de revocación, versiones, etc.).
+# "memory" solo sirve con un único proceso; con varios workers hay que usar "mongo".
+SHARED_STATE_BACKEND = config("SHARED_STATE_BACKEND", default="memory")
+
+
+class MemorySharedState:
+    """
+    Estado compartido en la memoria del proceso. Es el que se usa con un único worker.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiration(ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else time.monotonic() + ttl
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get(self, key: str) -> Any:
+        entry = self._get_entry(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.values[key] = (value, self._expiration(ttl))
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        if self._get_entry(key) is not None:
+            return False
+        self.values[key] = (value, self._expiration(ttl))
+        return True
+
+    async def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        entry = self._get_entry(key)
+        if entry is None:
+            entry = (0, self._expiration(ttl))
+        self.values[key] = (entry[0] + amount, entry[1])
+        return entry[0] + amount
+
+    async def delete(self, key: str):
+        self.values.pop(key, None)
+
+    async def items(self, prefix: str) -> Dict[str, Any]:
+        keys = [key for key in self.values if key.startswith(prefix)]
+        items = {}
+        for key in keys:
+            entry = self._get_entry(key)
+            if entry is not None:
+                items[key[len(prefix):]] = entry[0]
+        return items
+
+
+def create_shared_state():
+    """
+    Función que crea el estado compartido según SHARED_STATE_BACKEND.
+    :return: El estado compartido en memoria, o el repositorio del estado compartido en Mongo.
+    """
+    if SHARED_STATE_BACKEND == "mongo":
+        return SharedStateRepository()
+    if SHARED_STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown SHARED_STATE_BACKEND: {SHARED_STATE_BACKEND}")
+    return MemorySharedState()
+
+
+# Las dos implementaciones tienen las mismas funciones (get, set, add, incr, delete, items),
+# así que el resto de la aplicación no necesita saber cuál se está usando.
+shared_state = create_shared_state()
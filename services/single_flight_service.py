@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from services.metrics_service import metrics
+
+
+class SingleFlight:
+    """
+    Junta las llamadas iguales que se hacen a la vez: la primera hace la consulta, y las que llegan mientras tanto
+    esperan a la misma en vez de repetirla. El resultado se comparte, así que no se debe modificar.
+    Cancelar una de las llamadas no cancela la consulta de las demás; solo se cancela si se cancelan todas.
+    Tiene el mismo nombre, invalidate y clear que las cachés, para poder registrarse en el bus de invalidaciones.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        # Número de llamadas que esperan a cada consulta en curso.
+        self.waiters: Dict[asyncio.Task, int] = {}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Función para hacer una llamada, o esperar a la que ya esté en curso con la misma clave.
+        :param key: Clave de la llamada.
+        :param function: Función que hace la consulta, si no hay ninguna en curso.
+        :return: El resultado de la consulta (o su excepción).
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.create_task(function())
+            self.calls[key] = task
+            self.waiters[task] = 0
+            task.add_done_callback(lambda done: self.finish(key, done))
+            metrics.inc("single_flight_calls_total", "Calls to coalesced reads, by whether they ran the read.",
+                        flight=self.name, result="leader")
+        else:
+            metrics.inc("single_flight_calls_total", "Calls to coalesced reads, by whether they ran the read.",
+                        flight=self.name, result="shared")
+        metrics.set("single_flight_in_flight", "Coalesced reads in progress.", len(self.calls), flight=self.name)
+        self.waiters[task] += 1
+        try:
+            # shield hace que cancelar esta llamada no cancele la consulta que comparte con las demás.
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self.waiters[task] == 1:
+                # Era la última llamada que la esperaba: la consulta ya no hace falta.
+                if self.calls.get(key) is task:
+                    del self.calls[key]
+                task.cancel()
+            raise
+        finally:
+            if task in self.waiters:
+                self.waiters[task] -= 1
+
+    def finish(self, key: Hashable, task: asyncio.Task):
+        # Si la clave se ha invalidado durante la consulta, ya puede haber otra en curso con la misma clave.
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        self.waiters.pop(task, None)
+        # Si se han cancelado todas las llamadas, nadie lee la excepción, y asyncio avisaría de ello.
+        if not task.cancelled():
+            task.exception()
+        metrics.set("single_flight_in_flight", "Coalesced reads in progress.", len(self.calls), flight=self.name)
+
+    def invalidate(self, key: Hashable):
+        """
+        Función que se llama después de escribir: las llamadas que lleguen a partir de ahora hacen una consulta
+        nueva en vez de esperar a una que ha empezado antes de la escritura.
+        :param key: Clave de la llamada.
+        """
+        self.calls.pop(key, None)
+
+    def clear(self):
+        self.calls.clear()
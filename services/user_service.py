@@ -1,23 +1,34 @@
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
+from decouple import config
 from fastapi import UploadFile, HTTPException, status
-from dto.user_dto import UserDto, UserDtoCreate, UserDtoUpdate, UserDtoShort, UserDtoLogin, UserDtoToken
+from pymongo.errors import DuplicateKeyError
+from dto.user_dto import (UserDto, UserDtoCreate, UserDtoUpdate, UserDtoShort, UserDtoLogin, UserDtoToken,
+                          UserDtoBatchEntry)
 from repositories.library_repository import LibraryRepository
 from repositories.user_repository import UserRepository, get_pfp_by_name
 from repositories.wishlist_repository import WishlistRepository
-from services import authentication_service, cipher_service
+from services import cipher_service
+from services.container import Singleton
+from services.refresh_token_service import RefreshTokenService
+from services.version_service import resource_versions
+
+# Número máximo de usuarios que se pueden pedir a la vez.
+USERS_BATCH_MAX_IDS = config("USERS_BATCH_MAX_IDS", default=100, cast=int)
 
 
 class UserService:
-    user_repository = UserRepository()
-    library_repository = LibraryRepository()
-    wishlist_repository = WishlistRepository()
+    user_repository = Singleton(UserRepository)
+    library_repository = Singleton(LibraryRepository)
+    wishlist_repository = Singleton(WishlistRepository)
+    refresh_token_service = Singleton(RefreshTokenService)
 
     async def login(self, user: UserDtoLogin):
         """
-        Función que valida las credenciales del usuario y, si son correctas, le genera un token de sesión.
+        Función que valida las credenciales del usuario y, si son correctas, le genera un token de sesión
+        y un refresh token.
         :param user: DTO con las credenciales del usuario.
-        :return: DTO con los datos del usuario y su token, o 401 si las credenciales no son correctas o el
+        :return: DTO con los datos del usuario y sus tokens, o 401 si las credenciales no son correctas o el
         usuario no existe.
         """
         user_from_db = await self.user_repository.get_user_by_username(user.username)
@@ -26,8 +37,7 @@ class UserService:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail=f"Unauthorized.")
 
-        token = authentication_service.create_access_token(user_from_db)
-        return UserDtoToken(user=await UserDto.from_user(user_from_db), token=token)
+        return await self.refresh_token_service.create_tokens(user_from_db)
 
     async def get_all_users(self) -> List[UserDto]:
         """
@@ -45,6 +55,17 @@ class UserService:
         users = await self.user_repository.get_users_active(active)
         return [await UserDto.from_user(user) for user in users]
 
+    async def get_all_users_fields(self, fields: List[str], active: Optional[bool]) -> List[dict]:
+        """
+        Función para obtener solo los campos pedidos de todos los usuarios, o de los que tengan la actividad indicada.
+        La contraseña nunca se lee.
+        :param fields: Campos de UserDto que se quieren.
+        :param active: Actividad por la que filtrar, o None para todos.
+        :return: Lista de diccionarios con los campos pedidos de cada usuario.
+        """
+        documents = await self.user_repository.get_user_documents(fields, active)
+        return [UserDto.fields_from_document(document, fields) for document in documents]
+
     async def get_user_by_id(self, user_id: ObjectId) -> UserDto:
         """
         Función para obtener un usuario por su ID.
@@ -57,13 +78,41 @@ class UserService:
                                 detail=f"User with ID: {user_id} not found.")
         return await UserDto.from_user(user)
 
+    async def get_user_fields_by_id(self, user_id: ObjectId, fields: List[str]) -> dict:
+        """
+        Función para obtener solo los campos pedidos de un usuario por su ID.
+        :param user_id: ID del usuario que queremos buscar.
+        :param fields: Campos de UserDto que se quieren.
+        :return: Diccionario con los campos pedidos del usuario, o 404 si no existe.
+        """
+        document = await self.user_repository.get_user_document_by_id(user_id, fields)
+        if not document:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"User with ID: {user_id} not found.")
+        return UserDto.fields_from_document(document, fields)
+
+    async def get_users_by_ids(self, user_ids: List[str]) -> List[UserDtoBatchEntry]:
+        """
+        Función para obtener varios usuarios a la vez, con una sola consulta.
+        :param user_ids: IDs de los usuarios, tal y como los manda el cliente.
+        :return: Lista con una entrada por cada ID, en el mismo orden, con el usuario o con None si no existe
+        (o si el ID no es válido), o 400 si se piden más de USERS_BATCH_MAX_IDS usuarios.
+        """
+        if len(user_ids) > USERS_BATCH_MAX_IDS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {USERS_BATCH_MAX_IDS} users can be requested at once.")
+        valid_ids = list({ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)})
+        users = await self.user_repository.get_users_by_ids(valid_ids)
+        users_by_id = {str(user.id): await UserDto.from_user(user) for user in users}
+        return [UserDtoBatchEntry(id=user_id, user=users_by_id.get(user_id)) for user_id in user_ids]
+
     async def get_user_by_id_short(self, user_id: ObjectId) -> UserDtoShort:
         """
         Función para obtener información resumida de un usuario por su ID.
         :param user_id: ID del usuario que queremos buscar.
         :return: DTO corto del usuario encontrado, o 404 si no existe.
         """
-        user = await self.user_repository.get_user_by_id(user_id)
+        user = await self.user_repository.get_user_summary_by_id(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"User with ID: {user_id} not found.")
@@ -75,7 +124,7 @@ class UserService:
         :param user_id: ID del usuario cuya foto de perfil queremos buscar.
         :return: Ruta absoluta de la foto de perfil del usuario, o 404 si no existe.
         """
-        user = await self.user_repository.get_user_by_id(user_id)
+        user = await self.user_repository.get_user_summary_by_id(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"User with ID: {user_id} not found.")
@@ -86,22 +135,19 @@ class UserService:
         Función para registrar un nuevo usuario en base a la información aportada por parámetro.
         :param user_dto: DTO con toda la información necesaria para registrar un nuevo usuario.
         :return: DTO con la información del usuario registrado y su token,
-        o 400 si un usuario con el mismo email o nombre de usuario ya existe.
-        """
-        user_from_db = await self.user_repository.user_exists_by_username_or_email(user_dto.username, user_dto.email)
-        if user_from_db:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=f"User with username ${user_dto.username} or email ${user_dto.email} already "
+        o 409 si un usuario con el mismo email o nombre de usuario ya existe.
+        """
+        # No se comprueba antes si existe: lo impiden los índices únicos, también con registros simultáneos.
+        try:
+            user = await self.user_repository.create_user(user_dto.to_user())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail=f"User with username {user_dto.username} or email {user_dto.email} already "
                                        f"exists.")
-        user = await self.user_repository.create_user(user_dto.to_user())
-        if not user:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail=f"There was an error when creating user: {user_dto.name} {user_dto.surname}.")
         await self.library_repository.create_library(user.id)
         await self.wishlist_repository.create_wishlist(user.id)
 
-        token = authentication_service.create_access_token(user)
-        return UserDtoToken(user=await UserDto.from_user(user), token=token)
+        return await self.refresh_token_service.create_tokens(user)
 
     async def update_user(self, user_id: ObjectId, user_dto: UserDtoUpdate) -> UserDto:
         """
@@ -118,6 +164,8 @@ class UserService:
         if not updated_user:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when updating user: {user.name} {user.surname}.")
+        # Las reviews muestran los datos de su usuario.
+        await resource_versions.bump("users")
         return await UserDto.from_user(updated_user)
 
     async def upload_profile_picture(self, user_id: ObjectId, file: UploadFile) -> bool:
@@ -153,4 +201,7 @@ class UserService:
         if not deleted_user:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail=f"There was an error when deleting user: {user.name} {user.surname}.")
+        # Si se ha deshabilitado, se cierran todas sus sesiones.
+        if not deleted_user.active:
+            await self.refresh_token_service.revoke_user(user_id)
         return await UserDto.from_user(deleted_user)
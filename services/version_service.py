@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+from decouple import config
+from fastapi import Request, Response, status
+from services.deployment_service import DEPLOYMENT_ID
+from services.metrics_service import metrics
+from services.shared_state_service import shared_state
+
+logger = logging.getLogger("vgameshop.versions")
+
+# Cada cuántos segundos cada worker descarga las versiones del estado compartido. Los cambios hechos en otro worker
+# pueden tardar hasta este tiempo en cambiar los ETags de este; los del propio worker se ven enseguida.
+VERSION_SYNC_SECONDS = config("VERSION_SYNC_SECONDS", default=1, cast=float)
+VERSION_PREFIX = "version:"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Función que compara la cabecera If-None-Match de una petición con un ETag (comparación débil).
+    :param if_none_match: Valor de la cabecera, o None si no está.
+    :param etag: ETag actual del recurso.
+    :return: True si el cliente ya tiene esa versión.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+class ResourceVersions:
+    """
+    Número de versión de cada recurso (el catálogo, un juego, las reviews de un juego...), que los servicios suben
+    cada vez que lo modifican. Se guarda en el estado compartido, y cada worker tiene una copia en memoria que
+    actualiza cada VERSION_SYNC_SECONDS segundos, así que calcular el ETag de una respuesta no necesita consultas.
+    Las versiones solo suben, así que al juntar la copia en memoria con la descargada se queda con la mayor.
+    """
+
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+
+    def load(self, versions: Dict[str, float]):
+        """
+        Función para juntar la copia en memoria con las versiones descargadas del estado compartido.
+        :param versions: Versiones, sin el prefijo.
+        """
+        merged = dict(self.versions)
+        for resource, version in versions.items():
+            merged[resource] = max(merged.get(resource, 0), int(version))
+        self.versions = merged
+        metrics.set("resource_versions", "Resource versions held in memory by this worker.", len(merged))
+
+    async def sync(self):
+        """
+        Función para descargar las versiones del estado compartido.
+        """
+        self.load(await shared_state.items(VERSION_PREFIX))
+
+    async def run_sync_periodically(self):
+        """
+        Función que sincroniza las versiones cada VERSION_SYNC_SECONDS segundos, hasta que se cancele.
+        """
+        while True:
+            await asyncio.sleep(VERSION_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Exception while synchronising the resource versions")
+
+    async def bump(self, *resources: str):
+        """
+        Función para subir la versión de uno o varios recursos. Se llama después de escribir en la base de datos:
+        así, una respuesta leída antes del cambio nunca se queda con el ETag de la versión nueva.
+        :param resources: Nombres de los recursos.
+        """
+        values = await asyncio.gather(*[shared_state.incr(VERSION_PREFIX + resource) for resource in resources])
+        self.load(dict(zip(resources, values)))
+        for resource in resources:
+            metrics.inc("resource_version_bumps_total", "Resource version changes made by this worker.",
+                        resource=resource.split(":")[0])
+
+    def etag(self, *resources: str) -> str:
+        """
+        Función que calcula el ETag débil de una respuesta a partir de las versiones de los recursos que usa.
+        Lleva el ID del despliegue, porque al desplegar se vuelve a generar la base de datos.
+        :param resources: Nombres de los recursos.
+        :return: ETag.
+        """
+        versions = ".".join(str(self.versions.get(resource, 0)) for resource in resources)
+        return f'W/"{DEPLOYMENT_ID[:12]}-{versions}"'
+
+
+def not_modified(request: Request, response: Response, *resources: str) -> Optional[Response]:
+    """
+    Función para responder a las peticiones condicionales. Añade el ETag a la respuesta y, si el cliente ya tiene
+    esa versión, devuelve una respuesta 304 sin cuerpo, antes de hacer ninguna consulta.
+    :param request: Petición.
+    :param response: Respuesta del endpoint, para añadirle el ETag.
+    :param resources: Nombres de los recursos que usa la respuesta.
+    :return: La respuesta 304, o None si hay que generar la respuesta completa.
+    """
+    etag = resource_versions.etag(*resources)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.inc("conditional_requests_total", "Conditional GET requests, by result.", result="not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if request.headers.get("if-none-match"):
+        metrics.inc("conditional_requests_total", "Conditional GET requests, by result.", result="modified")
+    response.headers.update(headers)
+    return None
+
+
+resource_versions = ResourceVersions()
@@ -5,12 +5,13 @@ from dto.wishlist_dto import WishlistDto
 from repositories.wishlist_repository import WishlistRepository
 from services.game_service import GameService
 from services.user_service import UserService
+from services.container import Singleton
 
 
 class WishlistService:
-    wishlist_repository = WishlistRepository()
-    user_service = UserService()
-    game_service = GameService()
+    wishlist_repository = Singleton(WishlistRepository)
+    user_service = Singleton(UserService)
+    game_service = Singleton(GameService)
 
     async def get_all_wishlists(self) -> List[WishlistDto]:
         """
@@ -33,6 +34,20 @@ class WishlistService:
                                 detail=f"Wishlist with ID: {wishlist_id} not found.")
         return await WishlistDto.from_wishlist(wishlist, self.user_service, self.game_service)
 
+    async def is_in_wishlist(self, wishlist_id: ObjectId, game_id: ObjectId) -> bool:
+        """
+        Función para determinar si el juego cuyo ID coincide con el pasado por parámetro está presente en la
+        lista de deseados del usuario cuyo ID coincide con el pasado por parámetro, sin leer la lista entera.
+        :param wishlist_id: ID del usuario cuya lista de deseados queremos buscar.
+        :param game_id: ID del juego que queremos buscar.
+        :return: True si el juego está en la lista de deseados, False si no lo está, o 404 si no existe la lista.
+        """
+        game_ids = await self.wishlist_repository.find_game_ids(wishlist_id, [game_id])
+        if game_ids is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Wishlist with ID: {wishlist_id} not found.")
+        return len(game_ids) > 0
+
     async def add_to_wishlist(self, wishlist_id: ObjectId, game_id: ObjectId) -> WishlistDto:
         """
         Función para añadir el juego cuyo ID coincide con el pasado por parámetro a la lista de deseados del usuario
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+from decouple import config
+
+logger = logging.getLogger("vgameshop.write_behind")
+
+# Cada cuántos milisegundos se vacían las colas de escritura diferida.
+WRITE_BEHIND_INTERVAL_MS = config("WRITE_BEHIND_INTERVAL_MS", default=250, cast=int)
+
+
+class WriteBehindQueue:
+    """
+    Cola de escrituras diferidas. Las peticiones solo añaden elementos en memoria (sin esperar a la base de datos),
+    y cada WRITE_BEHIND_INTERVAL_MS milisegundos se escriben todos los pendientes de una vez.
+    La función de escritura devuelve los elementos que hay que reintentar (o None si se han escrito todos).
+    Al apagar el servidor se vacía por última vez, así que no se pierde nada en un apagado ordenado.
+    """
+
+    def __init__(self, name: str, flush_function: Callable[[List[Any]], Awaitable[Optional[List[Any]]]]):
+        self.name = name
+        self.flush_function = flush_function
+        self.pending: List[Any] = []
+        self.task = None
+        self.stopping: Optional[asyncio.Event] = None
+
+    def put(self, item: Any):
+        """
+        Función para añadir un elemento a la cola. No bloquea.
+        :param item: Elemento a escribir en el siguiente vaciado.
+        """
+        self.pending.append(item)
+
+    async def flush(self):
+        """
+        Función para escribir todos los elementos pendientes. Si la escritura falla o se cancela, se vuelven a
+        encolar para reintentarlo en el siguiente vaciado, igual que los que la función de escritura pide reintentar.
+        """
+        if not self.pending:
+            return
+        items, self.pending = self.pending, []
+        try:
+            retry = await self.flush_function(items)
+        except BaseException as e:
+            # También si se cancela a mitad de escritura: los elementos ya no están en la cola, y se perderían.
+            self.pending = items + self.pending
+            if not isinstance(e, Exception):
+                raise
+            logger.exception("Exception while flushing write-behind queue %s", self.name)
+            return
+        if retry:
+            self.pending = list(retry) + self.pending
+
+    async def run_periodically(self):
+        """
+        Función que vacía la cola cada WRITE_BEHIND_INTERVAL_MS milisegundos, hasta que se llame a stop.
+        No se cancela para pararla, así que nunca se corta un vaciado a medias.
+        """
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), WRITE_BEHIND_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        """
+        Función para empezar a vaciar la cola periódicamente en segundo plano.
+        """
+        if self.task is None:
+            self.stopping = asyncio.Event()
+            self.task = asyncio.create_task(self.run_periodically())
+
+    async def stop(self):
+        """
+        Función para dejar de vaciar la cola en segundo plano, esperando a que termine el vaciado en curso y
+        vaciándola una última vez.
+        """
+        if self.task is not None:
+            self.stopping.set()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()